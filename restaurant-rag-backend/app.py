@@ -1,22 +1,52 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import psycopg2
 import psycopg2.extras
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import torch
 import os
 import time
 from typing import List, Optional
+from datetime import datetime
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import traceback
+import asyncio
+import functools
+import threading
+from lexical import exact_name_ids
+from retrieval import RRF_K, create_retriever, fuse_rankings
+from pgvector_adapter import register_vector
+from executors import BoundedExecutor, ExecutorBusy
+from transformers import AutoTokenizer
+from inference import LLM_MODEL_PATH, InferenceService, model_version
+from prompt_builder import create_prompt_builder
+from model_client import LocalProxy, ModelClient
+from cache import create_cache, make_key
+from semantic_cache import create_semantic_cache
+import metrics
+from streaming import sse_event
 
 # 載入環境變數
 load_dotenv()
 
-app = FastAPI()
+# 模型、資料庫連接池與檢索索引都在應用程式啟動後才於背景載入，
+# 匯入本模組不會載入模型；載入完成前 /health/live 正常回應，/health/ready 與查詢端點回傳503
+@asynccontextmanager
+async def lifespan(app):
+    loading = asyncio.ensure_future(load_resources())
+    watching = asyncio.ensure_future(watch_catalog())
+    yield
+    loading.cancel()
+    watching.cancel()
+    if inference_service is not None:
+        inference_service.shutdown()
+    db_executor.shutdown()
+    if connection_pool:
+        connection_pool.closeall()
+
+app = FastAPI(lifespan=lifespan)
 
 # 配置CORS
 app.add_middleware(
@@ -27,54 +57,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 添加簡單緩存
-query_cache = {}
 
 # 初始化計時器
 start_time = time.time()
 print(f"[{time.time() - start_time:.2f}s] 啟動服務...")
+startup = metrics.phase_timer("startup")
 
-# 載入模型
-print(f"[{time.time() - start_time:.2f}s] 載入Sentence Transformer模型...")
-embedding_model = SentenceTransformer("models/sentence-transformer")
-print(f"[{time.time() - start_time:.2f}s] Sentence Transformer模型載入完成")
-
-# 載入Gemma 2b模型
-print(f"[{time.time() - start_time:.2f}s] 載入Gemma 2b模型...")
-tokenizer = AutoTokenizer.from_pretrained("models/gemma-2b")
-model = AutoModelForCausalLM.from_pretrained(
-    "models/gemma-2b",
-    device_map="cuda:0",
-    torch_dtype=torch.float16,
-    use_cache=True,  # 啟用KV緩存加速推理
-    low_cpu_mem_usage=True  # 降低CPU內存使用
-)
-print(f"[{time.time() - start_time:.2f}s] Gemma 2b模型載入完成")
+# 模型與回應快取
+# 單行程（預設）：在本行程載入模型
+# 多行程（python serve.py --workers N）：設定 MODEL_SERVER_ADDRESS，模型與共用快取由 model_server.py 持有，
+# 本行程只處理HTTP與資料庫查詢，經由本機socket呼叫模型伺服器
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS")
+if MODEL_SERVER_ADDRESS:
+    print(f"[{time.time() - start_time:.2f}s] 多行程模式，使用模型伺服器: {MODEL_SERVER_ADDRESS}")
+    model_client = ModelClient(MODEL_SERVER_ADDRESS, os.getenv("MODEL_SERVER_AUTHKEY", ""))
+    inference = model_client.proxy("inference", streams=["stream"])
+    query_cache = model_client.proxy("query_cache")
+    semantic_cache = model_client.proxy("semantic_cache") if os.getenv("SEMANTIC_CACHE", "1") == "1" else None
+    model_metrics = model_client.proxy("metrics")
+    inference_service = None
+else:
+    inference_service = InferenceService(start_time)
+    inference = LocalProxy(inference_service)
+    # 推薦結果快取：有上限的LRU + TTL，另有以查詢向量比對的語意快取
+    query_cache = LocalProxy(create_cache("query"))
+    semantic_cache = create_semantic_cache("semantic")
+    semantic_cache = LocalProxy(semantic_cache) if semantic_cache is not None else None
+    model_metrics = None
 
 # 創建資料庫連接池
 from psycopg2 import pool
 
 # 初始化連接池
 connection_pool = None
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+
+# 每個連接的向量索引搜尋參數（召回率與延遲的取捨，參考 benchmarks/bench_pg_index.py 的結果設定）
+def db_session_options():
+    options = []
+    if os.getenv("PG_HNSW_EF_SEARCH"):
+        options.append(f"-c hnsw.ef_search={int(os.getenv('PG_HNSW_EF_SEARCH'))}")
+    if os.getenv("PG_IVFFLAT_PROBES"):
+        options.append(f"-c ivfflat.probes={int(os.getenv('PG_IVFFLAT_PROBES'))}")
+    return " ".join(options)
 
 def init_connection_pool():
     global connection_pool
     try:
-        connection_pool = pool.SimpleConnectionPool(
-            1, 10,  # 最小和最大連接數
+        # 查詢在多個執行緒中執行，需要執行緒安全的連接池
+        connection_pool = pool.ThreadedConnectionPool(
+            1, DB_POOL_SIZE,  # 最小和最大連接數
             host=os.getenv("DB_HOST", "localhost"),
             database=os.getenv("DB_NAME", "restaurant_rag"),
             user=os.getenv("DB_USER", "postgres"),
-            password=os.getenv("DB_PASSWORD", "a00010002")
+            password=os.getenv("DB_PASSWORD", "a00010002"),
+            options=db_session_options()
         )
-        print(f"[{time.time() - start_time:.2f}s] 資料庫連接池初始化成功")
     except Exception as e:
         print(f"[{time.time() - start_time:.2f}s] 初始化連接池出錯: {e}")
         connection_pool = None
 
-# 初始化連接池
-init_connection_pool()
-
 # 獲取連接的新函數，使用連接池
 def get_db_connection():
     if connection_pool:
@@ -89,16 +131,259 @@ def get_db_connection():
                 host=os.getenv("DB_HOST", "localhost"),
                 database=os.getenv("DB_NAME", "restaurant_rag"),
                 user=os.getenv("DB_USER", "postgres"),
-                password=os.getenv("DB_PASSWORD", "a00010002")
+                password=os.getenv("DB_PASSWORD", "a00010002"),
+                options=db_session_options()
             )
             return conn
         except Exception as e:
             print(f"[{time.time() - start_time:.2f}s] 資料庫連接錯誤: {e}")
             return None
 
+# 歸還連接
+def release_db_connection(conn):
+    if connection_pool:
+        connection_pool.putconn(conn)
+    else:
+        conn.close()
+
+# 註冊pgvector類型轉換，查詢時可直接傳入numpy向量
+def init_vector_type():
+    conn = get_db_connection()
+    if conn is None:
+        return
+    try:
+        register_vector(conn)
+    except Exception as e:
+        print(f"[{time.time() - start_time:.2f}s] 註冊vector類型出錯: {e}")
+    finally:
+        release_db_connection(conn)
+
+# 資料庫查詢是阻塞呼叫，放到專用執行緒池中執行；佇列滿時回傳503
+# 組裝提示（tokenizer編碼查詢與未預先產生的餐廳片段）也在這裡執行，不佔用事件迴圈
+db_executor = BoundedExecutor(
+    "db", DB_POOL_SIZE, int(os.getenv("DB_QUEUE_SIZE", "64")))
+
+# 檢索引擎（由RETRIEVAL_BACKEND選擇pgvector或記憶體索引），啟動後載入
+retriever = None
+# 以LLM的tokenizer計算提示長度並限制在token預算內（見 prompt_builder.py），啟動後載入
+prompt_builder = None
+service_ready = False
+startup_error = None
+
+# 載入預先產生的餐廳提示片段；尚未產生時各餐廳於第一次用到時才編碼
+def load_prompt_snippets():
+    conn = get_db_connection()
+    if conn is None:
+        return
+    try:
+        count = prompt_builder.load_snippets(conn)
+        print(f"[{time.time() - start_time:.2f}s] 載入 {count} 間餐廳的提示片段")
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"[{time.time() - start_time:.2f}s] 未載入提示片段（可執行 python prompt_builder.py 產生）: {e}")
+    finally:
+        release_db_connection(conn)
+
+# 阻塞的載入步驟，在執行緒中執行；各階段耗時記錄在 startup 指標中
+def load_blocking_resources():
+    global retriever, prompt_builder
+    with startup.phase("db_pool"):
+        init_connection_pool()
+        init_vector_type()
+    with startup.phase("retriever"):
+        retriever = create_retriever(get_db_connection, release_db_connection)
+        retriever.refresh()  # 記錄目前restaurants表的簽章，之後用來偵測換表；pgvector後端同時載入詞彙索引
+    if inference_service is not None:
+        inference_service.load()
+        prompt_builder = create_prompt_builder(inference_service.tokenizer)
+    else:
+        # 多行程模式下模型在模型伺服器中，HTTP worker只載入tokenizer
+        with startup.phase("load_tokenizer"):
+            prompt_builder = create_prompt_builder(AutoTokenizer.from_pretrained(LLM_MODEL_PATH))
+    with startup.phase("load_prompt_snippets"):
+        load_prompt_snippets()
+
+async def load_resources():
+    global service_ready, startup_error
+    try:
+        with startup.phase("total"):
+            await asyncio.get_event_loop().run_in_executor(None, load_blocking_resources)
+        service_ready = True
+        print(f"[{time.time() - start_time:.2f}s] 服務就緒，檢索引擎: {retriever.name}")
+    except Exception as e:
+        startup_error = str(e)
+        print(f"[{time.time() - start_time:.2f}s] 服務啟動失敗: {e}")
+        traceback.print_exc()
+
+# 餐廳目錄換表（generate_embeddings.py --blue-green）或資料變更後，重新載入檢索索引與提示片段。
+# 記憶體索引在背景建好後才替換，期間查詢繼續使用舊的索引；版本改變使舊的快取不再命中
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "30"))
+catalog_lock = threading.Lock()
+
+def refresh_catalog_blocking(force=False):
+    with catalog_lock:
+        refresh_start = time.time()
+        refreshed = retriever.refresh(force)
+        if refreshed:
+            load_prompt_snippets()
+            print(f"[{time.time() - start_time:.2f}s] 餐廳目錄已更新({retriever.name})，"
+                  f"版本 {retriever.version}，耗時: {time.time() - refresh_start:.2f}s")
+        return refreshed
+
+async def refresh_catalog(force=False):
+    return await asyncio.get_event_loop().run_in_executor(None, refresh_catalog_blocking, force)
+
+# 每 CATALOG_REFRESH_SECONDS 秒檢查一次，0為不檢查（只能呼叫 POST /catalog/reload）
+async def watch_catalog():
+    if CATALOG_REFRESH_SECONDS <= 0:
+        return
+    while True:
+        await asyncio.sleep(CATALOG_REFRESH_SECONDS)
+        if not service_ready:
+            continue
+        try:
+            await refresh_catalog()
+        except Exception as e:
+            print(f"[{time.time() - start_time:.2f}s] 檢查餐廳目錄出錯: {e}")
+
+def ensure_ready():
+    if not service_ready:
+        raise HTTPException(status_code=503, detail="服務啟動中，請稍後再試")
+
+# 附近搜尋的半徑上限（公尺）：半徑越大，網格索引要掃描的範圍越多
+MAX_RADIUS_M = float(os.getenv("MAX_RADIUS_M", "50000"))
+
+# 混合檢索：向量與詞彙（見 lexical.py）兩路同時在db_executor中執行，以 reciprocal rank fusion 合併。
+# 兩路都啟用時各取 max(top_k, HYBRID_DEPTH) 家再合併；每路有各自的延遲預算（毫秒，0表示不限），
+# 超過預算的一路不參與合併（/metrics 的 search_*_leg_timeouts_total），兩路都超過時等待向量檢索完成。
+# 詞彙檢索出錯時只記錄並略過，向量檢索出錯時請求失敗
+HYBRID_DEPTH = int(os.getenv("HYBRID_DEPTH", "20"))
+HYBRID_RRF_K = float(os.getenv("HYBRID_RRF_K", str(RRF_K)))
+LEG_BUDGETS_MS = {
+    "vector": float(os.getenv("VECTOR_BUDGET_MS", "0")),
+    "lexical": float(os.getenv("LEXICAL_BUDGET_MS", "100")),
+}
+DEFAULT_LEXICAL_WEIGHT = float(os.getenv("LEXICAL_WEIGHT", "1.0"))
+leg_latency = {name: metrics.histogram(f"search_{name}_leg_ms", metrics.LATENCY_MS_BUCKETS) for name in LEG_BUDGETS_MS}
+leg_timeouts = {name: metrics.counter(f"search_{name}_leg_timeouts_total") for name in LEG_BUDGETS_MS}
+
+# open_at：只搜尋該時間營業中的餐廳（沒有時區時視為台灣時間）
+# lat/lon/radius_m：只搜尋距離該點radius_m公尺內的餐廳，三者須同時提供
+# 兩種過濾都在資料庫或記憶體索引中先過濾再排序
+# vector_weight/lexical_weight：混合檢索中兩路的權重，0表示不執行該路（不能兩者都是0）
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 5
+    open_at: Optional[datetime] = None
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
+    radius_m: Optional[float] = Field(None, gt=0, le=MAX_RADIUS_M)
+    vector_weight: float = Field(1.0, ge=0)
+    lexical_weight: float = Field(DEFAULT_LEXICAL_WEIGHT, ge=0)
+
+def near_filter(request: QueryRequest):
+    # (緯度, 經度, 半徑) 或 None
+    values = (request.lat, request.lon, request.radius_m)
+    if all(value is None for value in values):
+        return None
+    if any(value is None for value in values):
+        raise HTTPException(status_code=422, detail="lat、lon 與 radius_m 須同時提供")
+    return values
+
+def leg_weights(request: QueryRequest):
+    # 要執行的各路與權重；未載入詞彙索引時只有向量檢索
+    weights = {"vector": request.vector_weight}
+    if retriever.lexical_enabled:
+        weights["lexical"] = request.lexical_weight
+    weights = {name: weight for name, weight in weights.items() if weight > 0}
+    if not weights:
+        raise HTTPException(status_code=422, detail="vector_weight 與 lexical_weight 不能都是0")
+    return weights
+
+def leg_done(name, leg_start, leg):
+    # 記錄每一路實際的耗時（包含超過預算後才完成的）；讀取例外，逾時後沒有等待的一路出錯時不會出現未處理的警告
+    leg_latency[name].observe((time.time() - leg_start) * 1000)
+    if not leg.cancelled():
+        leg.exception()
+
+# 向量與詞彙檢索同時執行，各自在預算內完成的結果以RRF合併
+async def hybrid_search(request: QueryRequest, query_embedding, near, weights):
+    depth = max(request.top_k, HYBRID_DEPTH) if len(weights) > 1 else request.top_k
+    search_start = time.time()
+    legs = {}
+    for name in weights:
+        if name == "vector":
+            coroutine = db_executor.run(retriever.search, query_embedding, depth, request.open_at, near)
+        else:
+            coroutine = db_executor.run(retriever.lexical_search, request.query, query_embedding, depth,
+                                        request.open_at, near)
+        legs[name] = asyncio.ensure_future(coroutine)
+        legs[name].add_done_callback(functools.partial(leg_done, name, search_start))
+
+    rankings = {}
+    for name, leg in legs.items():
+        budget = LEG_BUDGETS_MS[name] / 1000
+        try:
+            if budget > 0:
+                # shield：逾時只是不等待，該路的查詢仍在執行緒中完成並歸還連線
+                rankings[name] = await asyncio.wait_for(
+                    asyncio.shield(leg), timeout=max(0.0, budget - (time.time() - search_start)))
+            else:
+                rankings[name] = await leg
+        except asyncio.TimeoutError:
+            leg_timeouts[name].inc()
+            print(f"[{time.time() - start_time:.2f}s] {name} 檢索超過預算 {LEG_BUDGETS_MS[name]:.0f}ms，不參與合併")
+        except Exception as e:
+            if name == "vector":
+                raise
+            print(f"[{time.time() - start_time:.2f}s] {name} 檢索出錯，不參與合併: {e}")
+    if not rankings:
+        # 每一路都超過預算時等待向量檢索（沒有向量檢索時等待詞彙檢索）
+        name = "vector" if "vector" in legs else next(iter(legs))
+        rankings[name] = await legs[name]
+    if len(weights) > 1:
+        print(f"[{time.time() - start_time:.2f}s] 合併 " + "、".join(
+            f"{name} {len(rows)} 筆" for name, rows in rankings.items()))
+    # 店名與查詢完全相同的餐廳排在最前面（見 fuse_rankings）
+    pinned = exact_name_ids(request.query, rankings.get("lexical", []))
+    return fuse_rankings(rankings, weights, request.top_k, HYBRID_RRF_K, pinned)
+
+# 模型、檢索索引與生成設定的版本，任一項改變都不會取到舊結果
+def cache_version():
+    return {
+        **model_version(),
+        "prompt": prompt_builder.config(),
+        "retriever": retriever.name,
+        "index": getattr(getattr(retriever, "index", None), "name", None),
+        "index_version": retriever.version,
+        "lexical": retriever.lexical_enabled,
+    }
+
+# 快取鍵包含所有請求參數與版本
+def recommendation_cache_key(request: QueryRequest):
+    params = dict(request)
+    params["query"] = request.query.strip().lower()
+    return make_key("recommend", params, cache_version())
+
+# 語意快取的範圍：查詢文字以外的請求參數與版本
+def semantic_cache_scope(request: QueryRequest):
+    params = dict(request)
+    params.pop("query")
+    return make_key("recommend", params, cache_version())
+
+# 語意快取命中時回傳先前的推薦，餐廳列表與目前的檢索結果相同
+async def lookup_semantic_cache(request: QueryRequest, query_embedding, results):
+    if semantic_cache is None:
+        return None
+    cached = await semantic_cache.lookup(query_embedding, semantic_cache_scope(request), [row['id'] for row in results])
+    if cached is not None:
+        print(f"[{time.time() - start_time:.2f}s] 語意快取命中，重用查詢「{cached['query']}」的推薦")
+    return cached
+
+async def add_semantic_cache(request: QueryRequest, query_embedding, results, result, model_time):
+    if semantic_cache is not None:
+        await semantic_cache.add(query_embedding, semantic_cache_scope(request), [row['id'] for row in results],
+                           result, model_time * 1000)
 
 class Restaurant(BaseModel):
     id: int
@@ -117,46 +402,22 @@ async def search_restaurants(request: QueryRequest):
     print(f"[{request_start_time - start_time:.2f}s] 收到搜索請求: {request.query}")
     
     try:
+        ensure_ready()
+        near = near_filter(request)
+        weights = leg_weights(request)
+        
         # 將查詢轉換為嵌入向量
         encode_start = time.time()
         print(f"[{encode_start - start_time:.2f}s] 開始生成查詢向量...")
-        query_embedding = embedding_model.encode(request.query)
+        query_embedding = await inference.encode(request.query)
         print(f"[{time.time() - start_time:.2f}s] 向量生成完成，耗時: {time.time() - encode_start:.2f}s")
         
-        # 在資料庫中搜尋相似餐廳
-        db_start = time.time()
-        print(f"[{db_start - start_time:.2f}s] 連接資料庫...")
-        conn = get_db_connection()
-        if conn is None:
-            raise HTTPException(status_code=500, detail="無法連接到資料庫，請檢查日誌獲取更多信息")
-            
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        
-        # 使用向量相似度搜尋
-        # 注意pgvector要求向量格式為 [1,2,3]
-        vector_str = f"[{','.join(str(x) for x in query_embedding.tolist())}]"
-        
+        # 搜尋相似餐廳
         query_start = time.time()
-        print(f"[{query_start - start_time:.2f}s] 執行向量搜索查詢...")
-        cur.execute("""
-            SELECT id, restaurant_name, restaurant_address, restaurant_tel, 
-                   restaurant_px, restaurant_py, service_time, description,
-                   1 - (embedding <=> %s::vector) as similarity
-            FROM restaurants
-            ORDER BY embedding <=> %s::vector
-            LIMIT %s
-        """, (vector_str, vector_str, request.top_k))
-        
-        results = cur.fetchall()
+        print(f"[{query_start - start_time:.2f}s] 執行搜索查詢({retriever.name}，{'、'.join(weights)})...")
+        results = await hybrid_search(request, query_embedding, near, weights)
         print(f"[{time.time() - start_time:.2f}s] 查詢完成，找到 {len(results)} 條結果，查詢耗時: {time.time() - query_start:.2f}s")
         
-        # 釋放資源
-        cur.close()
-        if connection_pool:
-            connection_pool.putconn(conn)
-        else:
-            conn.close()
-        
         # 轉換結果為API響應格式
         restaurants = [
             Restaurant(
@@ -175,186 +436,282 @@ async def search_restaurants(request: QueryRequest):
         
         print(f"[{time.time() - start_time:.2f}s] 搜索請求處理完成，總耗時: {time.time() - request_start_time:.2f}s")
         return restaurants
+    except HTTPException:
+        raise
+    except ExecutorBusy as e:
+        print(f"[{time.time() - start_time:.2f}s] 服務繁忙，拒絕搜索請求: {e}")
+        raise HTTPException(status_code=503, detail="服務繁忙，請稍後再試")
     except Exception as e:
         print(f"[{time.time() - start_time:.2f}s] 處理搜索請求時出錯: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"處理請求時出錯: {str(e)}")
 
+# 檢查資料、生成查詢向量並搜尋最相似的餐廳（/recommend 與 /recommend/stream 共用）
+async def retrieve_restaurants(request: QueryRequest):
+    near = near_filter(request)
+    weights = leg_weights(request)
+    # 檢查資料庫中是否有餐廳數據
+    count = await db_executor.run(retriever.count)
+    print(f"[{time.time() - start_time:.2f}s] 資料庫中有 {count} 家餐廳")
+    
+    if count == 0:
+        print(f"[{time.time() - start_time:.2f}s] 資料庫中沒有餐廳數據，請先導入數據")
+        raise HTTPException(status_code=404, detail="資料庫中沒有餐廳數據，請先導入數據")
+    
+    # 將查詢轉換為嵌入向量
+    encode_start = time.time()
+    print(f"[{encode_start - start_time:.2f}s] 開始生成查詢向量...")
+    query_embedding = await inference.encode(request.query)
+    print(f"[{time.time() - start_time:.2f}s] 向量生成完成，耗時: {time.time() - encode_start:.2f}s")
+    
+    # 搜尋最相似的餐廳
+    query_start = time.time()
+    print(f"[{query_start - start_time:.2f}s] 執行搜索查詢({retriever.name}，{'、'.join(weights)})，查找最相似的 {request.top_k} 家餐廳...")
+    results = await hybrid_search(request, query_embedding, near, weights)
+    print(f"[{time.time() - start_time:.2f}s] 查詢完成，找到 {len(results)} 條結果，查詢耗時: {time.time() - query_start:.2f}s")
+    
+    if not results:
+        print(f"[{time.time() - start_time:.2f}s] 未找到相關餐廳")
+        raise HTTPException(status_code=404, detail="No restaurants found")
+    
+    # 記錄結果詳情
+    print(f"[{time.time() - start_time:.2f}s] 搜索結果:")
+    for idx, row in enumerate(results):
+        print(f"  結果 {idx+1}: {row['restaurant_name']}, 相似度: {row['similarity']:.4f}")
+    return query_embedding, results
+
+# 準備提示給Gemma 2b
+# 指示文字放在固定的開頭（PROMPT_PREFIX），接著是餐廳列表，最後才是用戶查詢：
+# 相同檢索結果的請求共用到查詢之前的整段前綴，KV快取可以跨請求重複使用（見 prefix_cache.py）
+async def build_prompt(query, results):
+    print(f"[{time.time() - start_time:.2f}s] 準備模型推理提示...")
+    built = await db_executor.run(prompt_builder.build, query, results)
+    print(f"[{time.time() - start_time:.2f}s] 提示長度: {built.tokens} tokens（上限 {prompt_builder.max_tokens}），"
+          f"使用 {len(built.rows)} 間餐廳，捨棄 {built.dropped} 間")
+    return built
+
+def format_restaurants(results):
+    return [
+        {
+            "id": row['id'],
+            "restaurant_name": row['restaurant_name'],
+            "restaurant_address": row['restaurant_address'],
+            "restaurant_tel": row['restaurant_tel'],
+            "restaurant_px": row['restaurant_px'],
+            "restaurant_py": row['restaurant_py'],
+            "service_time": row['service_time'],
+            "description": row.get('description', ''),
+            "similarity": float(row['similarity'])
+        }
+        for row in results
+    ]
+
 @app.post("/recommend")
 async def recommend_restaurants(request: QueryRequest):
     request_start_time = time.time()
     print(f"[{request_start_time - start_time:.2f}s] 收到推薦請求: {request.query}")
+    ensure_ready()
     
     # 檢查緩存
-    cache_key = request.query.strip().lower()
-    if cache_key in query_cache:
+    cache_key = recommendation_cache_key(request)
+    cached = await query_cache.get(cache_key)
+    if cached is not None:
         print(f"[{time.time() - start_time:.2f}s] 使用緩存結果: {cache_key}")
-        return query_cache[cache_key]
+        return cached
     
     try:
-        # 首先獲取相似的餐廳
-        db_start = time.time()
-        print(f"[{db_start - start_time:.2f}s] 連接資料庫...")
-        conn = get_db_connection()
-        if conn is None:
-            raise HTTPException(status_code=500, detail="無法連接到資料庫，請檢查日誌獲取更多信息")
-        
-        # 檢查資料庫中是否有餐廳數據
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("SELECT COUNT(*) FROM restaurants")
-        count = cur.fetchone()[0]
-        print(f"[{time.time() - start_time:.2f}s] 資料庫中有 {count} 家餐廳")
-        
-        if count == 0:
-            print(f"[{time.time() - start_time:.2f}s] 資料庫中沒有餐廳數據，請先導入數據")
-            if connection_pool:
-                connection_pool.putconn(conn)
-            else:
-                conn.close()
-            raise HTTPException(status_code=404, detail="資料庫中沒有餐廳數據，請先導入數據")
-        
-        # 將查詢轉換為嵌入向量
-        encode_start = time.time()
-        print(f"[{encode_start - start_time:.2f}s] 開始生成查詢向量...")
-        query_embedding = embedding_model.encode(request.query)
-        print(f"[{time.time() - start_time:.2f}s] 向量生成完成，耗時: {time.time() - encode_start:.2f}s")
-        
-        # 創建正確格式的向量字符串
-        vector_str = f"[{','.join(str(x) for x in query_embedding.tolist())}]"
-        
-        # 搜尋最相似的餐廳
-        query_start = time.time()
-        print(f"[{query_start - start_time:.2f}s] 執行向量搜索查詢，查找最相似的 {request.top_k} 家餐廳...")
-        cur.execute("""
-            SELECT id, restaurant_name, restaurant_address, restaurant_tel, 
-                   restaurant_px, restaurant_py, service_time, description,
-                   1 - (embedding <=> %s::vector) as similarity
-            FROM restaurants
-            ORDER BY embedding <=> %s::vector
-            LIMIT %s
-        """, (vector_str, vector_str, request.top_k))
-        
-        results = cur.fetchall()
-        print(f"[{time.time() - start_time:.2f}s] 查詢完成，找到 {len(results)} 條結果，查詢耗時: {time.time() - query_start:.2f}s")
+        query_embedding, results = await retrieve_restaurants(request)
         
-        # 釋放資料庫連接
-        cur.close()
-        if connection_pool:
-            connection_pool.putconn(conn)
-        else:
-            conn.close()
-        
-        if not results:
-            print(f"[{time.time() - start_time:.2f}s] 未找到相關餐廳")
-            raise HTTPException(status_code=404, detail="No restaurants found")
-        
-        # 記錄結果詳情
-        print(f"[{time.time() - start_time:.2f}s] 搜索結果:")
-        for idx, row in enumerate(results):
-            print(f"  結果 {idx+1}: {row['restaurant_name']}, 相似度: {row['similarity']:.4f}")
-        
-        # 準備提示給Gemma 2b
-        prompt_start = time.time()
-        print(f"[{prompt_start - start_time:.2f}s] 準備模型推理提示...")
-        restaurant_info = ""
-        for idx, row in enumerate(results, 1):
-            restaurant_info += f"{idx}. {row['restaurant_name']}"
-            if row['restaurant_address']:
-                restaurant_info += f", 地址: {row['restaurant_address']}"
-            if row['restaurant_tel']:
-                restaurant_info += f", 電話: {row['restaurant_tel']}"
-            if row['service_time']:
-                restaurant_info += f", 營業時間: {row['service_time']}"
-            if row.get('description'):
-                restaurant_info += f"\n   描述: {row['description']}"
-            restaurant_info += "\n"
+        cached = await lookup_semantic_cache(request, query_embedding, results)
+        if cached is not None:
+            result = dict(cached, query=request.query, restaurants=format_restaurants(results),
+                          processing_time=time.time() - request_start_time)
+            await query_cache.set(cache_key, result)
+            return result
         
-        prompt = f"""以下是用戶的需求: "{request.query}"
-        
-根據用戶需求，以下是幾個可能符合的台灣餐廳:
-
-{restaurant_info}
-
-請根據用戶需求簡要分析哪些餐廳最適合，並提供1-2句推薦理由。僅使用繁體中文回答。"""
+        built = await build_prompt(request.query, results)
         
         # 生成Gemma 2b的回應
         model_start = time.time()
         print(f"[{model_start - start_time:.2f}s] 開始Gemma 2b模型推理...")
-        print(f"[{model_start - start_time:.2f}s] 提示長度: {len(prompt)} 字符")
-        
-        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
         
-        # 修正警告問題：添加do_sample=True參數
-        print(f"[{time.time() - start_time:.2f}s] 執行模型生成...")
-        outputs = model.generate(
-            **inputs, 
-            max_new_tokens=256,  # 減少生成的token數量
-            do_sample=True,  # 添加此參數消除警告
-            temperature=0.7,
-            top_p=0.9,
-        )
-        
-        print(f"[{time.time() - start_time:.2f}s] 模型生成完成，解碼輸出...")
-        response = tokenizer.decode(outputs[0], skip_special_tokens=True)
+        response = await inference.generate(built.prompt, built.input_ids)
         model_time = time.time() - model_start
         print(f"[{time.time() - start_time:.2f}s] 模型推理完成，耗時: {model_time:.2f}s")
         
         # 如果回應包含原始提示，則去除
-        if response.startswith(prompt):
-            response = response[len(prompt):]
-        
-        # 構建完整回應
-        restaurants = [
-            {
-                "id": row['id'],
-                "restaurant_name": row['restaurant_name'],
-                "restaurant_address": row['restaurant_address'],
-                "restaurant_tel": row['restaurant_tel'],
-                "restaurant_px": row['restaurant_px'],
-                "restaurant_py": row['restaurant_py'],
-                "service_time": row['service_time'],
-                "description": row.get('description', ''),
-                "similarity": float(row['similarity'])
-            }
-            for row in results
-        ]
+        if response.startswith(built.prompt):
+            response = response[len(built.prompt):]
         
         total_time = time.time() - request_start_time
         print(f"[{time.time() - start_time:.2f}s] 推薦請求處理完成，總耗時: {total_time:.2f}s")
         
+        # 構建完整回應
         result = {
             "query": request.query,
-            "restaurants": restaurants,
+            "restaurants": format_restaurants(results),
             "recommendation": response.strip(),
             "processing_time": total_time
         }
         
         # 緩存結果
-        query_cache[cache_key] = result
+        await query_cache.set(cache_key, result)
+        await add_semantic_cache(request, query_embedding, results, result, model_time)
         return result
+    except HTTPException:
+        raise
+    except ExecutorBusy as e:
+        print(f"[{time.time() - start_time:.2f}s] 服務繁忙，拒絕推薦請求: {e}")
+        raise HTTPException(status_code=503, detail="服務繁忙，請稍後再試")
     except Exception as e:
         print(f"[{time.time() - start_time:.2f}s] 處理推薦請求時出錯: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"處理請求時出錯: {str(e)}")
 
+# 串流版本的推薦：以Server-Sent Events先送出餐廳列表（restaurants事件），
+# 再逐段送出生成的文字（token事件），最後送出done事件（完整推薦與耗時）
+@app.post("/recommend/stream")
+async def recommend_restaurants_stream(request: QueryRequest):
+    request_start_time = time.time()
+    print(f"[{request_start_time - start_time:.2f}s] 收到串流推薦請求: {request.query}")
+    ensure_ready()
+    
+    cache_key = recommendation_cache_key(request)
+    cached = await query_cache.get(cache_key)
+    
+    try:
+        # 檢索在開始串流前完成，錯誤仍以一般的HTTP狀態碼回傳
+        if cached is None:
+            query_embedding, results = await retrieve_restaurants(request)
+            restaurants = format_restaurants(results)
+            cached = await lookup_semantic_cache(request, query_embedding, results)
+            if cached is None:
+                built = await build_prompt(request.query, results)
+        else:
+            print(f"[{time.time() - start_time:.2f}s] 使用緩存結果: {cache_key}")
+            restaurants = cached["restaurants"]
+    except HTTPException:
+        raise
+    except ExecutorBusy as e:
+        print(f"[{time.time() - start_time:.2f}s] 服務繁忙，拒絕推薦請求: {e}")
+        raise HTTPException(status_code=503, detail="服務繁忙，請稍後再試")
+    except Exception as e:
+        print(f"[{time.time() - start_time:.2f}s] 處理推薦請求時出錯: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"處理請求時出錯: {str(e)}")
+    
+    async def events():
+        yield sse_event("restaurants", {"query": request.query, "restaurants": restaurants})
+        
+        if cached is not None:
+            yield sse_event("token", {"text": cached["recommendation"]})
+            yield sse_event("done", {"recommendation": cached["recommendation"],
+                                     "processing_time": time.time() - request_start_time})
+            return
+        
+        try:
+            model_start = time.time()
+            print(f"[{model_start - start_time:.2f}s] 開始Gemma 2b模型串流推理，提示長度: {built.tokens} tokens")
+            pieces = []
+            async for text in inference.stream(built.prompt, request_start_time, built.input_ids):
+                pieces.append(text)
+                yield sse_event("token", {"text": text})
+            
+            response = "".join(pieces).strip()
+            total_time = time.time() - request_start_time
+            print(f"[{time.time() - start_time:.2f}s] 串流推薦請求處理完成，模型耗時: {time.time() - model_start:.2f}s，總耗時: {total_time:.2f}s")
+            
+            result = {
+                "query": request.query,
+                "restaurants": restaurants,
+                "recommendation": response,
+                "processing_time": total_time
+            }
+            await query_cache.set(cache_key, result)
+            await add_semantic_cache(request, query_embedding, results, result, time.time() - model_start)
+            yield sse_event("done", {"recommendation": response, "processing_time": total_time})
+        except ExecutorBusy as e:
+            print(f"[{time.time() - start_time:.2f}s] 服務繁忙，拒絕推薦請求: {e}")
+            yield sse_event("error", {"detail": "服務繁忙，請稍後再試"})
+        except Exception as e:
+            # 串流已開始，無法再改變HTTP狀態碼，改以error事件通知前端
+            print(f"[{time.time() - start_time:.2f}s] 串流推薦時出錯: {e}")
+            traceback.print_exc()
+            yield sse_event("error", {"detail": f"處理請求時出錯: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# 存活檢查：行程能回應即可，不代表模型已載入
+@app.get("/health/live")
+async def health_live():
+    return {"status": "ok", "uptime": time.time() - start_time, "pid": os.getpid()}
+
+# 就緒檢查：模型、資料庫與檢索索引都已載入並完成暖機後才回傳200
+@app.get("/health/ready")
+async def health_ready():
+    try:
+        model_status = await inference.status()
+    except Exception as e:
+        model_status = {"ready": False, "error": str(e)}
+    ready = service_ready and model_status["ready"]
+    body = {
+        "status": "ready" if ready else ("failed" if startup_error else "starting"),
+        "error": startup_error or model_status.get("error"),
+        "startup": startup.snapshot(),
+        "device": model_status.get("device"),
+        "model_server": model_status if MODEL_SERVER_ADDRESS else None
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
 # 添加健康檢查端點
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "uptime": time.time() - start_time}
+    inference_stats = await inference.stats()
+    return {
+        "status": "ok",
+        "uptime": time.time() - start_time,
+        "pid": os.getpid(),
+        "executors": {**inference_stats["executors"], db_executor.name: db_executor.stats()},
+        "generation_scheduler": inference_stats["generation_scheduler"]
+    }
+
+# 指標端點：批次大小、排隊時間等直方圖
+@app.get("/metrics")
+async def get_metrics():
+    if model_metrics is None:
+        return metrics.snapshot()
+    # 多行程模式：模型與快取的指標在模型伺服器上，資料庫相關的指標在本worker
+    return {**(await model_metrics.snapshot()), **metrics.snapshot()}
 
 # 添加緩存管理端點
 @app.get("/cache/stats")
 async def cache_stats():
     return {
-        "size": len(query_cache),
-        "keys": list(query_cache.keys())
+        **(await query_cache.stats()),
+        "semantic": await semantic_cache.stats() if semantic_cache else None,
+        # 生成提示的前綴KV快取（token命中率與記憶體用量）
+        "prompt_prefix": (await inference.stats())["prefix_cache"]
     }
 
 @app.post("/cache/clear")
 async def clear_cache():
-    query_cache.clear()
+    await query_cache.clear()
+    if semantic_cache is not None:
+        await semantic_cache.clear()
     return {"status": "cache cleared", "size": 0}
 
+# 換表後立即重新載入目錄，不必等下一次定期檢查；force 時即使沒有偵測到變更也重新載入
+@app.post("/catalog/reload")
+async def reload_catalog(force: bool = False):
+    ensure_ready()
+    refreshed = await refresh_catalog(force)
+    return {"reloaded": refreshed, "retriever": retriever.name, "version": retriever.version,
+            "count": await db_executor.run(retriever.count)}
+
 if __name__ == "__main__":
     print(f"[{time.time() - start_time:.2f}s] 服務初始化完成，即將啟動HTTP服務器...")
     import uvicorn
@@ -0,0 +1,186 @@
+# generate_embeddings.py 各種載入方式的每秒載入列數：逐列INSERT（原本的做法）、execute_values（不同page size）
+# 與 COPY 二進位格式，以合成的餐廳資料與隨機向量（不含編碼時間）載入到與 restaurants 相同欄位的測試表。
+# 在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_bulk_load                                   # 1萬、10萬、100萬列
+#   python -m benchmarks.bench_bulk_load --rows 10000 --methods copy,values --page-sizes 100,1000,5000
+# 逐列INSERT太慢，只在不超過 --max-row-rows 列時執行。
+# 計時前先檢查 COPY 二進位編碼（NUMERIC與向量為自行編碼）：以邊界值（0、負數、1E+2、0.00005、超過4位小數等）
+# 載入後讀回 restaurant_px、restaurant_py 與 embedding 等欄位，與輸入及 execute_values（文字協定）載入的結果比較，
+# 有任何不同時結束代碼為1。
+import argparse
+import os
+import sys
+import time
+from decimal import Decimal
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+from generate_embeddings import LOAD_COLUMNS, load_batches
+from pgvector_adapter import register_vector
+
+load_dotenv()
+
+BENCH_TABLE = "restaurants_load_bench"
+AREAS = ["台北市大安區", "台中市西區", "高雄市鼓山區", "台南市中西區", "新竹市東區"]
+# NUMERIC編碼的邊界值：以10000為基底的位數分組、weight（指數）、dscale（小數位數）與正負號
+EDGE_NUMERICS = [
+    0, 0.0, -0.0, Decimal("0.00"), 1, -1, 121.5, -121.5, Decimal("1E+2"), Decimal("-1E+2"), 1e-05, 0.00005,
+    Decimal("0.00005"), -0.00005, Decimal("0.0001"), Decimal("0.1000"), 121.12345678901234, -22.98765432109876,
+    25.033964, 9999, 10000, 10001, Decimal("99999999.99999999"), Decimal("12345678901234567890.0001"),
+    Decimal("1E-20"), Decimal("-1.00000000000000000001"), Decimal("100000000"), 120.0000001,
+]
+
+
+def connect():
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        database=os.getenv("DB_NAME", "restaurant_rag"),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD", "a00010002")
+    )
+
+
+def synthetic_batches(rows, dim, batch_size, seed):
+    # 與 encode_batches 相同的 (rows, embeddings)，逐批產生，不一次保留所有向量
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, batch_size):
+        count = min(batch_size, rows - start)
+        embeddings = rng.normal(size=(count, dim)).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        px = rng.uniform(120.0, 122.0, size=count).round(14)
+        py = rng.uniform(22.0, 25.3, size=count).round(14)
+        batch = [
+            (f"Restaurant_BENCH_{start + i:07d}", f"餐廳{start + i}",
+             f"{AREAS[(start + i) % len(AREAS)]}民生路{(start + i) % 300 + 1}號",
+             f"02-2{(start + i) % 10000000:07d}", float(px[i]), float(py[i]),
+             "上午營運時間: Tuesday, Wednesday, Thursday, Friday, Saturday, Sunday 11:00:00-14:00:00; 公休日: Monday",
+             "提供道地的台灣小吃，食材每日新鮮採購", f"{start + i:064x}", embeddings[i])
+            for i in range(count)
+        ]
+        yield batch, embeddings
+
+
+def prepare_table(cur, dim):
+    cur.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    cur.execute(f"""
+        CREATE TABLE {BENCH_TABLE} (
+            id SERIAL PRIMARY KEY,
+            restaurant_name TEXT NOT NULL,
+            restaurant_address TEXT,
+            restaurant_tel TEXT,
+            restaurant_px NUMERIC,
+            restaurant_py NUMERIC,
+            service_time TEXT,
+            description TEXT,
+            embedding vector({dim}),
+            restaurant_id TEXT UNIQUE,
+            content_hash TEXT
+        )
+    """)
+
+
+def check_round_trip(conn, dim, seed):
+    # 以 COPY 與 execute_values 各載入一次邊界值，比較讀回的值；回傳不同的欄位數
+    rng = np.random.default_rng(seed)
+    count = len(EDGE_NUMERICS)
+    embeddings = rng.normal(size=(count, dim)).astype(np.float32)
+    # 向量的邊界值：全0、-0.0、float32的最大值與最小的正規數
+    embeddings[0] = 0.0
+    embeddings[1, :4] = [-0.0, np.finfo(np.float32).max, -np.finfo(np.float32).max, np.finfo(np.float32).tiny]
+    rows = [
+        (f"Restaurant_CHECK_{i:03d}", f"邊界值{i}", "", None, px, EDGE_NUMERICS[-1 - i], "", "描述\t含\n特殊字元", f"{i:064x}",
+         embeddings[i])
+        for i, px in enumerate(EDGE_NUMERICS)
+    ]
+    loaded = {}
+    cur = conn.cursor()
+    for method in ("copy", "values"):
+        cur.execute(f"TRUNCATE {BENCH_TABLE}")
+        load_batches(cur, iter([(rows, embeddings)]), method, BENCH_TABLE)
+        cur.execute(f"SELECT {', '.join(LOAD_COLUMNS)}, restaurant_px::text, restaurant_py::text "
+                    f"FROM {BENCH_TABLE} ORDER BY restaurant_id")
+        loaded[method] = cur.fetchall()
+    conn.commit()
+    cur.close()
+
+    mismatched = 0
+    for row, copied, inserted in zip(rows, loaded["copy"], loaded["values"]):
+        for column, expected, actual, reference in zip(LOAD_COLUMNS, row, copied, inserted):
+            if column == "embedding":
+                same = np.array_equal(np.asarray(actual, dtype=np.float32), expected) and np.array_equal(actual, reference)
+            elif column in ("restaurant_px", "restaurant_py"):
+                same = actual == Decimal(str(expected)) == reference
+            else:
+                same = actual == expected == reference
+            if not same:
+                mismatched += 1
+                print(f"  {row[0]} {column}: 輸入={expected!r} COPY={actual!r} VALUES={reference!r}")
+        # 文字形式相同表示小數位數（dscale）也一致
+        if copied[-2:] != inserted[-2:]:
+            mismatched += 1
+            print(f"  {row[0]} 文字形式: COPY={copied[-2:]} VALUES={inserted[-2:]}")
+    print(f"COPY 二進位編碼檢查: {len(rows)} 列，不同的欄位={mismatched}")
+    return mismatched
+
+
+def run(conn, method, rows, dim, batch_size, page_size, seed):
+    cur = conn.cursor()
+    cur.execute(f"TRUNCATE {BENCH_TABLE}")
+    conn.commit()
+    start = time.perf_counter()
+    loaded = load_batches(cur, synthetic_batches(rows, dim, batch_size, seed), method, BENCH_TABLE, page_size)
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    cur.execute(f"SELECT COUNT(*) FROM {BENCH_TABLE}")
+    assert cur.fetchone()[0] == loaded == rows
+    cur.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="10000,100000,1000000")
+    parser.add_argument("--methods", default="row,values,copy")
+    parser.add_argument("--page-sizes", default="1000", help="values 的 page size，可用逗號分隔多個值")
+    parser.add_argument("--batch-size", type=int, default=1024, help="每批產生的列數（對應編碼的批次）")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--max-row-rows", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="結束後保留測試表")
+    args = parser.parse_args()
+
+    conn = connect()
+    register_vector(conn)
+    cur = conn.cursor()
+    prepare_table(cur, args.dim)
+    conn.commit()
+    cur.close()
+
+    runs = []
+    for method in args.methods.split(","):
+        page_sizes = [int(p) for p in args.page_sizes.split(",")] if method == "values" else [None]
+        runs.extend((method, page_size) for page_size in page_sizes)
+    try:
+        if check_round_trip(conn, args.dim, args.seed):
+            sys.exit(1)
+        for rows in [int(r) for r in args.rows.split(",")]:
+            for method, page_size in runs:
+                name = f"{method}/{page_size}" if page_size else method
+                if method == "row" and rows > args.max_row_rows:
+                    print(f"{rows:>8} 列 {name:<12} 略過（超過 --max-row-rows）")
+                    continue
+                elapsed = run(conn, method, rows, args.dim, args.batch_size, page_size or 1000, args.seed)
+                print(f"{rows:>8} 列 {name:<12} {elapsed:8.2f}s {rows / elapsed:10.0f} 列/秒")
+    finally:
+        if not args.keep:
+            cur = conn.cursor()
+            cur.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+            conn.commit()
+            cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# CPU推理模式的比較：同一組提示下，float32 / bfloat16 / int8動態量化 的每秒token數與峰值記憶體
+# 在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_cpu_inference
+#   python -m benchmarks.bench_cpu_inference --modes float32,int8 --threads 4,8 --new-tokens 64
+# 每個模式在獨立的子行程中載入模型，峰值RSS（ru_maxrss）不受其他模式影響；
+# 各模式以相同的環境變數（INFERENCE_DTYPE / INFERENCE_QUANTIZE / TORCH_NUM_THREADS）設定，與部署時一致。
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+MODES = {
+    "float32": {"INFERENCE_DTYPE": "float32", "INFERENCE_QUANTIZE": "none"},
+    "bfloat16": {"INFERENCE_DTYPE": "bfloat16", "INFERENCE_QUANTIZE": "none"},
+    "int8": {"INFERENCE_DTYPE": "float32", "INFERENCE_QUANTIZE": "int8"},
+}
+
+PROMPTS = [
+    "以下是用戶的需求: 台中市的日式料理\n" + "1. 餐廳, 地址: 台中市西區, 營業時間: 11:00-21:00\n" * 10,
+    "以下是用戶的需求: 適合家庭聚餐的火鍋店\n" + "1. 火鍋, 地址: 台北市大安區, 營業時間: 17:00-02:00\n" * 10,
+    "以下是用戶的需求: 高雄的素食餐廳\n" + "1. 素食, 地址: 高雄市苓雅區, 營業時間: 10:00-20:00\n" * 10,
+]
+
+
+def peak_rss_mb() -> float:
+    # Linux上ru_maxrss單位為KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(args):
+    import torch
+    from transformers import AutoTokenizer
+
+    from device import apply_threads, load_causal_lm, load_device_config
+
+    config = load_device_config()
+    apply_threads(config)
+    t0 = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = load_causal_lm(args.model, config)
+    load_seconds = time.perf_counter() - t0
+    load_rss = peak_rss_mb()
+
+    def generate(prompt, max_new_tokens):
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+        # 固定生成長度（不在EOS停止），各模式的token數一致
+        outputs = model.generate(**inputs, max_new_tokens=max_new_tokens, min_new_tokens=max_new_tokens,
+                                 do_sample=False)
+        return outputs.shape[1] - inputs["input_ids"].shape[1]
+
+    with torch.inference_mode():
+        generate(PROMPTS[0], 4)  # 預熱
+        tokens = 0
+        t0 = time.perf_counter()
+        for _ in range(args.rounds):
+            for prompt in PROMPTS:
+                tokens += generate(prompt, args.new_tokens)
+        elapsed = time.perf_counter() - t0
+
+    print(json.dumps({
+        **config.describe(),
+        "load_seconds": load_seconds,
+        "tokens": tokens,
+        "tokens_per_second": tokens / elapsed,
+        "load_rss_mb": load_rss,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def run(args, mode, threads):
+    env = dict(os.environ, INFERENCE_DEVICE="cpu", TORCH_NUM_THREADS=str(threads), **MODES[mode])
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_cpu_inference", "--child", "--model", args.model,
+         "--new-tokens", str(args.new_tokens), "--rounds", str(args.rounds)],
+        env=env, stdout=subprocess.PIPE, text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"{mode} 子行程失敗，結束代碼: {process.returncode}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="models/gemma-2b")
+    parser.add_argument("--modes", default="float32,bfloat16,int8")
+    parser.add_argument("--threads", default=str(os.cpu_count() or 1))
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    print(f"CPU核心數: {os.cpu_count()}，模型: {args.model}，每個提示生成 {args.new_tokens} tokens × {args.rounds} 輪")
+    baseline = None
+    for threads in [int(t) for t in args.threads.split(",")]:
+        for mode in args.modes.split(","):
+            result = run(args, mode, threads)
+            baseline = baseline or result["tokens_per_second"]
+            print(f"mode={mode:<9} threads={threads:<3} "
+                  f"tokens/s={result['tokens_per_second']:8.2f} ({result['tokens_per_second'] / baseline:4.2f}x) "
+                  f"載入={result['load_seconds']:6.1f}s 載入後RSS={result['load_rss_mb']:8.1f}MB "
+                  f"峰值RSS={result['peak_rss_mb']:8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
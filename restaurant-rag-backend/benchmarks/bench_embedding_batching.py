@@ -0,0 +1,62 @@
+# 查詢向量微批次的基準：在CPU上比較批次開啟與關閉時的QPS與延遲
+# 在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_embedding_batching --concurrency 1,8,32 --requests 400
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+import metrics
+from embedding_service import EmbeddingService
+from executors import BoundedExecutor
+
+QUERIES = ["台中市的日式料理", "台北市有停車場的家庭餐廳", "適合約會的義式餐廳", "老胡麵館", "高雄海鮮餐廳",
+           "宜蘭的早午餐", "深夜還有營業的火鍋", "素食友善的餐廳"]
+
+
+async def run(service, concurrency, requests):
+    latencies = []
+    counter = iter(range(requests))
+
+    async def client():
+        for i in counter:
+            t0 = time.perf_counter()
+            await service.encode(f"{QUERIES[i % len(QUERIES)]} {i}")
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="models/sentence-transformer")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    model = SentenceTransformer(args.model, device="cpu")
+    model.encode(QUERIES)  # 預熱
+
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        for label, max_batch_size in (("off", 1), ("on", args.max_batch_size)):
+            executor = BoundedExecutor("encode", args.workers, args.requests)
+            service = EmbeddingService(model.encode, executor, max_batch_size, args.max_wait_ms)
+            # 每次量測使用獨立的批次大小直方圖
+            service.batch_size = metrics.Histogram("embedding_batch_size", metrics.SIZE_BUCKETS)
+            latencies, elapsed = asyncio.run(run(service, concurrency, args.requests))
+            executor.shutdown()
+            batch = service.batch_size.snapshot()
+            print(f"concurrency={concurrency:<3} batching={label:<3} QPS={len(latencies) / elapsed:8.1f} "
+                  f"p50={np.percentile(latencies, 50) * 1000:7.1f}ms p99={np.percentile(latencies, 99) * 1000:7.1f}ms "
+                  f"平均批次={batch['mean']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
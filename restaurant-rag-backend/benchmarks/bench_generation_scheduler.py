@@ -0,0 +1,108 @@
+# 連續批次生成的基準：以小型的隨機初始化因果語言模型代替 models/gemma-2b，可在CPU上執行
+# 在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_generation_scheduler --requests 16 --concurrency 1,4,8
+#   python -m benchmarks.bench_generation_scheduler --model models/gemma-2b   # 使用真正的模型
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from transformers import AutoModelForCausalLM, Gemma2Config, Gemma2ForCausalLM
+
+import metrics
+from generation_scheduler import GenerationScheduler
+
+
+def load_model(path):
+    if path:
+        return AutoModelForCausalLM.from_pretrained(path, torch_dtype=torch.float32).eval()
+    torch.manual_seed(0)
+    config = Gemma2Config(
+        vocab_size=8000, hidden_size=256, intermediate_size=1024, num_hidden_layers=4,
+        num_attention_heads=4, num_key_value_heads=2, head_dim=64, max_position_embeddings=4096,
+    )
+    return Gemma2ForCausalLM(config).eval()
+
+
+def make_prompts(count, vocab_size, rng):
+    # 長度與 /recommend 的提示相近（數百個token），長短不一
+    return [rng.integers(10, vocab_size, size=int(rng.integers(150, 400))).tolist() for _ in range(count)]
+
+
+def run_sequential(model, prompts, max_new_tokens, concurrency):
+    # 原本的做法：每個請求各自呼叫 model.generate，同時間只能執行一個
+    def generate(prompt):
+        t0 = time.perf_counter()
+        input_ids = torch.tensor([prompt])
+        model.generate(input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=max_new_tokens,
+                       min_new_tokens=max_new_tokens, do_sample=True, temperature=0.7, top_p=0.9, pad_token_id=0)
+        return time.perf_counter() - t0
+
+    lock = threading.Lock()
+
+    def serialized(prompt):
+        enqueued = time.perf_counter()
+        with lock:
+            generate(prompt)
+        return time.perf_counter() - enqueued
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(serialized, prompts))
+    return latencies, time.perf_counter() - t0
+
+
+def run_scheduler(model, prompts, max_new_tokens, concurrency, max_batch_size):
+    scheduler = GenerationScheduler(model, eos_token_ids=[], max_batch_size=max_batch_size, max_queue=len(prompts))
+    # 每次量測使用獨立的批次佔用直方圖
+    scheduler.batch_occupancy = metrics.Histogram("generation_batch_occupancy", metrics.SIZE_BUCKETS)
+    scheduler.start()
+
+    def generate(prompt):
+        t0 = time.perf_counter()
+        scheduler.submit(prompt, max_new_tokens).result()
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(generate, prompts))
+    elapsed = time.perf_counter() - t0
+    occupancy = scheduler.batch_occupancy.snapshot()["mean"]
+    scheduler.stop()
+    return latencies, elapsed, occupancy
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--concurrency", default="1,4,8")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=0, help="torch執行緒數，0為預設")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = load_model(args.model)
+    rng = np.random.default_rng(0)
+    prompts = make_prompts(args.requests, model.config.vocab_size, rng)
+    total_tokens = args.requests * args.max_new_tokens
+
+    with torch.no_grad():
+        run_sequential(model, prompts[:1], 4, 1)  # 預熱
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            latencies, elapsed = run_sequential(model, prompts, args.max_new_tokens, concurrency)
+            print(f"concurrency={concurrency:<3} generate    tokens/s={total_tokens / elapsed:8.1f} "
+                  f"p50={np.percentile(latencies, 50):6.2f}s p99={np.percentile(latencies, 99):6.2f}s")
+            latencies, elapsed, occupancy = run_scheduler(
+                model, prompts, args.max_new_tokens, concurrency, args.max_batch_size)
+            print(f"concurrency={concurrency:<3} continuous  tokens/s={total_tokens / elapsed:8.1f} "
+                  f"p50={np.percentile(latencies, 50):6.2f}s p99={np.percentile(latencies, 99):6.2f}s "
+                  f"平均批次佔用={occupancy:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# 附近搜尋（lat/lon/radius_m）的延遲與正確性，分兩種座標分佈：
+#   city   大部分餐廳集中在幾個城市中心（每個約數公里範圍），查詢點也在城市中心附近，半徑內的餐廳多
+#   rural  餐廳平均散佈在全台灣，查詢點隨機，半徑內的餐廳少
+# 每種分佈在獨立的schema中建立與 restaurants 相同欄位的測試表（以search_path指向，檢索程式不需修改），
+# 載入合成的座標與隨機向量後比較：
+#   grid     pgvector 後端以網格索引取出候選（見 geo.py）
+#   scan     同樣的距離條件但不使用網格索引（逐列計算距離），作為對照
+#   memory   記憶體後端的網格索引
+#   過量取回 不過濾取前 --overfetch 名再丟掉半徑外的餐廳（加入此功能前客戶端的做法），列出結果不足top_k的比例
+# 並檢查每個結果都在半徑內，且 grid、scan 與 memory 回傳相同的相似度。
+# 在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_geo
+#   python -m benchmarks.bench_geo --rows 200000 --radius 500,2000,10000 --distributions city
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+from generate_embeddings import load_batches
+from geo import DISTANCE_SQL, create_geo_index, haversine_m
+from pgvector_adapter import register_vector
+from retrieval import InMemoryRetriever, PgVectorRetriever
+
+load_dotenv()
+
+BENCH_SCHEMA = "geo_bench"
+# 台北、台中、台南、高雄
+CITIES = [(25.04, 121.53), (24.15, 120.67), (22.99, 120.20), (22.63, 120.30)]
+TAIWAN_BOX = (22.0, 25.3, 120.0, 122.0)
+
+
+def connect():
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        database=os.getenv("DB_NAME", "restaurant_rag"),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD", "a00010002"),
+        options=f"-c search_path={BENCH_SCHEMA},public",
+    )
+
+
+def city_points(rng, count, spread_m):
+    # 90%集中在城市中心（常態分佈），其餘散佈在全台灣
+    lat_min, lat_max, lon_min, lon_max = TAIWAN_BOX
+    centers = np.array(CITIES)[rng.integers(len(CITIES), size=count)]
+    lats = centers[:, 0] + rng.normal(0, spread_m / 111195, size=count)
+    lons = centers[:, 1] + rng.normal(0, spread_m / 111195 / np.cos(np.radians(centers[:, 0])), size=count)
+    rural = rng.random(count) < 0.1
+    lats[rural] = rng.uniform(lat_min, lat_max, size=rural.sum())
+    lons[rural] = rng.uniform(lon_min, lon_max, size=rural.sum())
+    return lats, lons
+
+
+def rural_points(rng, count):
+    lat_min, lat_max, lon_min, lon_max = TAIWAN_BOX
+    return rng.uniform(lat_min, lat_max, size=count), rng.uniform(lon_min, lon_max, size=count)
+
+
+def synthetic_batches(lats, lons, dim, batch_size, rng):
+    # 與 generate_embeddings.encode_batches 相同的 (rows, embeddings)
+    for start in range(0, len(lats), batch_size):
+        count = min(batch_size, len(lats) - start)
+        embeddings = rng.normal(size=(count, dim)).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        batch = [
+            (f"GEO_BENCH_{start + i:07d}", f"餐廳{start + i}", "", "", round(float(lons[start + i]), 7),
+             round(float(lats[start + i]), 7), None, "", f"{start + i:064x}", embeddings[i])
+            for i in range(count)
+        ]
+        yield batch, embeddings
+
+
+def prepare(conn, lats, lons, dim, batch_size, rng):
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+    cur.execute(f"""
+        CREATE TABLE {BENCH_SCHEMA}.restaurants (
+            id SERIAL PRIMARY KEY,
+            restaurant_name TEXT NOT NULL,
+            restaurant_address TEXT,
+            restaurant_tel TEXT,
+            restaurant_px NUMERIC,
+            restaurant_py NUMERIC,
+            service_time TEXT,
+            description TEXT,
+            embedding vector({dim}),
+            restaurant_id TEXT UNIQUE,
+            content_hash TEXT
+        )
+    """)
+    load_start = time.time()
+    load_batches(cur, synthetic_batches(lats, lons, dim, batch_size, rng), "copy")
+    create_geo_index(cur)
+    cur.execute("ANALYZE restaurants")
+    conn.commit()
+    cur.close()
+    print(f"  載入 {len(lats)} 家餐廳並建立網格索引，耗時: {time.time() - load_start:.2f}s")
+
+
+def scan_search(conn, query, top_k, near):
+    # 與 PgVectorRetriever.search 相同的距離條件，但不經網格索引
+    lat, lon, radius_m = near
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT id, 1 - (embedding <=> %(embedding)s) FROM restaurants
+        WHERE {DISTANCE_SQL} <= %(radius_m)s
+        ORDER BY embedding <=> %(embedding)s
+        LIMIT %(top_k)s
+    """, {"embedding": query, "lat": lat, "lon": lon, "radius_m": radius_m, "top_k": top_k})
+    rows = [{"id": restaurant_id, "similarity": similarity} for restaurant_id, similarity in cur.fetchall()]
+    cur.close()
+    return rows
+
+
+def distance_m(near, location):
+    return float(haversine_m(near[0], near[1], np.array([location[0]]), np.array([location[1]]))[0])
+
+
+def percentile_ms(latencies, q):
+    return np.percentile(latencies, q) * 1000
+
+
+def run_distribution(conn, name, args, rng):
+    if name == "city":
+        lats, lons = city_points(rng, args.rows, args.city_spread)
+        query_lats, query_lons = city_points(rng, args.queries, args.city_spread)
+    else:
+        lats, lons = rural_points(rng, args.rows)
+        query_lats, query_lons = rural_points(rng, args.queries)
+    print(f"{name}:")
+    prepare(conn, lats, lons, args.dim, args.batch_size, rng)
+
+    get_connection = lambda: conn
+    release_connection = lambda c: None
+    pg = PgVectorRetriever(get_connection, release_connection)
+    memory = InMemoryRetriever(get_connection, release_connection)
+    memory.load()
+    queries = rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    located = {row["id"]: (float(row["restaurant_py"]), float(row["restaurant_px"])) for row in memory.rows}
+
+    failed = False
+    for radius in [float(r) for r in args.radius.split(",")]:
+        nears = [(float(lat), float(lon), radius) for lat, lon in zip(query_lats, query_lons)]
+        variants = {
+            "grid": lambda query, near: pg.search(query, args.top_k, near=near),
+            "scan": lambda query, near: scan_search(conn, query, args.top_k, near),
+            "memory": lambda query, near: memory.search(query, args.top_k, near=near),
+        }
+        latencies, results = {}, {}
+        for variant, search in variants.items():
+            latencies[variant], results[variant] = [], []
+            for query, near in zip(queries, nears):
+                t0 = time.perf_counter()
+                rows = search(query, near)
+                latencies[variant].append(time.perf_counter() - t0)
+                results[variant].append(rows)
+
+        nearby = [len(memory.geo.near_rows(*near)) for near in nears]
+        outside = sum(1 for rows_list in results.values() for rows, near in zip(rows_list, nears) for row in rows
+                      if distance_m(near, located[row["id"]]) > radius + 1e-3)
+        mismatched = sum(
+            1 for i in range(len(nears)) for variant in ("scan", "memory")
+            if len(results[variant][i]) != len(results["grid"][i]) or not np.allclose(
+                [row["similarity"] for row in results[variant][i]],
+                [row["similarity"] for row in results["grid"][i]], atol=1e-4))
+        # 加入此功能前的做法：不過濾取前 overfetch 名，再丟掉半徑外的餐廳
+        overfetch_short = 0
+        for query, near, count in zip(queries, nears, nearby):
+            kept = [row for row in memory.search(query, args.overfetch) if distance_m(near, located[row["id"]]) <= radius]
+            overfetch_short += len(kept) < min(args.top_k, count)
+        print(f"  半徑 {radius:>7.0f}m 半徑內平均 {np.mean(nearby):8.1f} 家 | " + " | ".join(
+            f"{variant} p50={percentile_ms(latencies[variant], 50):7.2f}ms p99={percentile_ms(latencies[variant], 99):7.2f}ms"
+            for variant in variants))
+        print(f"  {'':>13} 半徑外的結果={outside} 與grid不同={mismatched} "
+              f"過量取回{args.overfetch}名仍不足top_k={overfetch_short / len(nears):6.1%}")
+        failed = failed or outside > 0 or mismatched > 0
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--radius", default="500,2000,10000", help="逗號分隔的半徑（公尺）")
+    parser.add_argument("--distributions", default="city,rural")
+    parser.add_argument("--city-spread", type=float, default=3000, help="城市中心的常態分佈標準差（公尺）")
+    parser.add_argument("--overfetch", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="結束後保留測試schema")
+    args = parser.parse_args()
+
+    conn = connect()
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    cur.close()
+    register_vector(conn)
+    rng = np.random.default_rng(args.seed)
+    failed = False
+    try:
+        for name in args.distributions.split(","):
+            failed = run_distribution(conn, name, args, rng) or failed
+    finally:
+        if not args.keep:
+            cur = conn.cursor()
+            cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+            cur.close()
+        conn.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# 混合檢索（向量 + 字元二元組詞彙檢索，RRF合併）增加的延遲與店名查詢的排名：
+# 在同一個行程中直接呼叫檢索引擎（不經HTTP與模型推理），兩路以兩個執行緒同時執行再合併，與 app.py 的 hybrid_search 相同。
+#   vector   只有向量檢索（原本的做法）
+#   lexical  只有詞彙檢索
+#   hybrid   兩路同時執行後以 fuse_rankings 合併（各取 max(top_k, --depth) 家，店名完全相同的餐廳排在最前面）
+# 查詢分兩組：店名（隨機抽取資料庫中的餐廳名稱，檢查該餐廳的名次，列出hit@1、hit@top_k與MRR）
+# 與一般的語意查詢（benchmarks/load_test.py 的 QUERIES），兩組都列出延遲；另列出建立詞彙索引的耗時與大小。
+# 同時執行兩個後端時，另以附近（--radius）與營業中（--open-at）過濾檢查兩個後端的詞彙檢索結果相同，
+# 確認過濾在詞彙排序之前套用；並以店名中的單一字（例如「麵」）查詢，檢查前幾名都是名稱含有該字的餐廳。
+# 有不同或單字查詢找不到時結束代碼為1。
+# 需要先以 generate_embeddings.py 載入餐廳，在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_hybrid
+#   python -m benchmarks.bench_hybrid --backends memory --names 500 --lexical-weight 2
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+from sentence_transformers import SentenceTransformer
+
+from benchmarks.load_test import QUERIES
+from lexical import exact_name_ids, normalize
+from pgvector_adapter import register_vector
+from retrieval import InMemoryRetriever, PgVectorRetriever, fuse_rankings
+
+load_dotenv()
+
+
+def percentile_ms(latencies, q):
+    return np.percentile(latencies, q) * 1000
+
+
+def run_variant(variant, retriever, pool, text, embedding, top_k, depth, weights):
+    if variant == "vector":
+        return retriever.search(embedding, top_k)
+    if variant == "lexical":
+        return retriever.lexical_search(text, embedding, top_k)
+    vector = pool.submit(retriever.search, embedding, depth)
+    lexical = pool.submit(retriever.lexical_search, text, embedding, depth)
+    lexical_rows = lexical.result()
+    return fuse_rankings({"vector": vector.result(), "lexical": lexical_rows}, weights, top_k,
+                         pinned=exact_name_ids(text, lexical_rows))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="pgvector,memory")
+    parser.add_argument("--names", type=int, default=200, help="店名查詢的數量")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--depth", type=int, default=20, help="混合檢索時每一路取回的數量（HYBRID_DEPTH）")
+    parser.add_argument("--vector-weight", type=float, default=1.0)
+    parser.add_argument("--lexical-weight", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=5, help="語意查詢重複的次數")
+    parser.add_argument("--embedding-model", default="models/sentence-transformer")
+    parser.add_argument("--radius", type=float, default=1000, help="過濾檢查的半徑（公尺）")
+    parser.add_argument("--open-at", default="2024-05-06T12:30", help="過濾檢查的營業時間")
+    parser.add_argument("--chars", type=int, default=50, help="單字查詢的數量（取自抽出的店名）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        database=os.getenv("DB_NAME", "restaurant_rag"),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD", "a00010002")
+    )
+    conn.autocommit = True
+    register_vector(conn)
+    get_connection = lambda: conn
+    release_connection = lambda c: None
+
+    cur = conn.cursor()
+    cur.execute("SELECT id, restaurant_name, restaurant_py, restaurant_px FROM restaurants WHERE embedding IS NOT NULL")
+    restaurants = cur.fetchall()
+    cur.close()
+    rng = np.random.default_rng(args.seed)
+    picks = rng.choice(len(restaurants), size=min(args.names, len(restaurants)), replace=False)
+    names = [restaurants[i][:2] for i in picks]
+    # 過濾檢查：以被查詢的餐廳為中心
+    nears = [(float(restaurants[i][2] or 0), float(restaurants[i][3] or 0), args.radius) for i in picks]
+    open_at = datetime.fromisoformat(args.open_at)
+    # 單字查詢：抽出的店名中出現的字，及每個字出現在多少家餐廳的名稱中
+    chars = list(dict.fromkeys(char for _, name in names for char in normalize(name) if char.isalnum()))[:args.chars]
+    normalized_names = {restaurant_id: normalize(name) for restaurant_id, name, _, _ in restaurants}
+    char_counts = {char: sum(char in name for name in normalized_names.values()) for char in chars}
+
+    model = SentenceTransformer(args.embedding_model)
+    name_embeddings = model.encode([name for _, name in names], batch_size=64)
+    semantic = QUERIES * args.repeat
+    semantic_embeddings = model.encode(semantic, batch_size=64)
+    char_embeddings = model.encode(chars, batch_size=64)
+    weights = {"vector": args.vector_weight, "lexical": args.lexical_weight}
+    retrievers = {}
+    failed = False
+
+    # 兩路各用一個連線（與服務的連線池相同），避免共用同一個連線時互相等待
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        for backend in args.backends.split(","):
+            if backend == "pgvector":
+                connections = [psycopg2.connect(host=conn.info.host, port=conn.info.port, dbname=conn.info.dbname,
+                                                user=conn.info.user, password=os.getenv("DB_PASSWORD", "a00010002"))
+                               for _ in range(2)]
+                for c in connections:
+                    c.autocommit = True
+                    register_vector(c)
+                free = list(connections)
+                retriever = PgVectorRetriever(lambda: free.pop(), lambda c: free.append(c), lexical=True)
+                build_start = time.time()
+                retriever.refresh()
+                index = retriever.lexical_snapshot[0]
+            else:
+                retriever = InMemoryRetriever(get_connection, release_connection, lexical=True)
+                retriever.load()
+                build_start = time.time()
+                index = type(retriever.lexical)().build(retriever.rows)
+            build_time = time.time() - build_start
+            retrievers[backend] = retriever
+            index_mb = (index.postings.nbytes + index.weights.nbytes + index.offsets.nbytes) / 1024 / 1024
+            print(f"{backend}: 詞彙索引 {index.size} 家餐廳、{len(index.vocabulary)} 個詞、{len(index.postings)} 筆，"
+                  f"建立耗時 {build_time:.2f}s，陣列 {index_mb:.1f}MB")
+
+            for variant in ["vector", "lexical", "hybrid"]:
+                name_latencies, ranks = [], []
+                for (restaurant_id, name), embedding in zip(names, name_embeddings):
+                    t0 = time.perf_counter()
+                    rows = run_variant(variant, retriever, pool, name, embedding, args.top_k, args.depth, weights)
+                    name_latencies.append(time.perf_counter() - t0)
+                    ids = [row["id"] for row in rows]
+                    ranks.append(ids.index(restaurant_id) + 1 if restaurant_id in ids else None)
+                semantic_latencies = []
+                for text, embedding in zip(semantic, semantic_embeddings):
+                    t0 = time.perf_counter()
+                    run_variant(variant, retriever, pool, text, embedding, args.top_k, args.depth, weights)
+                    semantic_latencies.append(time.perf_counter() - t0)
+                hit1 = np.mean([rank == 1 for rank in ranks])
+                hitk = np.mean([rank is not None for rank in ranks])
+                mrr = np.mean([1 / rank if rank else 0 for rank in ranks])
+                print(f"  {variant:<8} 店名 p50={percentile_ms(name_latencies, 50):6.2f}ms "
+                      f"p99={percentile_ms(name_latencies, 99):6.2f}ms hit@1={hit1:6.1%} hit@{args.top_k}={hitk:6.1%} "
+                      f"MRR={mrr:.3f} | 語意查詢 p50={percentile_ms(semantic_latencies, 50):6.2f}ms "
+                      f"p99={percentile_ms(semantic_latencies, 99):6.2f}ms")
+
+            # 單字查詢的前 min(top_k, 名稱含有該字的餐廳數) 名都應是名稱含有該字的餐廳
+            missed = 0
+            for char, embedding in zip(chars, char_embeddings):
+                rows = retriever.lexical_search(char, embedding, args.top_k)
+                expected = min(args.top_k, char_counts[char])
+                missed += sum(char in normalized_names[row["id"]] for row in rows[:expected]) < expected
+            print(f"  單字查詢 {len(chars)} 個字，前幾名有名稱不含該字的餐廳={missed}")
+            failed = failed or missed > 0
+
+    if len(retrievers) == 2:
+        mismatched, returned = 0, 0
+        for ((_, name), embedding, near) in zip(names, name_embeddings, nears):
+            results = [[row["id"] for row in retriever.lexical_search(name, embedding, args.top_k, open_at, near)]
+                       for retriever in retrievers.values()]
+            mismatched += results[0] != results[1]
+            returned += len(results[0])
+        print(f"附近 {args.radius:.0f}m 且 {args.open_at} 營業中: 詞彙檢索平均 {returned / len(names):4.2f} 筆，"
+              f"兩個後端不同={mismatched}")
+        failed = failed or mismatched > 0
+    if "pgvector" in retrievers:
+        for c in connections:
+            c.close()
+    conn.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# 查詢編碼後端的比較：PyTorch（SentenceTransformer）/ ONNX Runtime fp32 / ONNX Runtime int8
+# 先以 python onnx_encoder.py --quantize int8 匯出，再在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_onnx_encoder
+#   python -m benchmarks.bench_onnx_encoder --batch-sizes 1,8,32 --seconds 10
+# 對每個批次大小報告單次呼叫延遲（p50/p99）與每秒編碼的查詢數，並列出與PyTorch輸出的餘弦相似度。
+import argparse
+import os
+import time
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from benchmarks.load_test import QUERIES
+from onnx_encoder import OnnxEncoder, cosine_parity
+
+
+def bench(encode, batch_size, seconds):
+    batch = [QUERIES[i % len(QUERIES)] for i in range(batch_size)]
+    for _ in range(3):
+        encode(batch)  # 預熱
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        encode(batch)
+        latencies.append(time.perf_counter() - t0)
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="models/sentence-transformer")
+    parser.add_argument("--onnx", default=os.getenv("EMBEDDING_ONNX_PATH", "models/sentence-transformer-onnx"))
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op執行緒數，0為預設")
+    args = parser.parse_args()
+
+    torch_model = SentenceTransformer(args.model, device="cpu")
+    backends = {"torch": torch_model.encode}
+    for quantized in (False, True):
+        try:
+            backends["onnx-int8" if quantized else "onnx-fp32"] = OnnxEncoder(
+                args.onnx, quantized=quantized, num_threads=args.threads).encode
+        except Exception as e:
+            print(f"略過 {'onnx-int8' if quantized else 'onnx-fp32'}: {e}")
+
+    reference = torch_model.encode(QUERIES)
+    print(f"CPU核心數: {os.cpu_count()}，查詢數: {len(QUERIES)}")
+    for name, encode in backends.items():
+        similarity = cosine_parity(reference, encode(QUERIES))
+        print(f"{name:<10} 餘弦相似度 最小={similarity.min():.6f} 平均={similarity.mean():.6f}")
+
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        baseline = None
+        for name, encode in backends.items():
+            latencies = bench(encode, batch_size, args.seconds)
+            throughput = batch_size * len(latencies) / latencies.sum()
+            baseline = baseline or throughput
+            print(f"batch={batch_size:<3} {name:<10} p50={np.percentile(latencies, 50) * 1000:7.2f}ms "
+                  f"p99={np.percentile(latencies, 99) * 1000:7.2f}ms 查詢/秒={throughput:8.1f} "
+                  f"({throughput / baseline:4.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
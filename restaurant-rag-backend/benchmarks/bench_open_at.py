@@ -0,0 +1,102 @@
+# open_at（營業中）過濾的延遲與正確性：pgvector（GiST過濾後排序）與記憶體索引（numpy過濾後排序），
+# 與不過濾的向量搜尋比較；並以 restaurant_hours 的區間在Python中逐一檢查每個結果在該時間確實營業，
+# 以及兩個後端回傳的相似度相同（相似度相同的餐廳順序可能不同，因此不比對id）。需要先以 generate_embeddings.py 載入餐廳與營業時間。
+# 在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_open_at
+#   python -m benchmarks.bench_open_at --queries 200 --top-k 10 --open-at 2026-10-20T12:30,2026-10-24T01:00
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+from opening_hours import HOURS_TABLE, open_at_key
+from pgvector_adapter import register_vector
+from retrieval import InMemoryRetriever, PgVectorRetriever
+
+load_dotenv()
+
+# 平日午餐、週五晚上、週日跨午夜、週一清晨
+DEFAULT_OPEN_AT = "2026-10-20T12:30,2026-10-23T19:00,2026-10-26T01:00,2026-10-19T06:30"
+
+
+def percentile_ms(latencies, q):
+    return np.percentile(latencies, q) * 1000
+
+
+def open_ids(cur, open_at):
+    # 逐列比對區間（不經索引），作為營業中餐廳的基準
+    minute, day = open_at_key(open_at)
+    cur.execute(f"SELECT restaurant_id, lower(open_minutes), upper(open_minutes), lower(effective), upper(effective) "
+                f"FROM {HOURS_TABLE}")
+    return {restaurant_id for restaurant_id, start, end, effective, expire in cur.fetchall()
+            if start <= minute < end and (effective is None or effective <= day) and (expire is None or day < expire)}
+
+
+def timed(search, queries, top_k, open_at):
+    latencies, results = [], []
+    for query in queries:
+        t0 = time.perf_counter()
+        rows = search(query, top_k, open_at)
+        latencies.append(time.perf_counter() - t0)
+        results.append([(row["id"], row["similarity"]) for row in rows])
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--open-at", default=DEFAULT_OPEN_AT, help="逗號分隔的時間（台灣時間）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        database=os.getenv("DB_NAME", "restaurant_rag"),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD", "a00010002")
+    )
+    conn.autocommit = True
+    register_vector(conn)
+    get_connection = lambda: conn
+    release_connection = lambda c: None
+
+    pg = PgVectorRetriever(get_connection, release_connection)
+    memory = InMemoryRetriever(get_connection, release_connection)
+    memory.load()
+    if memory.count() == 0 or memory.hours is None:
+        print("資料庫中沒有餐廳或營業時間資料，請先執行 generate_embeddings.py")
+        sys.exit(1)
+    rng = np.random.default_rng(args.seed)
+    picks = rng.integers(0, memory.count(), size=args.queries)
+    queries = memory.matrix[picks] + rng.normal(0, 0.05, size=(args.queries, memory.matrix.shape[1])).astype(np.float32)
+
+    cur = conn.cursor()
+    failed = False
+    for label, open_at in [("不過濾", None)] + [(value, datetime.fromisoformat(value)) for value in args.open_at.split(",")]:
+        pg_latencies, pg_results = timed(pg.search, queries, args.top_k, open_at)
+        memory_latencies, memory_results = timed(memory.search, queries, args.top_k, open_at)
+        line = (f"{label:<17} pgvector p50={percentile_ms(pg_latencies, 50):6.2f}ms p99={percentile_ms(pg_latencies, 99):6.2f}ms | "
+                f"memory p50={percentile_ms(memory_latencies, 50):6.2f}ms p99={percentile_ms(memory_latencies, 99):6.2f}ms")
+        if open_at is not None:
+            expected = open_ids(cur, open_at)
+            wrong = sum(1 for rows in pg_results + memory_results for i, _ in rows if i not in expected)
+            short = sum(1 for rows in pg_results + memory_results if len(rows) < min(args.top_k, len(expected)))
+            same = np.mean([len(a) == len(b) and np.allclose([s for _, s in a], [s for _, s in b], atol=1e-4)
+                            for a, b in zip(pg_results, memory_results)])
+            line += f" | 營業中 {len(expected):5d} 家 未營業的結果={wrong} 不足top_k={short} 兩後端相同={same:6.1%}"
+            failed = failed or wrong > 0 or short > 0
+        print(line)
+    cur.close()
+    conn.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
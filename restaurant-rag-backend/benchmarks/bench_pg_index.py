@@ -0,0 +1,148 @@
+# pgvector HNSW/IVFFlat索引參數調校：量測 recall@k（相對精確掃描）與 p50/p99 延遲
+# 在 restaurant-rag-backend 目錄下執行，例如:
+#   python -m benchmarks.bench_pg_index --method hnsw --m 8,16,32 --ef-construction 64,128 --ef-search 20,40,80,160
+#   python -m benchmarks.bench_pg_index --method ivfflat --lists 50,100,200 --probes 1,5,10,20
+#   python -m benchmarks.bench_pg_index --synthetic 100000   # 以隨機向量模擬大型目錄
+# 所有索引都建在複製出來的 restaurants_index_bench 表上，不影響線上的 restaurants 表
+import argparse
+import itertools
+import os
+import time
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+from pgvector_adapter import register_vector, to_vector_literal
+from setup_db import vector_index_sql
+
+load_dotenv()
+
+BENCH_TABLE = "restaurants_index_bench"
+BENCH_INDEX = "restaurants_index_bench_idx"
+
+
+def connect():
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        database=os.getenv("DB_NAME", "restaurant_rag"),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD", "a00010002")
+    )
+
+
+def int_list(value):
+    return [int(x) for x in value.split(",")]
+
+
+def prepare_table(cur, synthetic, dim, rng):
+    cur.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    if synthetic:
+        print(f"以 {synthetic} 筆隨機向量建立 {BENCH_TABLE}...")
+        cur.execute(f"CREATE TABLE {BENCH_TABLE} (id SERIAL PRIMARY KEY, embedding vector({dim}))")
+        batch = 10000
+        for offset in range(0, synthetic, batch):
+            vectors = rng.normal(size=(min(batch, synthetic - offset), dim)).astype(np.float32)
+            cur.execute(
+                f"INSERT INTO {BENCH_TABLE} (embedding) SELECT unnest(%s::text[])::vector",
+                ([to_vector_literal(v) for v in vectors],)
+            )
+    else:
+        print(f"複製restaurants的向量到 {BENCH_TABLE}...")
+        cur.execute(f"CREATE TABLE {BENCH_TABLE} AS SELECT id, embedding FROM restaurants WHERE embedding IS NOT NULL")
+    cur.execute(f"ANALYZE {BENCH_TABLE}")
+    cur.execute(f"SELECT COUNT(*) FROM {BENCH_TABLE}")
+    return cur.fetchone()[0]
+
+
+def sample_queries(cur, count, rng):
+    # 以表中的向量加上雜訊當作查詢，貼近真實查詢的分佈
+    cur.execute(f"SELECT embedding FROM {BENCH_TABLE} ORDER BY random() LIMIT %s", (count,))
+    vectors = np.array([row[0] for row in cur.fetchall()])
+    noise = rng.normal(0, 0.05, size=vectors.shape).astype(np.float32)
+    return list(vectors + noise)
+
+
+def run_queries(cur, queries, top_k):
+    results = []
+    latencies = []
+    for vector in queries:
+        t0 = time.perf_counter()
+        cur.execute(
+            f"SELECT id FROM {BENCH_TABLE} ORDER BY embedding <=> %s LIMIT %s",
+            (vector, top_k)
+        )
+        results.append([row[0] for row in cur.fetchall()])
+        latencies.append(time.perf_counter() - t0)
+    return results, latencies
+
+
+def recall(results, expected):
+    hits = sum(len(set(r) & set(e)) for r, e in zip(results, expected))
+    return hits / max(1, sum(len(e) for e in expected))
+
+
+def report(label, results, latencies, expected, top_k):
+    print(f"{label:<48} recall@{top_k}={recall(results, expected):.4f} "
+          f"p50={np.percentile(latencies, 50) * 1000:.2f}ms p99={np.percentile(latencies, 99) * 1000:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw")
+    parser.add_argument("--m", type=int_list, default=[16])
+    parser.add_argument("--ef-construction", type=int_list, default=[64])
+    parser.add_argument("--ef-search", type=int_list, default=[20, 40, 80, 160])
+    parser.add_argument("--lists", type=int_list, default=[100])
+    parser.add_argument("--probes", type=int_list, default=[1, 5, 10, 20])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--synthetic", type=int, default=0)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="保留 restaurants_index_bench 表")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    conn = connect()
+    conn.autocommit = True
+    register_vector(conn)
+    cur = conn.cursor()
+
+    try:
+        rows = prepare_table(cur, args.synthetic, args.dim, rng)
+        print(f"{BENCH_TABLE} 共 {rows} 筆向量")
+        queries = sample_queries(cur, args.queries, rng)
+
+        # 沒有索引時的結果即為精確搜尋的標準答案
+        expected, latencies = run_queries(cur, queries, args.top_k)
+        report("exact (seq scan)", expected, latencies, expected, args.top_k)
+
+        if args.method == "hnsw":
+            builds = [dict(m=m, ef_construction=ef) for m, ef in itertools.product(args.m, args.ef_construction)]
+            search_setting, search_values = "hnsw.ef_search", args.ef_search
+        else:
+            builds = [dict(lists=lists) for lists in args.lists]
+            search_setting, search_values = "ivfflat.probes", args.probes
+
+        for build in builds:
+            cur.execute(f"DROP INDEX IF EXISTS {BENCH_INDEX}")
+            build_start = time.time()
+            cur.execute(vector_index_sql(BENCH_TABLE, BENCH_INDEX, args.method, **build))
+            build_label = ", ".join(f"{k}={v}" for k, v in build.items())
+            print(f"{args.method}({build_label}) 建立耗時: {time.time() - build_start:.2f}s")
+
+            for value in search_values:
+                cur.execute(f"SET {search_setting} = {int(value)}")
+                results, latencies = run_queries(cur, queries, args.top_k)
+                report(f"  {search_setting}={value}", results, latencies, expected, args.top_k)
+            cur.execute(f"RESET {search_setting}")
+    finally:
+        if not args.keep:
+            cur.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# 跨請求前綴KV快取（prefix_cache.py）的重播評估：以熱門度呈Zipf分布的查詢流量，
+# 向執行中服務的 /search 取得真實的檢索結果並組成 /recommend 的提示，
+# 比較不使用快取與不同記憶體上限下的 token命中率、prefill時間與快取用量。
+# 在 restaurant-rag-backend 目錄下執行（需先啟動服務 python app.py）:
+#   python -m benchmarks.bench_prefix_cache --url http://localhost:8000 --requests 200 --budgets-mb 16,64,256
+import argparse
+import json
+import time
+import urllib.request
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer, DynamicCache
+
+import metrics
+from benchmarks.bench_semantic_cache import PARAPHRASES
+from benchmarks.load_test import QUERIES
+from device import apply_threads, load_causal_lm, load_device_config
+from generation_scheduler import cache_tensors
+from inference import LLM_MODEL_PATH
+from prefix_cache import PrefixCache
+from prompt_builder import PROMPT_PREFIX, create_prompt_builder
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def build_trace(base_url, prompt_builder, requests, top_k, zipf, seed):
+    # 熱門查詢重複出現，換句話說的查詢常得到相同順序的餐廳
+    queries = list(QUERIES) + [query for group in PARAPHRASES for query in group]
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, len(queries) + 1) ** zipf
+    picks = rng.choice(len(queries), size=requests, p=weights / weights.sum())
+    results = {}
+    prompt_ids = []
+    for i in picks:
+        query = queries[i]
+        if query not in results:
+            results[query] = post(f"{base_url}/search", {"query": query, "top_k": top_k})
+        prompt_ids.append(prompt_builder.build(query, results[query]).input_ids)
+    return prompt_ids
+
+
+@torch.no_grad()
+def replay(model, prompt_ids, prefix_ids, budget_bytes):
+    cache = None
+    if budget_bytes is not None:
+        cache = PrefixCache(model, max_bytes=budget_bytes)
+        cache.pin(prefix_ids)
+    # 快取的計數器是全域指標，各次重播分開計算
+    evictions = metrics.counter("prompt_prefix_cache_evictions_total").value
+    prefill_ms, hit_tokens = [], 0
+    for ids in prompt_ids:
+        start = time.perf_counter()
+        cached, past = cache.match(ids) if cache is not None else (0, None)
+        hit_tokens += cached
+        past = past if past is not None else DynamicCache()
+        input_ids = torch.tensor([ids[cached:]], device=model.device)
+        model(input_ids=input_ids, attention_mask=torch.ones((1, len(ids)), dtype=torch.long, device=model.device),
+              past_key_values=past, use_cache=True)
+        if cache is not None:
+            cache.insert(ids, cache_tensors(past))
+        prefill_ms.append((time.perf_counter() - start) * 1000)
+    stats = {
+        "token_hit_ratio": hit_tokens / sum(len(ids) for ids in prompt_ids),
+        "bytes": cache.nbytes if cache is not None else 0,
+        "evictions": metrics.counter("prompt_prefix_cache_evictions_total").value - evictions,
+    }
+    return np.array(prefill_ms), stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--model", default=LLM_MODEL_PATH)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--zipf", type=float, default=1.1, help="查詢熱門度的Zipf指數")
+    parser.add_argument("--budgets-mb", default="16,64,256")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = load_device_config()
+    apply_threads(config)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    # 與服務相同，模型輸入由 prompt_builder 串接各段token id組成
+    prompt_ids = build_trace(args.url.rstrip("/"), create_prompt_builder(tokenizer), args.requests, args.top_k,
+                             args.zipf, args.seed)
+    model = load_causal_lm(args.model, config)
+    prefix_ids = tokenizer(PROMPT_PREFIX)["input_ids"]
+    print(f"請求數: {len(prompt_ids)}，不同提示: {len(set(map(tuple, prompt_ids)))}，"
+          f"平均提示長度: {np.mean([len(ids) for ids in prompt_ids]):.0f} tokens，前綴: {len(prefix_ids)} tokens")
+
+    replay(model, prompt_ids[:3], prefix_ids, None)  # 預熱
+    baseline, _ = replay(model, prompt_ids, prefix_ids, None)
+    print(f"{'無快取':<12} prefill p50={np.percentile(baseline, 50):8.2f}ms 平均={baseline.mean():8.2f}ms")
+    for budget_mb in [float(b) for b in args.budgets_mb.split(",")]:
+        prefill_ms, stats = replay(model, prompt_ids, prefix_ids, int(budget_mb * 1024 * 1024))
+        print(f"上限{budget_mb:>6g}MB   prefill p50={np.percentile(prefill_ms, 50):8.2f}ms 平均={prefill_ms.mean():8.2f}ms "
+              f"({baseline.mean() / prefill_ms.mean():4.2f}x) token命中率={stats['token_hit_ratio']:6.1%} "
+              f"使用={stats['bytes'] / 1024 / 1024:7.1f}MB 淘汰={stats['evictions']}")
+
+
+if __name__ == "__main__":
+    main()
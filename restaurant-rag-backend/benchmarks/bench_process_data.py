@@ -0,0 +1,213 @@
+# process_data.py 整合步驟的耗時與記憶體峰值：以合成的餐廳列表與營業時間資料（格式同原始資料）比較
+#   legacy     json.load 讀入兩份資料，每家餐廳以 next() 線性掃描營業時間（原本的做法，O(N×M)）
+#   load_dict  json.load 讀入兩份資料，以dict比對（只改比對方式）
+#   stream     process_data.process：增量解析、雜湊表比對、JSON Lines 串流輸出
+# 每種做法在獨立的子行程中執行，記憶體峰值為該行程的最大RSS；並檢查 load_dict 與 stream 的輸出相同。
+# 在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_process_data                          # 10萬、100萬家餐廳
+#   python -m benchmarks.bench_process_data --rows 5000,100000 --methods legacy,load_dict,stream
+# legacy 太慢，只在不超過 --max-legacy-rows 家時執行。
+import argparse
+import hashlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from process_data import format_service_time, integrate, process, service_hours
+
+AREAS = ["台北市大安區", "台中市西區", "高雄市鼓山區", "台南市中西區", "新竹市東區"]
+DISHES = ["牛肉麵", "日式料理", "海鮮熱炒", "義大利麵", "素食", "火鍋", "燒肉", "咖哩"]
+WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+SCHEDULES = [
+    [("上午營運時間", WEEK[1:], "11:00:00", "14:00:00"), ("下午營運時間", WEEK[1:], "17:00:00", "21:00:00"),
+     ("公休日", WEEK[:1], "00:00:00", "00:00:00")],
+    [("全日營運時間", WEEK, "10:00:00", "22:00:00")],
+    [("營運時間", WEEK[:5], "07:00:00", "14:00:00"), ("公休日", WEEK[5:], "00:00:00", "00:00:00")],
+    [("晚餐時段", WEEK[2:], "18:00:00", "23:30:00")],
+]
+WRITE_BATCH = 10000
+
+
+def write_feed(path, key, items):
+    # 與原始資料相同的結構：頂層物件含更新時間與資料陣列，檔頭有BOM
+    with open(path, 'w', encoding='utf-8-sig') as f:
+        f.write(f'{{"UpdateTime": "2024-01-01T00:00:00+08:00", "{key}": [')
+        batch, first = [], True
+        for item in items:
+            batch.append(json.dumps(item, ensure_ascii=False))
+            if len(batch) >= WRITE_BATCH:
+                f.write(("" if first else ",") + ",".join(batch))
+                batch, first = [], False
+        if batch:
+            f.write(("" if first else ",") + ",".join(batch))
+        f.write("]}")
+
+
+def write_feeds(directory, rows, seed):
+    # 約九成餐廳有營業時間，順序與餐廳列表不同；其中5%沒有RestaurantID，只能以名稱比對
+    rng = np.random.default_rng(seed)
+    restaurants_path = os.path.join(directory, "RestaurantList.json")
+    service_times_path = os.path.join(directory, "RestaurantServiceTimeList.json")
+
+    def restaurants():
+        for i in range(rows):
+            dish = DISHES[i % len(DISHES)]
+            yield {
+                "RestaurantID": f"C3_{i:09d}", "RestaurantName": f"{dish}餐廳{i}",
+                "Description": f"提供道地的{dish}，" + "食材每日新鮮採購，環境舒適，適合家庭聚餐。" * (i % 4 + 1),
+                "RestaurantAddress": f"{AREAS[i % len(AREAS)]}民生路{i % 300 + 1}號", "RestaurantTel": f"886-2-2{i % 10000000:07d}",
+                "RestaurantPosX": round(120.0 + (i % 20000) / 10000, 6), "RestaurantPosY": round(22.0 + (i % 33000) / 10000, 6),
+                "City": AREAS[i % len(AREAS)][:3], "ParkingInfo": "", "OpenTime": "",
+            }
+
+    def service_times():
+        for i in rng.permutation(rows)[:int(rows * 0.9)]:
+            i = int(i)
+            item = {"RestaurantName": f"{DISHES[i % len(DISHES)]}餐廳{i}", "ServiceTimes": [
+                {"Name": name, "ServiceDays": days, "StartTime": start, "EndTime": end}
+                for name, days, start, end in SCHEDULES[i % len(SCHEDULES)]
+            ]}
+            if i % 20:
+                item = {"RestaurantID": f"C3_{i:09d}", **item}
+            yield item
+
+    write_feed(restaurants_path, "Restaurants", restaurants())
+    write_feed(service_times_path, "RestaurantServiceTimes", service_times())
+    return restaurants_path, service_times_path
+
+
+def run_legacy(restaurants_path, service_times_path, output_path):
+    # 原本的做法
+    with open(restaurants_path, 'r', encoding='utf-8-sig') as f:
+        restaurant_list = json.load(f)['Restaurants']
+    with open(service_times_path, 'r', encoding='utf-8-sig') as f:
+        service_time_list = json.load(f)['RestaurantServiceTimes']
+    integrated_data = []
+    for restaurant in restaurant_list:
+        restaurant_info, _ = integrate(restaurant, {}, {})
+        restaurant_info.pop('service_hours')
+        service_time = next((item for item in service_time_list
+                             if item['RestaurantName'] == restaurant['RestaurantName']), None)
+        restaurant_info['service_time'] = format_service_time(service_time)
+        integrated_data.append(restaurant_info)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(integrated_data, f, ensure_ascii=False, indent=2)
+
+
+def run_load_dict(restaurants_path, service_times_path, output_path):
+    with open(restaurants_path, 'r', encoding='utf-8-sig') as f:
+        restaurant_list = json.load(f)['Restaurants']
+    with open(service_times_path, 'r', encoding='utf-8-sig') as f:
+        service_time_list = json.load(f)['RestaurantServiceTimes']
+    by_id, by_name = {}, {}
+    for item in service_time_list:
+        service_time = (format_service_time(item), service_hours(item))
+        if item.get('RestaurantID'):
+            by_id.setdefault(item['RestaurantID'], service_time)
+        if item.get('RestaurantName'):
+            by_name.setdefault(item['RestaurantName'], service_time)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for restaurant in restaurant_list:
+            f.write(json.dumps(integrate(restaurant, by_id, by_name)[0], ensure_ascii=False))
+            f.write("\n")
+
+
+METHODS = {
+    "legacy": run_legacy,
+    "load_dict": run_load_dict,
+    "stream": lambda restaurants_path, service_times_path, output_path: process(
+        restaurants_path, service_times_path, output_path),
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss 在exec後仍保留父行程的值，Linux上改讀本行程的 VmHWM
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def worker(args):
+    # 子行程：執行一種做法，輸出耗時與最大RSS
+    baseline_mb = peak_rss_mb()
+    start = time.perf_counter()
+    METHODS[args.worker](args.restaurants_path, args.service_times_path, args.output_path)
+    elapsed = time.perf_counter() - start
+    peak_mb = peak_rss_mb()
+    print(json.dumps({"seconds": elapsed, "peak_mb": peak_mb, "baseline_mb": baseline_mb}))
+
+
+def run(method, restaurants_path, service_times_path, output_path):
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_process_data", "--worker", method,
+         "--restaurants-path", restaurants_path, "--service-times-path", service_times_path, "--output-path", output_path],
+        check=True, stdout=subprocess.PIPE, universal_newlines=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="100000,1000000")
+    parser.add_argument("--methods", default="legacy,load_dict,stream")
+    parser.add_argument("--max-legacy-rows", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", default=None, help="合成資料的目錄，預設為暫存目錄（結束後刪除）")
+    parser.add_argument("--worker", choices=list(METHODS), help=argparse.SUPPRESS)
+    parser.add_argument("--restaurants-path", help=argparse.SUPPRESS)
+    parser.add_argument("--service-times-path", help=argparse.SUPPRESS)
+    parser.add_argument("--output-path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args)
+        return
+
+    directory = args.dir or tempfile.mkdtemp(prefix="bench_process_data_")
+    os.makedirs(directory, exist_ok=True)
+    try:
+        for rows in [int(r) for r in args.rows.split(",")]:
+            generate_start = time.perf_counter()
+            restaurants_path, service_times_path = write_feeds(directory, rows, args.seed)
+            size_mb = (os.path.getsize(restaurants_path) + os.path.getsize(service_times_path)) / 1024 / 1024
+            print(f"{rows} 家餐廳：合成資料 {size_mb:.1f}MB，產生耗時 {time.perf_counter() - generate_start:.1f}s")
+            outputs = {}
+            for method in args.methods.split(","):
+                if method == "legacy" and rows > args.max_legacy_rows:
+                    print(f"  {method:<10} 略過（超過 --max-legacy-rows）")
+                    continue
+                outputs[method] = os.path.join(directory, f"output_{method}.jsonl")
+                result = run(method, restaurants_path, service_times_path, outputs[method])
+                print(f"  {method:<10} {result['seconds']:8.2f}s {rows / result['seconds']:9.0f} 家/秒 "
+                      f"記憶體峰值 {result['peak_mb']:8.1f}MB（啟動時 {result['baseline_mb']:.1f}MB）")
+            if "load_dict" in outputs and "stream" in outputs:
+                same = file_md5(outputs["load_dict"]) == file_md5(outputs["stream"])
+                print(f"  load_dict 與 stream 輸出{'相同' if same else '不同'}")
+            for path in [restaurants_path, service_times_path] + list(outputs.values()):
+                os.remove(path)
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
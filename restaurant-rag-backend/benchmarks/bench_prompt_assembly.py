@@ -0,0 +1,94 @@
+# 推薦提示組裝耗時的微基準：每個請求重新組出整段提示文字並編碼（原本的做法），
+# 與串接預先編碼的餐廳片段token id（prompt_builder.py）比較，並檢查兩者產生的token完全相同；
+# 另以 --budgets 的token預算組裝提示，檢查每個放入餐廳的提示都不超過預算。有任何不同或超過預算時結束代碼為1。
+# 換用tokenizer（例如正式的Gemma權重）後應重新執行，確認片段的切點仍與整段編碼一致。
+# 只需要tokenizer，不載入模型。在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_prompt_assembly
+#   python -m benchmarks.bench_prompt_assembly --top-k 5,10,20 --catalog 1000 --requests 2000
+import argparse
+import sys
+import time
+
+import numpy as np
+from transformers import AutoTokenizer
+
+from benchmarks.bench_prompt_budget import synthetic_results
+from benchmarks.load_test import QUERIES
+from prompt_builder import LLM_MODEL_PATH, PROMPT_PREFIX, QUERY_TEMPLATE, RESTAURANTS_HEADER, create_prompt_builder
+
+
+def tokenize_whole(builder, query, rows):
+    # 原本的做法：逐請求組出提示文字，前綴以外的部分整段編碼（同 InferenceService.tokenize）
+    restaurant_info = "".join(f"{i}. {builder.format_row(row)}\n" for i, row in enumerate(rows, 1))
+    return encode_prompt(builder, PROMPT_PREFIX + RESTAURANTS_HEADER + restaurant_info + QUERY_TEMPLATE.format(query=query))
+
+
+def encode_prompt(builder, prompt):
+    rest = builder.tokenizer(prompt[len(PROMPT_PREFIX):], add_special_tokens=False)["input_ids"]
+    return builder.tokenizer(PROMPT_PREFIX)["input_ids"] + rest
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokenizer", default=LLM_MODEL_PATH)
+    parser.add_argument("--top-k", default="5,10,20")
+    parser.add_argument("--catalog", type=int, default=1000, help="合成的餐廳數量")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--budgets", default="128,192,256,512", help="檢查不超過預算的 PROMPT_MAX_TOKENS")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    # 不限制token預算與相似度，兩種做法放入相同的餐廳
+    builder = create_prompt_builder(tokenizer)
+    builder.max_tokens = 0
+    builder.min_similarity = float("-inf")
+    catalog = synthetic_results("", args.catalog, args.seed)
+    for restaurant_id, row in enumerate(catalog):
+        row["id"] = restaurant_id
+
+    build_start = time.perf_counter()
+    for row in catalog:
+        builder.snippet(row)
+    print(f"tokenizer: {args.tokenizer}，預先編碼 {len(catalog)} 間餐廳: {time.perf_counter() - build_start:.2f}s")
+
+    rng = np.random.default_rng(args.seed)
+    failed = False
+    for top_k in [int(k) for k in args.top_k.split(",")]:
+        requests = [(QUERIES[i % len(QUERIES)], [catalog[j] for j in rng.choice(len(catalog), top_k, replace=False)])
+                    for i in range(args.requests)]
+        whole_us, assembled_us, same = [], [], 0
+        for query, rows in requests:
+            start = time.perf_counter()
+            whole = tokenize_whole(builder, query, rows)
+            whole_us.append((time.perf_counter() - start) * 1e6)
+            start = time.perf_counter()
+            built = builder.build(query, rows)
+            assembled_us.append((time.perf_counter() - start) * 1e6)
+            same += built.input_ids == whole
+        whole_us, assembled_us = np.array(whole_us), np.array(assembled_us)
+        print(f"top_k={top_k:<3} 整段編碼 p50={np.percentile(whole_us, 50):8.1f}us p99={np.percentile(whole_us, 99):8.1f}us | "
+              f"串接片段 p50={np.percentile(assembled_us, 50):8.1f}us p99={np.percentile(assembled_us, 99):8.1f}us "
+              f"({whole_us.mean() / assembled_us.mean():5.1f}x) token相同={same / len(requests):6.1%}")
+        failed = failed or same != len(requests)
+
+    # 名稱、地址很長的餐廳：只剩一間也超過預算時應截斷或捨棄
+    for row in catalog[:50]:
+        row["restaurant_address"] = row["restaurant_address"] * 8
+    for budget in [int(b) for b in args.budgets.split(",")]:
+        builder.max_tokens = budget
+        over, kept, mismatched = 0, 0, 0
+        for i in range(args.requests):
+            rows = [catalog[j] for j in rng.choice(100, 5, replace=False)]
+            built = builder.build(QUERIES[i % len(QUERIES)], rows)
+            over += bool(built.rows) and built.tokens > budget
+            kept += len(built.rows)
+            mismatched += built.input_ids != encode_prompt(builder, built.prompt)
+        print(f"預算 {budget:<5} 平均放入 {kept / args.requests:4.2f} 間餐廳 超過預算={over} token不同={mismatched}")
+        failed = failed or over > 0 or mismatched > 0
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# 提示token預算（prompt_builder.py）對prefill延遲的影響：同一組檢索結果下比較
+# 不限制（原本的提示）、只壓縮營業時間與描述、以及不同 PROMPT_MAX_TOKENS 上限的提示長度、保留的餐廳數與prefill時間。
+# 在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_prompt_budget                                   # 合成的檢索結果
+#   python -m benchmarks.bench_prompt_budget --url http://localhost:8000 --top-k 5,10,20 --budgets 1024,512
+# 指定 --url 時由執行中服務的 /search 取得真實的檢索結果。
+import argparse
+import json
+import time
+import urllib.request
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer, DynamicCache
+
+from benchmarks.load_test import QUERIES
+from device import apply_threads, load_causal_lm, load_device_config
+from inference import LLM_MODEL_PATH
+from prompt_builder import PromptBuilder
+
+AREAS = ["台北市大安區", "台中市西區", "高雄市鼓山區", "台南市中西區", "新竹市東區"]
+DISHES = ["牛肉麵", "日式料理", "海鮮熱炒", "義大利麵", "素食", "火鍋", "燒肉", "咖哩"]
+
+
+def synthetic_results(query, top_k, seed):
+    # 與 process_data.py 相同格式的營業時間，描述長度不一
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(top_k):
+        dish = DISHES[rng.integers(len(DISHES))]
+        rows.append({
+            "restaurant_name": f"{dish}餐廳{i + 1}",
+            "restaurant_address": f"{AREAS[rng.integers(len(AREAS))]}民生路{rng.integers(1, 300)}號",
+            "restaurant_tel": f"0{rng.integers(2, 8)}-2{rng.integers(1000000, 9999999)}",
+            "service_time": ("上午營運時間: Tuesday, Wednesday, Thursday, Friday, Saturday, Sunday 11:00:00-14:00:00; "
+                             "下午營運時間: Tuesday, Wednesday, Thursday, Friday, Saturday, Sunday 17:00:00-21:00:00; "
+                             "公休日: Monday"),
+            "description": f"提供道地的{dish}，" + "食材每日新鮮採購，環境舒適，適合家庭聚餐與朋友小酌，" * int(rng.integers(1, 8)),
+            "similarity": 0.9 - 0.02 * i,
+        })
+    return rows
+
+
+def search(base_url, query, top_k):
+    request = urllib.request.Request(f"{base_url}/search", data=json.dumps({"query": query, "top_k": top_k}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+@torch.no_grad()
+def prefill(model, tokenizer, prompt):
+    input_ids = tokenizer(prompt, return_tensors="pt")["input_ids"].to(model.device)
+    start = time.perf_counter()
+    # 只執行decoder：model.generate 的prefill只計算最後一個位置的logits，長提示的完整logits（長度 x 詞表）也放不進記憶體
+    model.model(input_ids=input_ids, attention_mask=torch.ones_like(input_ids), past_key_values=DynamicCache(),
+                use_cache=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None, help="服務位址；未指定時使用合成的檢索結果")
+    parser.add_argument("--model", default=LLM_MODEL_PATH)
+    parser.add_argument("--queries", type=int, default=8)
+    parser.add_argument("--top-k", default="5,10,20")
+    parser.add_argument("--budgets", default="1024,512", help="PROMPT_MAX_TOKENS，可用逗號分隔多個值")
+    parser.add_argument("--max-description-tokens", type=int, default=80)
+    args = parser.parse_args()
+
+    config = load_device_config()
+    apply_threads(config)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = load_causal_lm(args.model, config)
+    builders = [
+        ("不限制", PromptBuilder(tokenizer, max_tokens=0, max_description_tokens=0, compress_hours=False)),
+        ("只壓縮", PromptBuilder(tokenizer, max_tokens=0, max_description_tokens=args.max_description_tokens)),
+    ] + [
+        (f"上限{budget}", PromptBuilder(tokenizer, max_tokens=budget, max_description_tokens=args.max_description_tokens))
+        for budget in [int(b) for b in args.budgets.split(",")]
+    ]
+    print(f"推理設定: {config.describe()}，每組 {args.queries} 個查詢")
+
+    queries = QUERIES[:args.queries]
+    prefill(model, tokenizer, builders[0][1].build(queries[0], synthetic_results(queries[0], 5, 0)).prompt)  # 預熱
+    for top_k in [int(k) for k in args.top_k.split(",")]:
+        results = [search(args.url.rstrip("/"), query, top_k) if args.url else synthetic_results(query, top_k, i)
+                   for i, query in enumerate(queries)]
+        baseline = None
+        for name, builder in builders:
+            tokens, rows, prefill_ms = [], [], []
+            for query, rows_found in zip(queries, results):
+                built = builder.build(query, rows_found)
+                tokens.append(built.tokens)
+                rows.append(len(built.rows))
+                prefill_ms.append(prefill(model, tokenizer, built.prompt))
+            prefill_ms = np.array(prefill_ms)
+            baseline = baseline or prefill_ms.mean()
+            print(f"top_k={top_k:<3} {name:<8} 提示={np.mean(tokens):7.1f} tokens（最多 {max(tokens):5d}） "
+                  f"餐廳={np.mean(rows):5.1f} prefill p50={np.percentile(prefill_ms, 50):8.2f}ms "
+                  f"平均={prefill_ms.mean():8.2f}ms ({baseline / prefill_ms.mean():4.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# 記憶體檢索引擎與pgvector的一致性檢查與延遲比較
+# 在 restaurant-rag-backend 目錄下執行: python -m benchmarks.bench_retrieval --queries 200 --top-k 5
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+from pgvector_adapter import register_vector
+from retrieval import InMemoryRetriever, PgVectorRetriever, create_index
+
+load_dotenv()
+
+
+def connect():
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        database=os.getenv("DB_NAME", "restaurant_rag"),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD", "a00010002")
+    )
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000) if samples else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--indexes", default="exact,ivf,hnsw")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    conn = connect()
+    conn.autocommit = True
+    register_vector(conn)
+    # 關閉索引掃描，讓pgvector以精確掃描作為比對基準
+    cur = conn.cursor()
+    cur.execute("SET enable_indexscan = off")
+    cur.close()
+    get_connection = lambda: conn
+    release_connection = lambda c: None
+
+    pg = PgVectorRetriever(get_connection, release_connection)
+    rng = np.random.default_rng(args.seed)
+
+    # 以資料庫中的向量加上雜訊當作查詢，貼近真實查詢的分佈
+    base = InMemoryRetriever(get_connection, release_connection)
+    base.load()
+    if base.count() == 0:
+        print("資料庫中沒有餐廳數據，請先導入數據")
+        sys.exit(1)
+    picks = rng.integers(0, base.count(), size=args.queries)
+    queries = base.matrix[picks] + rng.normal(0, 0.05, size=(args.queries, base.matrix.shape[1])).astype(np.float32)
+
+    expected = []
+    pg_latencies = []
+    for query in queries:
+        t0 = time.perf_counter()
+        rows = pg.search(query, args.top_k)
+        pg_latencies.append(time.perf_counter() - t0)
+        expected.append([row["id"] for row in rows])
+    print(f"pgvector    p50={percentile_ms(pg_latencies, 50):.2f}ms p99={percentile_ms(pg_latencies, 99):.2f}ms")
+
+    failed = False
+    for kind in args.indexes.split(","):
+        try:
+            retriever = InMemoryRetriever(get_connection, release_connection, index=create_index(kind))
+            retriever.load()
+        except RuntimeError as e:
+            print(f"{kind:<11} 跳過: {e}")
+            continue
+
+        latencies = []
+        hits = 0
+        mismatched = 0
+        for query, expected_ids in zip(queries, expected):
+            t0 = time.perf_counter()
+            rows = retriever.search(query, args.top_k)
+            latencies.append(time.perf_counter() - t0)
+            ids = [row["id"] for row in rows]
+            hits += len(set(ids) & set(expected_ids))
+            mismatched += ids != expected_ids
+
+        recall = hits / max(1, sum(len(ids) for ids in expected))
+        print(f"{kind:<11} recall@{args.top_k}={recall:.4f} 排序不一致={mismatched} "
+              f"p50={percentile_ms(latencies, 50):.3f}ms p99={percentile_ms(latencies, 99):.3f}ms")
+        # 精確模式必須與pgvector的精確掃描結果一致
+        if kind == "exact" and recall < 1.0:
+            failed = True
+
+    conn.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
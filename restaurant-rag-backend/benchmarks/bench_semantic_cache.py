@@ -0,0 +1,82 @@
+# 語意快取的門檻評估：以同義查詢與不同意圖的查詢，比較不同門檻下的命中率與誤命中率
+# 在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_semantic_cache --thresholds 0.85,0.9,0.92,0.95
+#   python -m benchmarks.bench_semantic_cache --url http://localhost:8000   # 對執行中的服務重播查詢
+import argparse
+import itertools
+import json
+import time
+import urllib.request
+
+import numpy as np
+
+# 每一組是意思相同的查詢；不同組之間視為不同意圖
+PARAPHRASES = [
+    ["台中日式料理", "台中的日本料理", "台中有什麼日式餐廳", "推薦台中的日本料理店"],
+    ["台北適合約會的義式餐廳", "台北浪漫的義大利餐廳", "台北約會吃義大利菜"],
+    ["高雄海鮮餐廳", "高雄好吃的海鮮", "高雄吃海產的地方"],
+    ["宜蘭的早午餐", "宜蘭早午餐店", "宜蘭有什麼早午餐"],
+    ["深夜還有營業的火鍋", "半夜可以吃的火鍋店", "營業到很晚的火鍋"],
+    ["素食友善的餐廳", "有素食選擇的餐廳", "適合吃素的人的餐廳"],
+    ["有停車場的家庭餐廳", "可以停車的親子餐廳", "家庭聚餐有停車位的餐廳"],
+]
+
+
+def sweep(model_path, thresholds):
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_path, device="cpu")
+    queries = [q for group in PARAPHRASES for q in group]
+    labels = [g for g, group in enumerate(PARAPHRASES) for _ in group]
+    embeddings = model.encode(queries, normalize_embeddings=True)
+
+    same, different = [], []
+    for i, j in itertools.combinations(range(len(queries)), 2):
+        score = float(embeddings[i] @ embeddings[j])
+        (same if labels[i] == labels[j] else different).append(score)
+    same, different = np.array(same), np.array(different)
+    print(f"同義查詢相似度: 平均={same.mean():.3f} 最小={same.min():.3f}")
+    print(f"不同意圖相似度: 平均={different.mean():.3f} 最大={different.max():.3f}")
+    for threshold in thresholds:
+        print(f"threshold={threshold:.2f} 同義命中率={np.mean(same >= threshold):6.1%} "
+              f"誤命中率={np.mean(different >= threshold):6.1%}")
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def replay(base_url, top_k):
+    # 每組的第一個查詢先填入快取，其餘的換句話說查詢量測延遲
+    urllib.request.urlopen(urllib.request.Request(f"{base_url}/cache/clear", method="POST")).read()
+    first, rest = [], []
+    for group in PARAPHRASES:
+        for i, query in enumerate(group):
+            t0 = time.perf_counter()
+            post(f"{base_url}/recommend", {"query": query, "top_k": top_k})
+            (first if i == 0 else rest).append(time.perf_counter() - t0)
+    with urllib.request.urlopen(f"{base_url}/cache/stats") as response:
+        stats = json.loads(response.read())["semantic"]
+    print(f"首次查詢 p50={np.percentile(first, 50):.2f}s，換句話說查詢 p50={np.percentile(rest, 50):.2f}s")
+    print(f"語意快取: {json.dumps(stats, ensure_ascii=False)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="models/sentence-transformer")
+    parser.add_argument("--thresholds", default="0.8,0.85,0.9,0.92,0.95")
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.url:
+        replay(args.url.rstrip("/"), args.top_k)
+    else:
+        sweep(args.model, [float(t) for t in args.thresholds.split(",")])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# 推測解碼（speculative.py）的CPU評估：同一組推薦提示下比較一般解碼、prompt lookup與草稿模型的
+# 端到端延遲、每秒token數、每步產生的token數與候選token接受率。
+# 在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_speculative
+#   python -m benchmarks.bench_speculative --num-tokens 5,10 --draft models/gemma-draft --greedy
+# 接受率 = 被接受的候選token / 提出的候選token；提出數量由包裝候選產生器的 get_candidates 取得（僅用於評估）。
+# 一次提出的候選數超過該模式設定的候選數時（設定沒有生效）結束代碼為1。
+import argparse
+import sys
+import time
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+from transformers.generation import candidate_generator
+
+from device import apply_threads, load_causal_lm, load_device_config
+from inference import LLM_MODEL_PATH, TEMPERATURE, TOP_P
+from prompt_builder import create_prompt_builder
+from speculative import SpeculativeDecoding, StepCounter
+
+RESTAURANTS = [
+    {"restaurant_name": "鮨一日式料理", "restaurant_address": "台中市西區公益路二段51號", "restaurant_tel": "04-23211234",
+     "service_time": "11:30-14:00, 17:30-21:30", "description": "新鮮生魚片與握壽司，適合聚餐"},
+    {"restaurant_name": "老胡麵館", "restaurant_address": "台北市大安區復興南路一段107巷5號", "restaurant_tel": "02-27111234",
+     "service_time": "11:00-20:00", "description": "手工刀削麵與牛肉麵"},
+    {"restaurant_name": "海港海鮮餐廳", "restaurant_address": "高雄市鼓山區濱海二路8號", "restaurant_tel": "07-5311234",
+     "service_time": "10:30-22:00", "description": "現撈海鮮、熱炒，有包廂"},
+    {"restaurant_name": "義享時光", "restaurant_address": "台北市信義區松壽路12號", "restaurant_tel": "02-27221234",
+     "service_time": "11:30-22:00", "description": "手工義大利麵與窯烤披薩，氣氛浪漫"},
+    {"restaurant_name": "蔬食小館", "restaurant_address": "台中市北區三民路三段161號", "restaurant_tel": None,
+     "service_time": "11:00-14:30, 17:00-20:30", "description": "全素料理，有停車場"},
+]
+QUERIES = ["台中市的日式料理", "適合約會的義式餐廳", "高雄海鮮餐廳", "有停車場的素食餐廳"]
+
+
+class ProposalCounter:
+    # 累計候選產生器提出的候選token數
+    def __init__(self):
+        self.proposed = 0
+        self.largest = 0  # 單次提出的最多候選數
+        for name in ("PromptLookupCandidateGenerator", "AssistedCandidateGenerator"):
+            cls = getattr(candidate_generator, name)
+            cls.get_candidates = self.wrap(cls.get_candidates)
+
+    def wrap(self, get_candidates):
+        def wrapped(generator, input_ids, *args, **kwargs):
+            candidate_ids, candidate_logits = get_candidates(generator, input_ids, *args, **kwargs)
+            self.proposed += candidate_ids.shape[1] - input_ids.shape[1]
+            self.largest = max(self.largest, candidate_ids.shape[1] - input_ids.shape[1])
+            return candidate_ids, candidate_logits
+        return wrapped
+
+
+def prompts(tokenizer):
+    # 每個查詢搭配不同順序的餐廳列表
+    prompt_builder = create_prompt_builder(tokenizer)
+    return [prompt_builder.build(query, RESTAURANTS[i:] + RESTAURANTS[:i]).prompt for i, query in enumerate(QUERIES)]
+
+
+@torch.no_grad()
+def run(model, tokenizer, prompt_list, speculative, args, counter):
+    counter.proposed, counter.largest = 0, 0
+    latencies, tokens, steps = [], 0, 0
+    for prompt in prompt_list:
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+        sampling = {"do_sample": False} if args.greedy else {"do_sample": True, "temperature": TEMPERATURE, "top_p": TOP_P}
+        start = time.perf_counter()
+        with StepCounter(model) as step_counter:
+            outputs = model.generate(**inputs, max_new_tokens=args.new_tokens, **sampling,
+                                     **(speculative.generate_kwargs() if speculative else {}))
+        latencies.append(time.perf_counter() - start)
+        tokens += min(outputs.shape[1] - inputs["input_ids"].shape[1], args.new_tokens)
+        steps += step_counter.steps
+    return np.array(latencies), tokens, steps, counter.proposed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=LLM_MODEL_PATH)
+    parser.add_argument("--draft", default=None, help="草稿模型路徑（與主模型相同詞表）")
+    parser.add_argument("--num-tokens", default="10", help="每次提出的候選token數，可用逗號分隔多個值")
+    parser.add_argument("--new-tokens", type=int, default=128)
+    parser.add_argument("--greedy", action="store_true", help="使用貪婪解碼（預設與服務相同的取樣設定）")
+    args = parser.parse_args()
+
+    config = load_device_config()
+    apply_threads(config)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = load_causal_lm(args.model, config)
+    draft_model = load_causal_lm(args.draft, config) if args.draft else None
+    prompt_list = prompts(tokenizer)
+    counter = ProposalCounter()
+    print(f"推理設定: {config.describe()}，提示數: {len(prompt_list)}，每個提示最多生成 {args.new_tokens} tokens")
+
+    run(model, tokenizer, prompt_list[:1], None, args, counter)  # 預熱
+    modes = [("none", None)]
+    for num_tokens in [int(n) for n in args.num_tokens.split(",")]:
+        modes.append((f"prompt_lookup/{num_tokens}", SpeculativeDecoding("prompt_lookup", num_tokens)))
+        if draft_model is not None:
+            modes.append((f"draft/{num_tokens}", SpeculativeDecoding("draft", num_tokens, draft_model)))
+
+    baseline = None
+    failed = False
+    for name, speculative in modes:
+        latencies, tokens, steps, proposed = run(model, tokenizer, prompt_list, speculative, args, counter)
+        baseline = baseline or latencies.sum()
+        # 每次前向計算產生1個目標模型自己的token，其餘是被接受的候選
+        accepted = tokens - steps
+        acceptance = f"{accepted / proposed:6.1%}" if proposed else "     -"
+        print(f"{name:<18} 平均延遲={latencies.mean():7.2f}s tokens/s={tokens / latencies.sum():7.2f} "
+              f"({baseline / latencies.sum():4.2f}x) 每步token={tokens / max(steps, 1):5.2f} 接受率={acceptance} "
+              f"單次最多候選={counter.largest}")
+        failed = failed or (speculative is not None and counter.largest > speculative.num_tokens)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
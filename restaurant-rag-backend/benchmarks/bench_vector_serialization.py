@@ -0,0 +1,108 @@
+# 向量參數序列化的微基準：舊的 str(float) 字串拼接 vs pgvector_adapter
+# 在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_vector_serialization              # 只量測Python端序列化
+#   python -m benchmarks.bench_vector_serialization --db         # 另外量測Postgres端解析與查詢
+import argparse
+import os
+import time
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+from pgvector_adapter import VectorAdapter, register_vector, to_vector_literal
+
+load_dotenv()
+
+
+def old_vector_str(vector):
+    # app.py 與 generate_embeddings.py 原本的寫法
+    return f"[{','.join(str(x) for x in vector.tolist())}]"
+
+
+def timed(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def bench_python(dim, repeat, bulk_rows, rng):
+    vector = rng.normal(size=dim).astype(np.float32)
+
+    # 每個請求：舊查詢把同一個字串送兩次（SELECT 與 ORDER BY 各一次）
+    old = timed(lambda: old_vector_str(vector), repeat)
+    new = timed(lambda: VectorAdapter(vector).getquoted(), repeat)
+    old_bytes = 2 * len(old_vector_str(vector))
+    new_bytes = len(VectorAdapter(vector).getquoted())
+    print(f"[每個請求] 舊: {old * 1e6:.1f}us, {old_bytes} bytes (字串送兩次)")
+    print(f"[每個請求] 新: {new * 1e6:.1f}us, {new_bytes} bytes ({old / new:.1f}x 更快, 少 {old_bytes - new_bytes} bytes)")
+
+    # 大量載入：每列一個向量
+    vectors = rng.normal(size=(bulk_rows, dim)).astype(np.float32)
+    t0 = time.perf_counter()
+    old_total = sum(len(old_vector_str(v)) for v in vectors)
+    old_time = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    new_total = sum(len(to_vector_literal(v)) for v in vectors)
+    new_time = time.perf_counter() - t0
+    print(f"[大量載入 {bulk_rows} 列] 舊: {old_time:.2f}s, {old_total / 1e6:.1f}MB")
+    print(f"[大量載入 {bulk_rows} 列] 新: {new_time:.2f}s, {new_total / 1e6:.1f}MB ({old_time / new_time:.1f}x 更快)")
+
+
+def bench_db(dim, repeat, rng):
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        database=os.getenv("DB_NAME", "restaurant_rag"),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD", "a00010002")
+    )
+    register_vector(conn)
+    cur = conn.cursor()
+    vector = rng.normal(size=dim).astype(np.float32)
+
+    # 只量測Postgres解析向量字串的成本
+    old_parse = timed(lambda: cur.execute("SELECT %s::vector IS NULL, %s::vector IS NULL",
+                                          (old_vector_str(vector), old_vector_str(vector))), repeat)
+    new_parse = timed(lambda: cur.execute("SELECT %s IS NULL", (vector,)), repeat)
+    print(f"[Postgres解析] 舊: {old_parse * 1e3:.3f}ms, 新: {new_parse * 1e3:.3f}ms")
+
+    # 完整的向量搜尋查詢
+    def old_query():
+        vector_str = old_vector_str(vector)
+        cur.execute("""
+            SELECT id, 1 - (embedding <=> %s::vector) as similarity
+            FROM restaurants ORDER BY embedding <=> %s::vector LIMIT 5
+        """, (vector_str, vector_str))
+        cur.fetchall()
+
+    def new_query():
+        cur.execute("""
+            SELECT id, embedding <=> %(embedding)s as distance
+            FROM restaurants ORDER BY distance LIMIT 5
+        """, {"embedding": vector})
+        cur.fetchall()
+
+    old = timed(old_query, repeat)
+    new = timed(new_query, repeat)
+    print(f"[搜尋查詢] 舊: {old * 1e3:.3f}ms, 新: {new * 1e3:.3f}ms")
+    cur.close()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--bulk-rows", type=int, default=10000)
+    parser.add_argument("--db", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    bench_python(args.dim, args.repeat, args.bulk_rows, rng)
+    if args.db:
+        bench_db(args.dim, min(args.repeat, 500), rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# 多行程部署的擴展性基準：以 serve.py 依序啟動 1..N 個HTTP worker，量測吞吐量與延遲
+# 在 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.bench_workers --workers 1,2,4 --concurrency 32 --requests 2000
+#   python -m benchmarks.bench_workers --workers 1,2,4 --path /recommend --requests 64 --concurrency 8
+# /search 量測HTTP與資料庫這一層的擴展（每個worker各自的事件迴圈與連接池，查詢編碼集中在模型伺服器批次處理）；
+# /recommend 的瓶頸在模型伺服器上的生成，worker數量增加時吞吐量不會隨之成長，
+# 需搭配 GENERATION_BACKEND=continuous 讓不同worker的請求共用解碼批次。
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.load_test import QUERIES, call, measure
+
+
+def wait_until_ready(url, process, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py 結束，代碼: {process.returncode}")
+        status, _ = call(url, "/health/ready", timeout=2)
+        if status == 200:
+            return
+        time.sleep(1)
+    raise RuntimeError("等待服務啟動逾時")
+
+
+def run(args, workers):
+    url = f"http://127.0.0.1:{args.port}"
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(args.port),
+         "--model-server", args.model_server],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(url, process, args.startup_timeout)
+        # 每個查詢加上序號，避免 /recommend 命中快取
+        payload = lambda i: {"query": f"{QUERIES[i % len(QUERIES)]} {workers}-{i}", "top_k": 5}
+        measure(url, args.path, args.concurrency, args.concurrency * 2, payload)  # 預熱每個worker
+        t0 = time.perf_counter()
+        latencies, errors = measure(url, args.path, args.concurrency, args.requests, payload)
+        elapsed = time.perf_counter() - t0
+    finally:
+        process.terminate()
+        process.wait()
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--path", default="/search")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--model-server", default="127.0.0.1:8110")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    print(f"CPU核心數: {os.cpu_count()}，路徑: {args.path}，並行: {args.concurrency}")
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        latencies, errors, elapsed = run(args, workers)
+        qps = len(latencies) / elapsed
+        baseline = baseline or qps
+        print(f"workers={workers:<3} QPS={qps:8.1f} ({qps / baseline:4.2f}x) "
+              f"p50={np.percentile(latencies, 50) * 1000:7.1f}ms p99={np.percentile(latencies, 99) * 1000:7.1f}ms "
+              f"errors={errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# 換表重新載入（generate_embeddings.py --blue-green）期間持續查詢，檢查沒有任何請求失敗：
+# 以資料庫中目前的餐廳為來源，每次修改一部分餐廳的描述後在影子表重建目錄並換表，同時以多個執行緒
+# 不斷呼叫 /search（與 /health/ready），任何非200或結果筆數不足的回應都算失敗，最後列出換表前、中、後的延遲。
+# 先啟動服務（python app.py），再於 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.check_blue_green_reload --url http://localhost:8000
+#   python -m benchmarks.check_blue_green_reload --reloads 4 --change-fraction 0.2 --concurrency 8
+# 每次換表把修改的描述切換回來，偶數次換表後資料與執行前相同。有任何失敗時以結束碼1離開。
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from transformers import AutoTokenizer
+
+from benchmarks.load_test import QUERIES
+from generate_embeddings import blue_green_load, connect
+from opening_hours import HOURS_TABLE, MINUTES_PER_DAY, WEEKDAYS, create_hours_table
+from prompt_builder import LLM_MODEL_PATH, create_prompt_builder
+
+CHANGED_MARK = "（本週更新菜單）"
+SOURCE_COLUMNS = ["restaurant_id", "restaurant_name", "restaurant_address", "restaurant_tel",
+                  "restaurant_px", "restaurant_py", "service_time", "description"]
+
+
+def post(url, path, payload, timeout=30):
+    request = urllib.request.Request(url + path, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+class Client(threading.Thread):
+    # 不斷送出查詢，記錄 (送出時間, 延遲, 錯誤訊息或None)
+    def __init__(self, url, top_k, stop, seed):
+        super().__init__(daemon=True)
+        self.url = url
+        self.top_k = top_k
+        self.stop = stop
+        self.rng = np.random.default_rng(seed)
+        self.results = []
+
+    def request(self):
+        if self.rng.random() < 0.1:
+            with urllib.request.urlopen(self.url + "/health/ready", timeout=30) as response:
+                response.read()
+            return None
+        rows = post(self.url, "/search", {"query": QUERIES[self.rng.integers(len(QUERIES))], "top_k": self.top_k})
+        if len(rows) != self.top_k:
+            return f"/search 只回傳 {len(rows)} 筆"
+        return None
+
+    def run(self):
+        while not self.stop.is_set():
+            start = time.time()
+            try:
+                error = self.request()
+            except urllib.error.HTTPError as e:
+                error = f"HTTP {e.code}: {e.read()[:200]!r}"
+            except Exception as e:
+                error = repr(e)
+            self.results.append((start, time.time() - start, error))
+
+
+def read_catalog(conn):
+    # 目前的目錄當作來源；營業時間由 restaurant_hours 的區間還原成 service_hours，換表後保持不變
+    cur = conn.cursor()
+    cur.execute(f"SELECT id, {', '.join(SOURCE_COLUMNS)} FROM restaurants WHERE restaurant_id IS NOT NULL ORDER BY id")
+    restaurants = {record[0]: dict(zip(SOURCE_COLUMNS, record[1:])) for record in cur.fetchall()}
+    create_hours_table(cur)
+    cur.execute(f"""
+        SELECT restaurant_id, lower(open_minutes), upper(open_minutes), lower(effective), upper(effective) - 1
+        FROM {HOURS_TABLE}
+    """)
+    for restaurant_id, start, end, effective, expire in cur.fetchall():
+        if restaurant_id not in restaurants:
+            continue
+        day, start = divmod(start, MINUTES_PER_DAY)
+        end -= day * MINUTES_PER_DAY
+        if end > MINUTES_PER_DAY:
+            end -= MINUTES_PER_DAY  # 跨午夜
+        restaurants[restaurant_id].setdefault("service_hours", []).append({
+            "days": [WEEKDAYS[day]],
+            "start": f"{start // 60:02d}:{start % 60:02d}",
+            "end": f"{end // 60:02d}:{end % 60:02d}",
+            "effective_date": effective and effective.isoformat(),
+            "expire_date": expire and expire.isoformat(),
+        })
+    cur.close()
+    conn.commit()
+    for restaurant in restaurants.values():
+        restaurant["restaurant_px"] = float(restaurant["restaurant_px"] or 0)
+        restaurant["restaurant_py"] = float(restaurant["restaurant_py"] or 0)
+    return list(restaurants.values())
+
+
+def toggle_descriptions(restaurants, fraction, rng):
+    # 加上或移除標記，內容雜湊改變，這些餐廳會重新編碼
+    changed = rng.choice(len(restaurants), max(1, int(len(restaurants) * fraction)), replace=False)
+    for i in changed:
+        description = restaurants[i].get("description") or ""
+        if description.endswith(CHANGED_MARK):
+            restaurants[i]["description"] = description[:-len(CHANGED_MARK)]
+        else:
+            restaurants[i]["description"] = description + CHANGED_MARK
+    return len(changed)
+
+
+def report(label, results):
+    latencies = np.array([latency for _, latency, _ in results]) * 1000
+    errors = sum(1 for _, _, error in results if error)
+    if not len(latencies):
+        print(f"{label:<10} 沒有請求")
+        return
+    print(f"{label:<10} n={len(latencies):<6} p50={np.percentile(latencies, 50):7.1f}ms "
+          f"p99={np.percentile(latencies, 99):7.1f}ms max={latencies.max():7.1f}ms errors={errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--reloads", type=int, default=2)
+    parser.add_argument("--change-fraction", type=float, default=0.05, help="每次換表修改描述的餐廳比例")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--warmup", type=float, default=3.0, help="換表前後各持續查詢的秒數")
+    parser.add_argument("--load-method", choices=["copy", "values", "row"], default="copy")
+    parser.add_argument("--embedding-model", default="models/sentence-transformer")
+    parser.add_argument("--tokenizer", default=LLM_MODEL_PATH, help="產生提示片段的tokenizer，空字串為不產生")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    url = args.url.rstrip("/")
+
+    model = SentenceTransformer(args.embedding_model)
+    builder = create_prompt_builder(AutoTokenizer.from_pretrained(args.tokenizer)) if args.tokenizer else None
+    conn = connect()
+    restaurants = read_catalog(conn)
+    if not restaurants:
+        raise SystemExit("資料庫中沒有含restaurant_id的餐廳，請先執行 generate_embeddings.py")
+    print(f"目錄共 {len(restaurants)} 家餐廳，換表 {args.reloads} 次，{args.concurrency} 個執行緒持續查詢")
+
+    rng = np.random.default_rng(args.seed)
+    stop = threading.Event()
+    clients = [Client(url, args.top_k, stop, args.seed + i) for i in range(args.concurrency)]
+    for client in clients:
+        client.start()
+    time.sleep(args.warmup)
+
+    windows = []
+    try:
+        for reload in range(1, args.reloads + 1):
+            changed = toggle_descriptions(restaurants, args.change_fraction, rng)
+            reload_start = time.time()
+            loaded, _, _, _, _ = blue_green_load(conn, model, restaurants, args.load_method, prompt_builder=builder)
+            status = post(url, "/catalog/reload", {}, timeout=600)
+            windows.append((reload_start, time.time()))
+            print(f"第{reload}次換表：修改 {changed} 家，重新編碼 {loaded} 家，服務重新載入: {status}，"
+                  f"耗時: {time.time() - reload_start:.2f}s")
+            if status["count"] != len(restaurants):
+                raise SystemExit(f"換表後服務的餐廳數 {status['count']} 與來源的 {len(restaurants)} 不同")
+        time.sleep(args.warmup)
+    finally:
+        stop.set()
+        for client in clients:
+            client.join()
+        conn.close()
+
+    results = sorted(result for client in clients for result in client.results)
+    during = [r for r in results if any(start <= r[0] <= end for start, end in windows)]
+    report("換表前", [r for r in results if r[0] < windows[0][0]] if windows else results)
+    report("換表期間", during)
+    report("換表後", [r for r in results if windows and r[0] > windows[-1][1]])
+    failures = [r for r in results if r[2]]
+    for start, _, error in failures[:10]:
+        print(f"  失敗: {error}")
+    if failures:
+        raise SystemExit(f"{len(failures)}/{len(results)} 個請求失敗")
+    print(f"全部 {len(results)} 個請求成功（換表期間 {len(during)} 個）")
+
+
+if __name__ == "__main__":
+    main()
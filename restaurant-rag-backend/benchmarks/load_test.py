@@ -0,0 +1,121 @@
+# 負載測試：在 /recommend 請求進行中量測 /search 與 /health 的延遲
+# 先啟動服務（python app.py），再於 restaurant-rag-backend 目錄下執行:
+#   python -m benchmarks.load_test --url http://localhost:8000 --recommend-concurrency 4 --search-concurrency 8
+# 先量測沒有 /recommend 負載時的基準，再量測有 /recommend 負載時的延遲，兩者的p99應該接近：
+# 有負載時 /search 的p99超過基準的 --max-p99-ratio 倍（預設2，0為不檢查）或超過 --max-p99-ms（0為不檢查），
+# 或 /search 全部失敗時，結束代碼為1
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+QUERIES = ["台中市的日式料理", "台北市有停車場的家庭餐廳", "適合約會的義式餐廳", "老胡麵館", "高雄海鮮餐廳"]
+
+
+def call(url, path, payload=None, timeout=600):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(
+        url + path, data=data, headers={"Content-Type": "application/json"},
+        method="POST" if data else "GET"
+    )
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except urllib.error.URLError:
+        status = 0
+    return status, time.perf_counter() - t0
+
+
+def measure(url, path, concurrency, requests, payload_fn):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda i: call(url, path, payload_fn(i)), range(requests)))
+    latencies = [latency for status, latency in results if status == 200]
+    errors = sum(1 for status, _ in results if status != 200)
+    return latencies, errors
+
+
+def report(label, latencies, errors):
+    # 回傳p99（毫秒），全部失敗時為None
+    if not latencies:
+        print(f"{label:<32} 全部失敗 ({errors} 個錯誤)")
+        return None
+    p99 = np.percentile(latencies, 99) * 1000
+    print(f"{label:<32} n={len(latencies)} p50={np.percentile(latencies, 50) * 1000:.1f}ms "
+          f"p99={p99:.1f}ms max={max(latencies) * 1000:.1f}ms errors={errors}")
+    return p99
+
+
+def run_phase(args, label):
+    # 回傳 /search 的p99
+    search = lambda i: {"query": QUERIES[i % len(QUERIES)], "top_k": 5}
+    p99 = report(f"{label} /search", *measure(args.url, "/search", args.search_concurrency, args.search_requests, search))
+    report(f"{label} /health", *measure(args.url, "/health", args.search_concurrency, args.search_requests, lambda i: None))
+    return p99
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--search-concurrency", type=int, default=8)
+    parser.add_argument("--search-requests", type=int, default=200)
+    parser.add_argument("--recommend-concurrency", type=int, default=4)
+    parser.add_argument("--max-p99-ratio", type=float, default=2.0, help="有負載時 /search p99 相對基準的上限倍數，0為不檢查")
+    parser.add_argument("--max-p99-ms", type=float, default=0, help="有負載時 /search p99 的上限（毫秒），0為不檢查")
+    args = parser.parse_args()
+
+    # 預熱
+    call(args.url, "/search", {"query": QUERIES[0], "top_k": 5})
+    baseline_p99 = run_phase(args, "[基準]")
+
+    # 背景持續送出 /recommend，每個查詢加上序號避免命中緩存
+    stop = threading.Event()
+    recommend_results = []
+
+    def recommend_worker(worker):
+        i = 0
+        while not stop.is_set():
+            payload = {"query": f"{QUERIES[i % len(QUERIES)]} {worker}-{i}", "top_k": 5}
+            recommend_results.append(call(args.url, "/recommend", payload))
+            i += 1
+
+    workers = [threading.Thread(target=recommend_worker, args=(w,), daemon=True)
+               for w in range(args.recommend_concurrency)]
+    for worker in workers:
+        worker.start()
+    time.sleep(1.0)  # 讓生成請求先進入執行中
+
+    loaded_p99 = run_phase(args, "[/recommend 進行中]")
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+    statuses = [status for status, _ in recommend_results]
+    print(f"/recommend 完成 {statuses.count(200)} 個, 503(佇列已滿) {statuses.count(503)} 個, "
+          f"其他錯誤 {len(statuses) - statuses.count(200) - statuses.count(503)} 個")
+
+    failures = []
+    if baseline_p99 is None or loaded_p99 is None:
+        failures.append("/search 全部失敗")
+    else:
+        if args.max_p99_ratio > 0 and loaded_p99 > baseline_p99 * args.max_p99_ratio:
+            failures.append(f"/search p99 {loaded_p99:.1f}ms 超過基準 {baseline_p99:.1f}ms 的 {args.max_p99_ratio:g} 倍")
+        if args.max_p99_ms > 0 and loaded_p99 > args.max_p99_ms:
+            failures.append(f"/search p99 {loaded_p99:.1f}ms 超過 {args.max_p99_ms:g}ms")
+    for failure in failures:
+        print(f"未通過: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
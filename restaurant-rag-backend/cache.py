@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import metrics
+
+# 有上限的LRU快取：同時限制項目數與估計的位元組數，每個項目有存活時間（TTL）
+# QUERY_CACHE_MAX_ENTRIES=1024
+# QUERY_CACHE_MAX_BYTES=67108864   以JSON序列化後的長度估計每個項目的大小
+# QUERY_CACHE_TTL_SECONDS=3600     0表示不過期
+
+
+def make_key(namespace: str, params: Dict[str, Any], version: Dict[str, Any]) -> str:
+    # 請求參數與模型/索引版本一起組成鍵，任一項改變都不會取到舊結果
+    payload = json.dumps({"params": params, "version": version}, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{namespace}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+
+def estimate_size(value: Any) -> int:
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+class LRUCache:
+    def __init__(self, name: str, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_seconds: float = 3600):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = metrics.counter(f"{name}_cache_hits_total")
+        self.misses = metrics.counter(f"{name}_cache_misses_total")
+        self.evictions = metrics.counter(f"{name}_cache_evictions_total")
+        self.expirations = metrics.counter(f"{name}_cache_expirations_total")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses.inc()
+                return None
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                self.expirations.inc()
+                self.misses.inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits.inc()
+            return value
+
+    def set(self, key: str, value: Any):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return  # 單一項目超過上限，不快取
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            # 從最久未使用的項目開始淘汰
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions.inc()
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        hits, misses = self.hits.value, self.misses.value
+        return {
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "evictions": self.evictions.value,
+            "expirations": self.expirations.value,
+        }
+
+
+def create_cache(name: str) -> LRUCache:
+    return LRUCache(
+        name,
+        max_entries=int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024")),
+        max_bytes=int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl_seconds=float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600")),
+    )
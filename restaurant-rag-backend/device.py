@@ -0,0 +1,111 @@
+import functools
+import os
+from typing import Dict
+
+import torch
+from transformers import AutoModelForCausalLM
+
+# 推理裝置與精度的選擇，每個部署以環境變數設定：
+# INFERENCE_DEVICE=auto（預設，有CUDA用cuda:0，否則用CPU）| cuda | cuda:1 | cpu
+# INFERENCE_DTYPE=auto（預設，CUDA用float16；CPU支援bf16指令時用bfloat16，否則float32）
+#                 | float16 | bfloat16 | float32
+# INFERENCE_QUANTIZE=none（預設）| int8   int8為線性層的動態量化，僅適用CPU，模型以float32載入後量化
+# TORCH_NUM_THREADS=0             運算子內（intra-op）執行緒數，0為PyTorch預設（實體核心數）
+# TORCH_NUM_INTEROP_THREADS=0     運算子間（inter-op）執行緒數，0為PyTorch預設
+# 各模式的每秒token數與記憶體用量比較見 benchmarks/bench_cpu_inference.py
+
+DTYPES = {"float16": torch.float16, "bfloat16": torch.bfloat16, "float32": torch.float32}
+
+
+class DeviceConfig:
+    def __init__(self, device: str, dtype: str, quantize: str = "none", num_threads: int = 0,
+                 num_interop_threads: int = 0):
+        if quantize not in ("none", "int8"):
+            raise ValueError(f"未知的INFERENCE_QUANTIZE: {quantize}")
+        if quantize == "int8":
+            if device != "cpu":
+                raise ValueError("int8動態量化只支援CPU（INFERENCE_DEVICE=cpu）")
+            dtype = "float32"  # 動態量化需要float32的線性層
+        if dtype not in DTYPES:
+            raise ValueError(f"未知的INFERENCE_DTYPE: {dtype}")
+        self.device = device
+        self.dtype = dtype
+        self.quantize = quantize
+        self.num_threads = num_threads
+        self.num_interop_threads = num_interop_threads
+
+    @property
+    def torch_dtype(self) -> torch.dtype:
+        return DTYPES[self.dtype]
+
+    def describe(self) -> Dict:
+        return {
+            "device": self.device,
+            "dtype": self.dtype,
+            "quantize": self.quantize,
+            "num_threads": torch.get_num_threads(),
+            "num_interop_threads": torch.get_num_interop_threads(),
+        }
+
+
+def cpu_supports_bf16() -> bool:
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def resolve_device(device: str) -> str:
+    if device == "auto":
+        return "cuda:0" if torch.cuda.is_available() else "cpu"
+    if device == "cuda":
+        return "cuda:0"
+    return device
+
+
+def resolve_dtype(device: str, dtype: str) -> str:
+    if dtype != "auto":
+        return dtype
+    if device.startswith("cuda"):
+        return "float16"
+    return "bfloat16" if cpu_supports_bf16() else "float32"
+
+
+@functools.lru_cache(maxsize=None)
+def load_device_config() -> DeviceConfig:
+    device = resolve_device(os.getenv("INFERENCE_DEVICE", "auto"))
+    return DeviceConfig(
+        device,
+        resolve_dtype(device, os.getenv("INFERENCE_DTYPE", "auto")),
+        os.getenv("INFERENCE_QUANTIZE", "none"),
+        num_threads=int(os.getenv("TORCH_NUM_THREADS", "0")),
+        num_interop_threads=int(os.getenv("TORCH_NUM_INTEROP_THREADS", "0")),
+    )
+
+
+def apply_threads(config: DeviceConfig):
+    # inter-op執行緒數只能在第一次平行運算之前設定
+    if config.num_interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(config.num_interop_threads)
+        except RuntimeError as e:
+            print(f"無法設定inter-op執行緒數: {e}")
+    if config.num_threads > 0:
+        torch.set_num_threads(config.num_threads)
+
+
+def load_causal_lm(path: str, config: DeviceConfig):
+    model = AutoModelForCausalLM.from_pretrained(
+        path,
+        device_map=config.device,
+        torch_dtype=config.torch_dtype,
+        use_cache=True,  # 啟用KV緩存加速推理
+        low_cpu_mem_usage=True  # 降低CPU內存使用
+    )
+    model.eval()
+    if config.quantize == "int8":
+        from torch.ao.quantization import quantize_dynamic
+
+        # 線性層的權重轉為int8，推理時依輸入動態量化激活值
+        model = quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
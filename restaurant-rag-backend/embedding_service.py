@@ -0,0 +1,90 @@
+import asyncio
+import os
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+
+import metrics
+from executors import BoundedExecutor
+
+# 查詢向量的動態微批次：在短時間窗內收集同時到達的查詢，合併成一次 encode() 呼叫，
+# 再把每一列結果分送回等待中的請求。
+# EMBED_BATCHING=1（預設）| 0
+# EMBED_BATCH_MAX_SIZE=32   達到此數量立即送出
+# EMBED_BATCH_WAIT_MS=5     第一個查詢最多等待的時間
+
+
+class EmbeddingService:
+    def __init__(self, encode_fn: Callable, executor: BoundedExecutor,
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending: List = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batch_size = metrics.histogram("embedding_batch_size", metrics.SIZE_BUCKETS)
+        self.queue_wait_ms = metrics.histogram("embedding_queue_wait_ms", metrics.LATENCY_MS_BUCKETS)
+        self.encode_ms = metrics.histogram("embedding_encode_ms", metrics.LATENCY_MS_BUCKETS)
+
+    @property
+    def batching(self) -> bool:
+        return self.max_batch_size > 1
+
+    async def encode(self, text: str) -> np.ndarray:
+        if not self.batching:
+            encode_start = time.perf_counter()
+            embedding = await self.executor.run(self.encode_fn, text)
+            self.batch_size.observe(1)
+            self.encode_ms.observe((time.perf_counter() - encode_start) * 1000)
+            return embedding
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:
+            # 超出上限的查詢留給下一批
+            self._timer = asyncio.get_event_loop().call_later(self.max_wait, self._flush)
+        if batch:
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        batch_start = time.perf_counter()
+        for _, _, enqueued in batch:
+            self.queue_wait_ms.observe((batch_start - enqueued) * 1000)
+        self.batch_size.observe(len(batch))
+
+        try:
+            embeddings = await self.executor.run(self.encode_fn, [text for text, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.encode_ms.observe((time.perf_counter() - batch_start) * 1000)
+        for (_, future, _), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+
+def create_embedding_service(encode_fn: Callable, executor: BoundedExecutor) -> EmbeddingService:
+    batching = os.getenv("EMBED_BATCHING", "1") == "1"
+    return EmbeddingService(
+        encode_fn, executor,
+        max_batch_size=int(os.getenv("EMBED_BATCH_MAX_SIZE", "32")) if batching else 1,
+        max_wait_ms=float(os.getenv("EMBED_BATCH_WAIT_MS", "5")),
+    )
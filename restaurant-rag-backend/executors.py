@@ -0,0 +1,58 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 專用執行緒池：模型推理與資料庫查詢都是阻塞呼叫，放到執行緒池中執行以免卡住事件迴圈
+
+
+class ExecutorBusy(Exception):
+    # 佇列已滿時拋出，API層轉換為503
+    pass
+
+
+class BoundedExecutor:
+    # 有界佇列的執行緒池：執行中 + 排隊中的工作超過上限時立即拒絕，而不是無限排隊
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorBusy(f"{self.name} 佇列已滿")
+        with self._lock:
+            self._pending += 1
+        future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        # 在工作真正結束時才釋放名額，請求被取消也不會超量接受工作
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self):
+        with self._lock:
+            pending = self._pending
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(pending, self.max_workers),
+            "queued": max(0, pending - self.max_workers),
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -1,39 +1,96 @@
+import argparse
+import hashlib
 import json
 import os
+import re
+import struct
+import time
+from decimal import Decimal
 import numpy as np
 import psycopg2
+import psycopg2.errors
 from psycopg2.extras import execute_values
 from huggingface_hub import login
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
+from pgvector_adapter import register_vector, vectors_to_binary
+from transformers import AutoTokenizer
+from prompt_builder import LLM_MODEL_PATH, build_snippets, create_prompt_builder
+from geo import create_geo_index
+from opening_hours import HOURS_TABLE, create_hours_table, load_hours
+
+# 產生餐廳的嵌入向量並載入資料庫
+# 增量載入：資料列以來源的 RestaurantID（restaurant_id）為鍵，並保存內容雜湊（content_hash，嵌入文字、
+# 其他寫入的欄位與嵌入模型的sha256）。只有新增或內容改變的餐廳會重新編碼並upsert（ON CONFLICT），
+# 來源中已不存在的餐廳從資料庫刪除，內容未變的餐廳直接略過。--full 清空表格並重新載入全部餐廳。
+# 向量分批編碼，每批編碼完就直接送進資料庫，不必等全部編碼完成，也不必一次保留所有向量。
+# 載入方式（--load-method）：
+#   copy    （預設）COPY ... FROM STDIN (FORMAT binary)，所有欄位以二進位格式串流傳送，向量不經文字格式化與解析
+#   values  execute_values 批次INSERT，每個語句 --page-size 列
+#   row     每列一個INSERT（原本的做法，只用於比較）
+# 不同資料量下的每秒載入列數見 benchmarks/bench_bulk_load.py
+# 每次載入都依來源的 service_hours 重寫營業時間表 restaurant_hours（見 opening_hours.py）
+# --blue-green：不修改線上的restaurants，在影子表 restaurants_shadow 中組出新的目錄（沿用未變更的資料列與id，
+# 載入新增與改變的餐廳），營業時間寫入 restaurant_hours_shadow，建好與線上相同的索引（含向量索引、網格索引與GiST索引）
+# 並ANALYZE、預熱後，在一個很短的交易內以改名同時互換兩組表，
+# 查詢不會中斷，也不會遇到尚未建好的索引。服務每 CATALOG_REFRESH_SECONDS 秒偵測換表，或呼叫 POST /catalog/reload。
+# 重新載入期間持續查詢的檢查見 benchmarks/check_blue_green_reload.py
 
 # 載入環境變數
 load_dotenv()
 
-# 創建數據目錄（如果不存在）
-os.makedirs('models', exist_ok=True)
-
-# 從環境變數獲取Hugging Face token並登入
-huggingface_token = os.getenv("HUGGINGFACE_TOKEN")
-print("登入Hugging Face...")
-login(token=huggingface_token)
-
-# 載入embedding模型 (使用多語言模型以支持中文)
-print("下載和載入Sentence Transformer模型...")
-model_name = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-model = SentenceTransformer(model_name)
-model.save('models/sentence-transformer')
-print("模型下載完成並保存到本地")
-
-# 讀取整合後的餐廳資料
-print("讀取整合後的餐廳資料...")
-with open('processed_data\\integrated_restaurants.json', 'r', encoding='utf-8') as f:
-    restaurants = json.load(f)
-
-# 準備嵌入的文本
-print("準備餐廳描述文本...")
-texts = []
-for restaurant in restaurants:
+EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# 寫入restaurants的欄位（id由SERIAL產生），順序與 restaurant_row 相同，向量放在最後
+LOAD_COLUMNS = [
+    "restaurant_id", "restaurant_name", "restaurant_address", "restaurant_tel",
+    "restaurant_px", "restaurant_py", "service_time", "description", "content_hash", "embedding",
+]
+# 各欄位的COPY二進位編碼方式
+LOAD_COLUMN_TYPES = ["text", "text", "text", "text", "numeric", "numeric", "text", "text", "text", "vector"]
+# 已存在的餐廳更新所有欄位，id不變
+UPSERT_CLAUSE = "ON CONFLICT (restaurant_id) DO UPDATE SET " + ", ".join(
+    f"{column} = EXCLUDED.{column}" for column in LOAD_COLUMNS if column != "restaurant_id")
+
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+COPY_TRAILER = struct.pack("!h", -1)
+COPY_READ_SIZE = 1024 * 1024
+SHADOW_SUFFIX = "_shadow"
+OLD_SUFFIX = "_old"
+_NULL = struct.pack("!i", -1)
+
+
+def load_model():
+    # 從環境變數獲取Hugging Face token並登入
+    huggingface_token = os.getenv("HUGGINGFACE_TOKEN")
+    print("登入Hugging Face...")
+    login(token=huggingface_token)
+
+    # 載入embedding模型 (使用多語言模型以支持中文)
+    print("下載和載入Sentence Transformer模型...")
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    model.save('models/sentence-transformer')
+    print("模型下載完成並保存到本地")
+    return model
+
+
+def read_restaurants(path='processed_data\\integrated_restaurants.jsonl'):
+    # 讀取整合後的餐廳資料
+    print("讀取整合後的餐廳資料...")
+    # process_data.py 輸出的 JSON Lines，每行一家餐廳；同一個ID出現多次時以最後一筆為準
+    restaurants = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            restaurant = json.loads(line)
+            if not restaurant.get('restaurant_id'):
+                raise ValueError("餐廳資料缺少restaurant_id，請重新執行 process_data.py")
+            restaurants[restaurant['restaurant_id']] = restaurant
+    return list(restaurants.values())
+
+
+def embedding_text(restaurant):
     # 結合餐廳名稱和描述來創建豐富的表示
     text = f"{restaurant['restaurant_name']}"
     if restaurant.get('description'):
@@ -42,62 +99,420 @@ for restaurant in restaurants:
         text += f" 地址: {restaurant['restaurant_address']}"
     if restaurant.get('service_time'):
         text += f" 營業時間: {restaurant['service_time']}"
-    texts.append(text)
-
-# 生成嵌入
-print(f"為{len(texts)}家餐廳生成嵌入向量...")
-embeddings = model.encode(texts, show_progress_bar=True)
-print("嵌入生成完成")
-
-# 從環境變數獲取資料庫連接資訊
-print("連接到PostgreSQL資料庫...")
-conn = psycopg2.connect(
-    host=os.getenv("DB_HOST"),
-    database=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD")
-)
-cur = conn.cursor()
-
-# 清空表格（如有必要）
-cur.execute("TRUNCATE TABLE restaurants")
-
-# 檢查description列是否存在
-cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name='restaurants' AND column_name='description'")
-description_exists = cur.fetchone()
-
-if not description_exists:
-    print("添加description列...")
-    cur.execute("ALTER TABLE restaurants ADD COLUMN description TEXT")
-    print("description列添加成功！")
-
-# 將資料插入資料庫
-print("將餐廳資料與嵌入向量存入資料庫...")
-for i, restaurant in enumerate(restaurants):
-    # 创建正确格式的向量字符串
-    vector_str = f"[{','.join(str(x) for x in embeddings[i].tolist())}]"
-    
-    cur.execute(
-        """
-        INSERT INTO restaurants (
-            restaurant_name, restaurant_address, restaurant_tel, 
-            restaurant_px, restaurant_py, service_time, description, embedding
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s::vector)
-        """,
-        (
-            restaurant['restaurant_name'],
-            restaurant.get('restaurant_address', ''),
-            restaurant.get('restaurant_tel', ''),
-            restaurant.get('restaurant_px', 0),
-            restaurant.get('restaurant_py', 0),
-            restaurant.get('service_time', ''),
-            restaurant.get('description', ''),  # 添加了description字段
-            vector_str  # 修改为向量字符串格式
-        )
+    return text
+
+
+def content_hash(restaurant):
+    # 嵌入文字與其他寫入的欄位都納入雜湊，任一項改變就重新編碼並更新該列；換嵌入模型時全部重新編碼
+    content = [EMBEDDING_MODEL_NAME, embedding_text(restaurant), restaurant.get('restaurant_tel', ''),
+               str(restaurant.get('restaurant_px', 0)), str(restaurant.get('restaurant_py', 0))]
+    return hashlib.sha256(json.dumps(content, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def restaurant_row(restaurant, embedding):
+    return (
+        restaurant['restaurant_id'],
+        restaurant['restaurant_name'],
+        restaurant.get('restaurant_address', ''),
+        restaurant.get('restaurant_tel', ''),
+        restaurant.get('restaurant_px', 0),
+        restaurant.get('restaurant_py', 0),
+        restaurant.get('service_time', ''),
+        restaurant.get('description', ''),
+        content_hash(restaurant),
+        embedding,
+    )
+
+
+def encode_batches(model, restaurants, batch_size=1024):
+    # 每次編碼一批，產生 (rows, embeddings)；embeddings 為該批的 float32 矩陣
+    for start in range(0, len(restaurants), batch_size):
+        batch = restaurants[start:start + batch_size]
+        embeddings = model.encode([embedding_text(r) for r in batch], batch_size=64)
+        print(f"已編碼 {start + len(batch)}/{len(restaurants)} 家餐廳")
+        yield [restaurant_row(r, e) for r, e in zip(batch, embeddings)], embeddings
+
+
+def encode_numeric(value) -> bytes:
+    # NUMERIC的二進位格式：ndigits, weight, sign, dscale 各int16，接著以10000為基底的各位數
+    sign, digits, exponent = Decimal(str(value)).as_tuple()
+    digits = list(digits) + [0] * max(exponent, 0)
+    fraction = max(-exponent, 0)
+    integer = len(digits) - fraction
+    pad_left, pad_right = -integer % 4, -fraction % 4
+    digits = [0] * pad_left + digits + [0] * pad_right
+    groups = [digits[i] * 1000 + digits[i + 1] * 100 + digits[i + 2] * 10 + digits[i + 3]
+              for i in range(0, len(digits), 4)]
+    weight = (integer + pad_left) // 4 - 1
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        return struct.pack("!hhhh", 0, 0, 0, fraction)
+    return struct.pack(f"!hhhh{len(groups)}h", len(groups), weight, 0x4000 if sign else 0, fraction, *groups)
+
+
+def _field(value, kind) -> bytes:
+    if value is None:
+        return _NULL
+    if kind == "numeric":
+        data = encode_numeric(value)
+    elif kind == "vector":
+        data = value
+    else:
+        data = str(value).encode("utf-8")
+    return struct.pack("!i", len(data)) + data
+
+
+def copy_chunks(batches):
+    # 每批資料編碼成一段COPY二進位資料：每列為 int16 欄位數，接著各欄位的 int32 長度 + 內容
+    yield COPY_SIGNATURE
+    field_count = struct.pack("!h", len(LOAD_COLUMNS))
+    for rows, embeddings in batches:
+        parts = []
+        for row, vector in zip(rows, vectors_to_binary(embeddings)):
+            parts.append(field_count)
+            parts.extend(_field(value, kind) for value, kind in zip(row[:-1], LOAD_COLUMN_TYPES[:-1]))
+            parts.append(_field(vector, "vector"))
+        yield b"".join(parts)
+    yield COPY_TRAILER
+
+
+class ChunkReader:
+    # copy_expert 以 read(size) 讀取資料，把產生bytes的iterator包裝成檔案介面
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.chunk = b""
+        self.offset = 0
+
+    def read(self, size=-1):
+        parts = []
+        while size != 0:
+            if self.offset >= len(self.chunk):
+                self.chunk, self.offset = next(self.chunks, None), 0
+                if self.chunk is None:
+                    self.chunk = b""
+                    break
+            end = len(self.chunk) if size < 0 else min(len(self.chunk), self.offset + size)
+            parts.append(self.chunk[self.offset:end])
+            if size > 0:
+                size -= end - self.offset
+            self.offset = end
+        return b"".join(parts)
+
+
+def count_rows(batches, counter):
+    for rows, embeddings in batches:
+        counter[0] += len(rows)
+        yield rows, embeddings
+
+
+def load_copy(cur, batches, table="restaurants", upsert=False):
+    # COPY不支援ON CONFLICT：upsert時先COPY到暫存表，再一次INSERT ... SELECT到目標表
+    target = f"{table}_incoming" if upsert else table
+    if upsert:
+        cur.execute(f"CREATE TEMP TABLE {target} AS SELECT {', '.join(LOAD_COLUMNS)} FROM {table} WITH NO DATA")
+    counter = [0]
+    cur.copy_expert(f"COPY {target} ({', '.join(LOAD_COLUMNS)}) FROM STDIN (FORMAT binary)",
+                    ChunkReader(copy_chunks(count_rows(batches, counter))), size=COPY_READ_SIZE)
+    if upsert:
+        cur.execute(f"INSERT INTO {table} ({', '.join(LOAD_COLUMNS)}) SELECT {', '.join(LOAD_COLUMNS)} "
+                    f"FROM {target} {UPSERT_CLAUSE}")
+        cur.execute(f"DROP TABLE {target}")
+    return counter[0]
+
+
+def load_values(cur, batches, table="restaurants", page_size=1000, upsert=False):
+    # numpy向量由pgvector_adapter轉換
+    loaded = 0
+    for rows, _ in batches:
+        execute_values(cur, f"INSERT INTO {table} ({', '.join(LOAD_COLUMNS)}) VALUES %s {UPSERT_CLAUSE if upsert else ''}",
+                       rows, page_size=page_size)
+        loaded += len(rows)
+    return loaded
+
+
+def load_rows(cur, batches, table="restaurants", upsert=False):
+    loaded = 0
+    for rows, _ in batches:
+        for row in rows:
+            cur.execute(f"INSERT INTO {table} ({', '.join(LOAD_COLUMNS)}) VALUES ({', '.join(['%s'] * len(row))}) "
+                        f"{UPSERT_CLAUSE if upsert else ''}", row)
+        loaded += len(rows)
+    return loaded
+
+
+def load_batches(cur, batches, method="copy", table="restaurants", page_size=1000, upsert=False):
+    if method == "copy":
+        return load_copy(cur, batches, table, upsert)
+    if method == "values":
+        return load_values(cur, batches, table, page_size, upsert)
+    if method == "row":
+        return load_rows(cur, batches, table, upsert)
+    raise ValueError(f"不支援的載入方式: {method}")
+
+
+def plan_changes(cur, restaurants):
+    # 與資料庫中的內容雜湊比對，回傳 (新增的餐廳, 內容改變的餐廳, 略過數, 要刪除的restaurant_id)
+    cur.execute("SELECT restaurant_id, content_hash FROM restaurants WHERE restaurant_id IS NOT NULL")
+    existing = dict(cur.fetchall())
+    inserted, updated, skipped = [], [], 0
+    for restaurant in restaurants:
+        stored = existing.get(restaurant['restaurant_id'])
+        if stored is None:
+            inserted.append(restaurant)
+        elif stored != content_hash(restaurant):
+            updated.append(restaurant)
+        else:
+            skipped += 1
+    deleted = list(existing.keys() - {restaurant['restaurant_id'] for restaurant in restaurants})
+    return inserted, updated, skipped, deleted
+
+
+def delete_missing(cur, restaurant_ids):
+    # 來源中已不存在的餐廳，以及沒有restaurant_id的舊資料列
+    cur.execute("DELETE FROM restaurants WHERE restaurant_id IS NULL OR restaurant_id = ANY(%s)", (restaurant_ids,))
+    return cur.rowcount
+
+
+def table_indexes(cur, table):
+    # (索引名稱, 索引定義, 是否唯一, 對應的主鍵/唯一約束定義或None)
+    cur.execute("""
+        SELECT i.relname, pg_get_indexdef(i.oid), x.indisunique, pg_get_constraintdef(c.oid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        LEFT JOIN pg_constraint c ON c.conindid = x.indexrelid AND c.conrelid = x.indrelid AND c.contype IN ('p', 'u')
+        WHERE x.indrelid = %s::regclass
+        ORDER BY i.relname
+    """, (table,))
+    return cur.fetchall()
+
+
+def shadow_index_sql(indexdef, index_name, shadow):
+    # 把線上表的索引定義改寫成影子表上的同名加後綴索引，索引方法與參數（如HNSW的m、ef_construction）不變
+    return re.sub(r"^CREATE (UNIQUE )?INDEX \S+ ON (ONLY )?\S+ ",
+                  lambda m: f"CREATE {m.group(1) or ''}INDEX {index_name}{SHADOW_SUFFIX} ON {shadow} ", indexdef)
+
+
+def create_shadow_table(cur, table, deleted_ids, copy_rows=True):
+    # 欄位、預設值（id的序列）與NOT NULL同線上表；先複製仍在來源中的資料列（保留id），
+    # 主鍵與唯一索引在載入前建立（upsert需要），其餘索引等資料載入完再一次建構
+    shadow = table + SHADOW_SUFFIX
+    cur.execute(f"DROP TABLE IF EXISTS {shadow}")
+    cur.execute(f"CREATE TABLE {shadow} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    copied = 0
+    if copy_rows:
+        cur.execute(f"INSERT INTO {shadow} SELECT * FROM {table} "
+                    f"WHERE restaurant_id IS NOT NULL AND NOT restaurant_id = ANY(%s)", (deleted_ids,))
+        copied = cur.rowcount
+    for name, indexdef, unique, constraint in table_indexes(cur, table):
+        if constraint:
+            cur.execute(f"ALTER TABLE {shadow} ADD CONSTRAINT {name}{SHADOW_SUFFIX} {constraint}")
+        elif unique:
+            cur.execute(shadow_index_sql(indexdef, name, shadow))
+    return shadow, copied
+
+
+def finish_shadow_table(cur, table, shadow):
+    # 建構其餘索引（向量索引等），更新統計資料並預熱，換表後第一個查詢就有完整的索引與查詢計畫
+    shadow_indexes = {name for name, _, _, _ in table_indexes(cur, shadow)}
+    for name, indexdef, _, _ in table_indexes(cur, table):
+        if name + SHADOW_SUFFIX not in shadow_indexes:
+            index_start = time.time()
+            cur.execute(shadow_index_sql(indexdef, name, shadow))
+            print(f"已在{shadow}建立索引 {name}{SHADOW_SUFFIX}，耗時: {time.time() - index_start:.2f}s")
+    cur.execute(f"ANALYZE {shadow}")
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm'")
+    if cur.fetchone():
+        cur.execute(f"SELECT pg_prewarm('{shadow}')")
+        for name, _, _, _ in table_indexes(cur, shadow):
+            cur.execute("SELECT pg_prewarm(%s)", (name,))
+    else:
+        # 沒有pg_prewarm時以循序掃描讀入表格；索引剛建好，其頁面通常仍在快取中
+        cur.execute(f"SELECT COUNT(*) FROM {shadow}")
+
+
+def swap_tables(conn, pairs, lock_timeout="2s", retries=5):
+    # 在一個交易中把每組 (線上表, 影子表) 改名互換，索引與約束也換回原本的名稱；舊表改名為 *_old，提交後刪除。
+    # 改名需要線上表的ACCESS EXCLUSIVE鎖：以lock_timeout限制等待進行中的長查詢的時間，逾時就重試，
+    # 避免排隊中的鎖擋住後面所有的查詢
+    cur = conn.cursor()
+    for attempt in range(1, retries + 1):
+        try:
+            cur.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+            swap_start = time.time()
+            for table, shadow in pairs:
+                old = table + OLD_SUFFIX
+                cur.execute(f"DROP TABLE IF EXISTS {old}")
+                live_indexes = table_indexes(cur, table)
+                # 序列（SERIAL的id）改由影子表擁有，刪除舊表時不會一起刪除
+                cur.execute("""
+                    SELECT s.relname, a.attname
+                    FROM pg_depend d
+                    JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+                    JOIN pg_attribute a ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+                    WHERE d.refobjid = %s::regclass AND d.deptype IN ('a', 'i')
+                """, (table,))
+                for sequence, column in cur.fetchall():
+                    cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {shadow}.{column}")
+                cur.execute(f"ALTER TABLE {table} RENAME TO {old}")
+                for name, _, _, _ in live_indexes:
+                    cur.execute(f"ALTER INDEX {name} RENAME TO {name}{OLD_SUFFIX}")
+                cur.execute(f"ALTER TABLE {shadow} RENAME TO {table}")
+                for name, _, _, _ in live_indexes:
+                    cur.execute(f"ALTER INDEX IF EXISTS {name}{SHADOW_SUFFIX} RENAME TO {name}")
+            conn.commit()
+            print(f"已換表（第{attempt}次嘗試），持有鎖的時間: {(time.time() - swap_start) * 1000:.1f}ms")
+            break
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            print(f"換表等待鎖逾時（第{attempt}次嘗試），稍後重試...")
+            time.sleep(attempt)
+    else:
+        cur.close()
+        raise RuntimeError(f"換表失敗：{retries}次都無法在{lock_timeout}內取得鎖，影子表保留")
+
+    # 仍在使用舊表的查詢結束後才能刪除；新的查詢都已落到新表，等待不會阻擋查詢
+    for table, _ in pairs:
+        cur.execute(f"DROP TABLE {table}{OLD_SUFFIX}")
+        conn.commit()
+    cur.close()
+
+
+def blue_green_load(conn, model, restaurants, method="copy", batch_size=1024, page_size=1000, full=False,
+                    prompt_builder=None):
+    # 在影子表組出新的目錄後換表，回傳 (載入數, 新增, 更新, 略過數, 刪除的restaurant_id)；
+    # full 時不沿用線上的資料列，全部重新編碼
+    cur = conn.cursor()
+    create_hours_table(cur)
+    inserted, updated, skipped, deleted = plan_changes(cur, restaurants)
+    if full:
+        inserted, updated, skipped = restaurants, [], 0
+    print(f"新增 {len(inserted)} 家，更新 {len(updated)} 家，略過 {skipped} 家（內容未變），刪除 {len(deleted)} 家")
+    shadow, copied = create_shadow_table(cur, "restaurants", deleted, copy_rows=not full)
+    print(f"已複製 {copied} 家餐廳到{shadow}（保留id）")
+    loaded = load_batches(cur, encode_batches(model, inserted + updated, batch_size), method, shadow,
+                          page_size, upsert=True)
+    finish_shadow_table(cur, "restaurants", shadow)
+    hours_shadow, _ = create_shadow_table(cur, HOURS_TABLE, [], copy_rows=False)
+    print(f"已寫入 {load_hours(cur, restaurants, shadow, hours_shadow)} 個營業時段到{hours_shadow}")
+    finish_shadow_table(cur, HOURS_TABLE, hours_shadow)
+    conn.commit()
+    cur.close()
+    if prompt_builder is not None:
+        # 換表前就為新目錄產生提示片段，服務換表後重新載入時片段已齊全
+        print(f"已產生 {build_snippets(conn, prompt_builder, table=shadow)} 家餐廳的提示片段")
+    swap_tables(conn, [("restaurants", shadow), (HOURS_TABLE, hours_shadow)])
+    return loaded, inserted, updated, skipped, deleted
+
+
+def connect():
+    # 從環境變數獲取資料庫連接資訊
+    print("連接到PostgreSQL資料庫...")
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD")
     )
+    register_vector(conn)
+    return conn
+
+
+def prepare_table(cur, full=False):
+    # 清空表格（如有必要）
+    if full:
+        cur.execute("TRUNCATE TABLE restaurants")
+
+    # 檢查description列是否存在
+    cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name='restaurants' AND column_name='description'")
+    description_exists = cur.fetchone()
+
+    if not description_exists:
+        print("添加description列...")
+        cur.execute("ALTER TABLE restaurants ADD COLUMN description TEXT")
+        print("description列添加成功！")
+
+    # 增量載入使用的來源餐廳ID與內容雜湊；欄位已存在時不執行ALTER（需要表的ACCESS EXCLUSIVE鎖，會擋住查詢）
+    cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='restaurants'")
+    columns = {row[0] for row in cur.fetchall()}
+    for column in ["restaurant_id", "content_hash"]:
+        if column not in columns:
+            cur.execute(f"ALTER TABLE restaurants ADD COLUMN {column} TEXT")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS restaurants_restaurant_id_key ON restaurants (restaurant_id)")
+    create_geo_index(cur)
+    create_hours_table(cur)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="產生餐廳嵌入向量並載入資料庫")
+    parser.add_argument("--load-method", choices=["copy", "values", "row"], default="copy")
+    parser.add_argument("--page-size", type=int, default=1000, help="values 載入時每個INSERT語句的列數")
+    parser.add_argument("--batch-size", type=int, default=1024, help="每批編碼並送出的餐廳數")
+    parser.add_argument("--full", action="store_true", help="清空表格並重新編碼全部餐廳")
+    parser.add_argument("--blue-green", action="store_true",
+                        help="在影子表建好新目錄與索引後換表，載入期間查詢不受影響")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # 創建數據目錄（如果不存在）
+    os.makedirs('models', exist_ok=True)
+    model = load_model()
+    restaurants = read_restaurants()
+
+    conn = connect()
+    cur = conn.cursor()
+    prepare_table(cur, args.full and not args.blue_green)
+    conn.commit()
+    prompt_builder = create_prompt_builder(AutoTokenizer.from_pretrained(LLM_MODEL_PATH))
+
+    if args.blue_green:
+        cur.close()
+        load_start = time.time()
+        loaded, inserted, updated, skipped, deleted = blue_green_load(
+            conn, model, restaurants, args.load_method, args.batch_size, args.page_size, args.full, prompt_builder)
+        load_time = time.time() - load_start
+        deleted_rows = len(deleted)
+    else:
+        inserted, updated, skipped, deleted = plan_changes(cur, restaurants)
+        print(f"新增 {len(inserted)} 家，更新 {len(updated)} 家，略過 {skipped} 家（內容未變），刪除 {len(deleted)} 家")
+
+        # 只為新增與改變的餐廳生成嵌入並直接存入資料庫
+        changed = inserted + updated
+        print(f"為{len(changed)}家餐廳生成嵌入向量並存入資料庫（{args.load_method}）...")
+        load_start = time.time()
+        loaded = load_batches(cur, encode_batches(model, changed, args.batch_size), args.load_method,
+                              page_size=args.page_size, upsert=not args.full)
+        load_time = time.time() - load_start
+        deleted_rows = delete_missing(cur, deleted)
+        print(f"已寫入 {load_hours(cur, restaurants)} 個營業時段")
+        conn.commit()
+        cur.close()
+
+    print(f"已將 {loaded} 家餐廳資料及其嵌入向量存入資料庫，耗時: {load_time:.2f}s")
+    print(f"略過: {skipped}，更新: {len(updated)}，新增: {len(inserted)}，刪除: {deleted_rows}")
+    if skipped:
+        # 以這次每列的編碼與載入耗時估計略過的餐廳省下的時間；沒有需要載入的餐廳時以少量樣本的編碼耗時估計
+        if loaded:
+            per_row = load_time / loaded
+        else:
+            sample = [embedding_text(r) for r in restaurants[:64]]
+            sample_start = time.time()
+            model.encode(sample, batch_size=64)
+            per_row = (time.time() - sample_start) / len(sample)
+        print(f"增量載入估計省下: {skipped * per_row:.2f}s")
+
+    # 預先產生每間餐廳的提示片段與token id，服務啟動時載入（見 prompt_builder.py）；換表模式已在換表前產生
+    if not args.blue_green:
+        print("產生餐廳提示片段...")
+        print(f"已產生 {build_snippets(conn, prompt_builder)} 家餐廳的提示片段")
+    conn.close()
 
-conn.commit()
-cur.close()
-conn.close()
 
-print(f"已將 {len(restaurants)} 家餐廳資料及其嵌入向量存入資料庫")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+import torch
+from transformers import DynamicCache
+
+import metrics
+from executors import ExecutorBusy
+
+# 連續批次（continuous batching）生成排程器
+# 所有進行中的請求共用同一個解碼批次：新請求在兩個解碼步驟之間完成prefill後加入，
+# 生成結束（EOS或達到max_new_tokens）的序列立即離開批次。
+# 批次中的序列長度不同，KV快取一律靠左填充（left padding），以attention_mask遮蔽填充位置，
+# position_ids則使用每條序列自己的實際位置。
+
+
+def cache_tensors(cache) -> List:
+    # 取出每一層的 (key, value)，形狀為 [batch, heads, seq, head_dim]
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return list(zip(cache.key_cache, cache.value_cache))
+
+
+def tensors_to_cache(tensors) -> DynamicCache:
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(tuple(tensors))
+    return DynamicCache(tensors)
+
+
+def _left_pad(tensor: torch.Tensor, length: int, dim: int) -> torch.Tensor:
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+
+def sample_next_tokens(logits: torch.Tensor, temperature: float, top_p: float) -> torch.Tensor:
+    # logits: [batch, vocab]，與 model.generate(do_sample=True, temperature, top_p) 相同的取樣方式
+    if temperature <= 0:
+        return logits.argmax(dim=-1)
+    logits = logits.float() / temperature
+    if top_p < 1.0:
+        sorted_logits, sorted_indices = torch.sort(logits, descending=True)
+        cumulative = sorted_logits.softmax(dim=-1).cumsum(dim=-1)
+        remove = cumulative - sorted_logits.softmax(dim=-1) > top_p
+        sorted_logits = sorted_logits.masked_fill(remove, float("-inf"))
+        logits = torch.full_like(logits, float("-inf")).scatter(1, sorted_indices, sorted_logits)
+    return torch.multinomial(logits.softmax(dim=-1), num_samples=1).squeeze(-1)
+
+
+class GenerationRequest:
+    def __init__(self, input_ids: List[int], max_new_tokens: int, streamer=None):
+        self.input_ids = input_ids
+        self.max_new_tokens = max_new_tokens
+        self.streamer = streamer  # 具有 put()/end() 的串流物件（如 TextStreamer），可為None
+        self.output_ids: List[int] = []
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+        self.position = len(input_ids)  # 下一個token的位置
+
+
+class GenerationScheduler:
+    def __init__(self, model, eos_token_ids=None, max_batch_size: int = 8, max_queue: int = 32,
+                 temperature: float = 0.7, top_p: float = 0.9, prefix_cache=None):
+        self.model = model
+        self.prefix_cache = prefix_cache  # prefix_cache.PrefixCache，可為None
+        self.eos_token_ids = set(eos_token_ids or [])
+        self.max_batch_size = max_batch_size
+        self.temperature = temperature
+        self.top_p = top_p
+        self._queue: "queue.Queue[GenerationRequest]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # 目前的解碼批次
+        self._active: List[GenerationRequest] = []
+        self._cache: Optional[List] = None       # 每層的 (key, value)
+        self._mask: Optional[torch.Tensor] = None  # [batch, seq]，填充位置為0
+        self._next_tokens: Optional[torch.Tensor] = None
+
+        self.tokens_generated = metrics.counter("generation_tokens_total")
+        self.tokens_per_second = metrics.gauge("generation_tokens_per_second")
+        self.batch_occupancy = metrics.histogram("generation_batch_occupancy", metrics.SIZE_BUCKETS)
+        self.queue_depth = metrics.gauge("generation_queue_depth")
+        self.queue_wait_ms = metrics.histogram("generation_queue_wait_ms", metrics.LATENCY_MS_BUCKETS)
+        self.prefill_ms = metrics.histogram("generation_prefill_ms", metrics.LATENCY_MS_BUCKETS)
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def submit(self, input_ids: List[int], max_new_tokens: int, streamer=None) -> Future:
+        request = GenerationRequest(list(input_ids), max_new_tokens, streamer)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            raise ExecutorBusy("generation 佇列已滿")
+        self.queue_depth.set(self._queue.qsize())
+        return request.future
+
+    def stats(self):
+        return {
+            "active": len(self._active),
+            "max_batch_size": self.max_batch_size,
+            "queued": self._queue.qsize(),
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._admit()
+                if not self._active:
+                    continue
+                self._decode_step()
+            except Exception as e:
+                # 發生錯誤時讓批次中所有請求失敗，排程器繼續服務後續請求
+                for request in self._active:
+                    self._finish(request, error=e)
+                self._active, self._cache, self._mask, self._next_tokens = [], None, None, None
+
+    @torch.no_grad()
+    def _admit(self):
+        # 在解碼步驟之間加入新請求；批次為空時阻塞等待
+        while len(self._active) < self.max_batch_size:
+            try:
+                block = not self._active
+                request = self._queue.get(block=block, timeout=0.1 if block else None)
+            except queue.Empty:
+                break
+            self.queue_depth.set(self._queue.qsize())
+            self.queue_wait_ms.observe((time.perf_counter() - request.enqueued) * 1000)
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            try:
+                self._prefill(request)
+            except Exception as e:
+                self._finish(request, error=e)
+
+    @torch.no_grad()
+    def _prefill(self, request: GenerationRequest):
+        prefill_start = time.perf_counter()
+        # 從最長的已快取前綴接著prefill
+        cached, past = self.prefix_cache.match(request.input_ids) if self.prefix_cache is not None else (0, None)
+        input_ids = torch.tensor([request.input_ids[cached:]], device=self.device)
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=torch.ones((1, len(request.input_ids)), dtype=torch.long, device=self.device),
+            past_key_values=past if past is not None else DynamicCache(),
+            use_cache=True,
+        )
+        prefill_ms = (time.perf_counter() - prefill_start) * 1000
+        self.prefill_ms.observe(prefill_ms)
+        layers = cache_tensors(outputs.past_key_values)
+        if self.prefix_cache is not None:
+            self.prefix_cache.record_prefill(len(request.input_ids) - cached, prefill_ms)
+            self.prefix_cache.insert(request.input_ids, layers)
+        next_token = sample_next_tokens(outputs.logits[:, -1, :], self.temperature, self.top_p)
+        self._join(request, layers, next_token)
+
+    def _join(self, request: GenerationRequest, layers: List, next_token: torch.Tensor):
+        mask = torch.ones((1, layers[0][0].shape[2]), dtype=torch.long, device=self.device)
+        if not self._active:
+            self._cache, self._mask, self._next_tokens = layers, mask, next_token
+        else:
+            # 把較短的一方靠左填充到相同長度後，沿batch維度接上
+            length = max(self._mask.shape[1], mask.shape[1])
+            self._cache = [
+                (torch.cat([_left_pad(k, length, 2), _left_pad(new_k, length, 2)]),
+                 torch.cat([_left_pad(v, length, 2), _left_pad(new_v, length, 2)]))
+                for (k, v), (new_k, new_v) in zip(self._cache, layers)
+            ]
+            self._mask = torch.cat([_left_pad(self._mask, length, 1), _left_pad(mask, length, 1)])
+            self._next_tokens = torch.cat([self._next_tokens, next_token])
+        self._active.append(request)
+        self._emit(len(self._active) - 1)
+
+    def _emit(self, row: int):
+        # 記錄第row條序列剛取樣的token
+        request = self._active[row]
+        token = int(self._next_tokens[row])
+        request.output_ids.append(token)
+        self.tokens_generated.inc()
+        self._stream(request, "put", torch.tensor([token]))
+
+    def _stream(self, request: GenerationRequest, method: str, *args):
+        if request.streamer is None:
+            return
+        try:
+            getattr(request.streamer, method)(*args)
+        except Exception:
+            # 串流端出錯（例如客戶端已斷線）不影響批次中的其他請求
+            request.streamer = None
+
+    def _is_finished(self, request: GenerationRequest) -> bool:
+        return (len(request.output_ids) >= request.max_new_tokens
+                or request.output_ids[-1] in self.eos_token_ids
+                or getattr(request.streamer, "cancelled", False))
+
+    @torch.no_grad()
+    def _decode_step(self):
+        self._evict_finished()
+        if not self._active:
+            return
+
+        step_start = time.perf_counter()
+        self.batch_occupancy.observe(len(self._active))
+        positions = torch.tensor([[request.position] for request in self._active], device=self.device)
+        self._mask = torch.cat([self._mask, self._mask.new_ones((len(self._active), 1))], dim=1)
+        outputs = self.model(
+            input_ids=self._next_tokens.unsqueeze(-1),
+            attention_mask=self._mask,
+            position_ids=positions,
+            past_key_values=tensors_to_cache(self._cache),
+            use_cache=True,
+        )
+        self._cache = cache_tensors(outputs.past_key_values)
+        self._next_tokens = sample_next_tokens(outputs.logits[:, -1, :], self.temperature, self.top_p)
+        for row, request in enumerate(self._active):
+            request.position += 1
+            self._emit(row)
+
+        elapsed = time.perf_counter() - step_start
+        if elapsed > 0:
+            self.tokens_per_second.set(len(self._active) / elapsed)
+        self._evict_finished()
+
+    def _evict_finished(self):
+        finished = [row for row, request in enumerate(self._active) if self._is_finished(request)]
+        if not finished:
+            return
+        keep = [row for row in range(len(self._active)) if row not in finished]
+        for row in finished:
+            self._finish(self._active[row])
+        self._active = [self._active[row] for row in keep]
+        if not keep:
+            self._cache, self._mask, self._next_tokens = None, None, None
+            return
+
+        index = torch.tensor(keep, device=self.device)
+        mask = self._mask.index_select(0, index)
+        # 剩下的序列都不需要的前導填充欄位一併裁掉
+        start = int((mask.sum(dim=0) > 0).nonzero()[0])
+        self._mask = mask[:, start:]
+        self._cache = [(k.index_select(0, index)[:, :, start:], v.index_select(0, index)[:, :, start:])
+                       for k, v in self._cache]
+        self._next_tokens = self._next_tokens.index_select(0, index)
+
+    def _finish(self, request: GenerationRequest, error: Optional[Exception] = None):
+        if request.future.done():
+            return
+        self._stream(request, "end")
+        if error is not None:
+            request.future.set_exception(error)
+        else:
+            request.future.set_result(request.output_ids)
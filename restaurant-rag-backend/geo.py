@@ -0,0 +1,98 @@
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# 「附近」過濾：以固定大小的經緯度網格為空間索引（不需要PostGIS）
+# restaurant_px 為經度、restaurant_py 為緯度。每家餐廳的網格編號為
+#   floor(緯度 / CELL_DEGREES) * ROW_STRIDE + floor(經度 / CELL_DEGREES)
+# 同一列（同緯度帶）的網格編號連續，半徑查詢涵蓋的外接矩形在每一列都是一段連續的編號範圍。
+#   pgvector 後端：restaurants 上以網格編號運算式建立btree索引（restaurants_geo_cell_idx），
+#     查詢條件為每一列範圍的OR（BitmapOr的索引範圍掃描），再以球面距離精確過濾，只對半徑內的餐廳計算向量距離並排序。
+#     範圍以常數寫在條件中，規劃器依運算式索引的統計估計列數；若以unnest陣列JOIN範圍，
+#     規劃器無法估計距離條件的選擇性，會改用循序掃描
+#   memory 後端：載入時依網格編號排序（GeoGrid），以二分搜尋取出每一列的範圍，同樣精確過濾後排序
+# 城市（密集）與鄉間（稀疏）分佈下的耗時見 benchmarks/bench_geo.py
+
+CELL_DEGREES = 0.01  # 約1.1公里（緯度方向）；改變時需要重建索引（setup_db.py 或 generate_embeddings.py）
+ROW_STRIDE = 100000  # 大於經度方向的網格數（36000），不同列的編號不會重疊
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+GEO_CELL_SQL = (f"(floor(restaurant_py / {CELL_DEGREES})::bigint * {ROW_STRIDE} "
+                f"+ floor(restaurant_px / {CELL_DEGREES})::bigint)")
+# 與 haversine_m 相同的球面距離（公尺），參數為 %(lat)s 與 %(lon)s
+DISTANCE_SQL = (f"2 * {EARTH_RADIUS_M} * asin(sqrt("
+                f"power(sin(radians(restaurant_py - %(lat)s) / 2), 2) + "
+                f"cos(radians(%(lat)s)) * cos(radians(restaurant_py)) * "
+                f"power(sin(radians(restaurant_px - %(lon)s) / 2), 2)))")
+
+
+def create_geo_index(cur, table: str = "restaurants"):
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_geo_cell_idx ON {table} ({GEO_CELL_SQL})")
+
+
+def near_filter_sql(lat: float, lon: float, radius_m: float) -> Tuple[str, Dict]:
+    # restaurants 的WHERE條件與參數：網格範圍（走索引）加上精確的球面距離
+    lo, hi = cell_ranges(lat, lon, radius_m)
+    params = {"lat": lat, "lon": lon, "radius_m": radius_m}
+    ranges = []
+    for i, (first, last) in enumerate(zip(lo, hi)):
+        params[f"cell_lo_{i}"], params[f"cell_hi_{i}"] = first, last
+        ranges.append(f"{GEO_CELL_SQL} BETWEEN %(cell_lo_{i})s AND %(cell_hi_{i})s")
+    return f"({' OR '.join(ranges)}) AND {DISTANCE_SQL} <= %(radius_m)s", params
+
+
+def haversine_m(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    lat1, lat2 = math.radians(lat), np.radians(lats)
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * np.cos(lat2) * np.sin((np.radians(lons) - math.radians(lon)) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def cell_ranges(lat: float, lon: float, radius_m: float) -> Tuple[List[int], List[int]]:
+    # 半徑的外接矩形在每一列網格的 (起始編號, 結束編號)，含頭尾；
+    # 前後各多取一格，浮點數的網格計算與資料庫中NUMERIC的計算在邊界上差一格時也不會漏掉
+    dlat = radius_m / METERS_PER_DEGREE
+    max_lat = min(abs(lat) + dlat, 89.9)
+    dlon = min(dlat / math.cos(math.radians(max_lat)), 180.0)
+    first_row = math.floor((lat - dlat) / CELL_DEGREES) - 1
+    last_row = math.floor((lat + dlat) / CELL_DEGREES) + 1
+    first_col = math.floor((lon - dlon) / CELL_DEGREES) - 1
+    last_col = math.floor((lon + dlon) / CELL_DEGREES) + 1
+    rows = range(first_row, last_row + 1)
+    return [row * ROW_STRIDE + first_col for row in rows], [row * ROW_STRIDE + last_col for row in rows]
+
+
+class GeoGrid:
+    # 記憶體中的網格索引：有座標的餐廳依網格編號排序，rows 為餐廳在檢索矩陣中的位置
+    def __init__(self, lats: np.ndarray, lons: np.ndarray):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        # 沒有座標（空值或0）的餐廳不在任何網格中
+        located = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons) & ((lats != 0) | (lons != 0)))
+        cells = (np.floor(lats[located] / CELL_DEGREES).astype(np.int64) * ROW_STRIDE
+                 + np.floor(lons[located] / CELL_DEGREES).astype(np.int64))
+        order = np.argsort(cells, kind="stable")
+        self.cells = cells[order]
+        self.rows = located[order]
+        self.lats = lats[self.rows]
+        self.lons = lons[self.rows]
+
+    @classmethod
+    def from_rows(cls, rows) -> "GeoGrid":
+        def coordinate(value) -> float:
+            return float(value) if value is not None else math.nan
+        return cls(np.array([coordinate(row["restaurant_py"]) for row in rows], dtype=np.float64),
+                   np.array([coordinate(row["restaurant_px"]) for row in rows], dtype=np.float64))
+
+    def near_rows(self, lat: float, lon: float, radius_m: float) -> np.ndarray:
+        # 半徑內的餐廳在檢索矩陣中的位置（由小到大）
+        lo, hi = cell_ranges(lat, lon, radius_m)
+        starts = np.searchsorted(self.cells, lo, side="left")
+        ends = np.searchsorted(self.cells, hi, side="right")
+        positions = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)] or [np.empty(0, np.int64)])
+        if not len(positions):
+            return np.empty(0, dtype=np.int64)
+        within = haversine_m(lat, lon, self.lats[positions], self.lons[positions]) <= radius_m
+        return np.sort(self.rows[positions[within]])
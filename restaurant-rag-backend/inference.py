@@ -0,0 +1,260 @@
+import asyncio
+import contextlib
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+from transformers import AutoTokenizer, DynamicCache, LogitsProcessorList, StoppingCriteriaList
+
+import metrics
+from device import apply_threads, load_causal_lm, load_device_config
+from embedding_service import create_embedding_service
+from executors import BoundedExecutor
+from generation_scheduler import GenerationScheduler, cache_tensors
+from onnx_encoder import OnnxEncoder
+from prefix_cache import PrefillTimer, PrefixCache
+from prompt_builder import LLM_MODEL_PATH, PROMPT_PREFIX
+from speculative import SpeculativeDecoding, StepCounter, create_speculative_decoding
+from streaming import AsyncTextStreamer, StreamerCancelled
+
+# 模型推理服務：持有 Sentence Transformer 與 Gemma 2b，提供查詢編碼與推薦文字的生成/串流。
+# 單行程模式下由 app.py 直接使用；多行程模式下由 model_server.py 持有，
+# 各個HTTP worker 經由本機socket呼叫，模型權重只載入一份。
+
+EMBEDDING_MODEL_PATH = "models/sentence-transformer"
+# 查詢編碼的執行方式，見 onnx_encoder.py
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_PATH = os.getenv("EMBEDDING_ONNX_PATH", "models/sentence-transformer-onnx")
+EMBEDDING_ONNX_QUANTIZE = os.getenv("EMBEDDING_ONNX_QUANTIZE", "none")
+MAX_NEW_TOKENS = 256
+TEMPERATURE = 0.7
+TOP_P = 0.9
+WARMUP_NEW_TOKENS = 8
+
+
+def model_version() -> Dict:
+    # 影響輸出結果的模型與生成設定，用於快取鍵
+    config = load_device_config()
+    return {
+        "dtype": config.dtype,
+        "quantize": config.quantize,
+        "embedding_model": EMBEDDING_MODEL_PATH,
+        "embedding_backend": EMBEDDING_BACKEND if EMBEDDING_BACKEND == "torch" else f"onnx-{EMBEDDING_ONNX_QUANTIZE}",
+        "llm": LLM_MODEL_PATH,
+        "prompt_prefix": PROMPT_PREFIX,
+        "max_new_tokens": MAX_NEW_TOKENS,
+        "temperature": TEMPERATURE,
+        "top_p": TOP_P,
+    }
+
+
+class InferenceService:
+    def __init__(self, start_time: Optional[float] = None):
+        self.start_time = start_time if start_time is not None else time.time()
+        # 生成方式：GENERATION_BACKEND=generate（預設，每個請求各自呼叫model.generate）
+        #          | continuous（連續批次，同時進行的請求共用解碼批次）
+        self.generation_backend = os.getenv("GENERATION_BACKEND", "generate")
+        self.device_config = load_device_config()
+        self.embedding_model = None
+        self.tokenizer = None
+        self.model = None
+        self.embedding_service = None
+        self.generation_scheduler: Optional[GenerationScheduler] = None
+        self.prefix_cache: Optional[PrefixCache] = None
+        self.prefix_ids: Optional[List[int]] = None
+        self.speculative: Optional[SpeculativeDecoding] = None
+        self.ready = False
+        self.startup = metrics.phase_timer("startup")
+
+        # 專用執行緒池：向量編碼與模型生成都是阻塞呼叫，不能直接在事件迴圈中執行
+        # 佇列滿時回傳503，避免長時間的生成請求無限堆積
+        self.encode_executor = BoundedExecutor(
+            "encode", int(os.getenv("ENCODE_WORKERS", "2")), int(os.getenv("ENCODE_QUEUE_SIZE", "64")))
+        self.generate_executor = BoundedExecutor(
+            "generate", int(os.getenv("GENERATE_WORKERS", "1")), int(os.getenv("GENERATE_QUEUE_SIZE", "8")))
+
+    def load(self):
+        # 裝置、精度、量化與執行緒數依部署的環境變數決定（見 device.py）
+        apply_threads(self.device_config)
+        print(f"[{time.time() - self.start_time:.2f}s] 推理設定: {self.device_config.describe()}")
+
+        # 各階段耗時記錄在 startup 指標中（/health/ready 與 /metrics）
+        with self.startup.phase("load_embedding_model"):
+            if EMBEDDING_BACKEND == "onnx":
+                self.embedding_model = OnnxEncoder(EMBEDDING_ONNX_PATH, quantized=EMBEDDING_ONNX_QUANTIZE == "int8",
+                                                   num_threads=self.device_config.num_threads)
+            else:
+                self.embedding_model = SentenceTransformer(EMBEDDING_MODEL_PATH, device=self.device_config.device)
+
+        # 載入Gemma 2b模型
+        with self.startup.phase("load_tokenizer"):
+            self.tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL_PATH)
+        with self.startup.phase("load_llm"):
+            self.model = load_causal_lm(LLM_MODEL_PATH, self.device_config)
+        with self.startup.phase("load_speculative"):
+            self.speculative = create_speculative_decoding(self.device_config)
+        if self.speculative is not None and self.generation_backend == "continuous":
+            print(f"[{time.time() - self.start_time:.2f}s] 推測解碼只用於 GENERATION_BACKEND=generate，連續批次下不啟用")
+            self.speculative = None
+
+        if os.getenv("PROMPT_PREFIX_CACHE", "1") == "1":
+            with self.startup.phase("prefill_prompt_prefix"):
+                self.prefix_cache = PrefixCache(
+                    self.model, max_bytes=int(os.getenv("PREFIX_CACHE_MAX_BYTES", str(256 * 1024 * 1024))))
+                self.prefix_ids = self.tokenizer(PROMPT_PREFIX)["input_ids"]
+                self.prefix_cache.pin(self.prefix_ids)
+
+        # 查詢向量的微批次服務：合併同時到達的查詢，一次encode()完成
+        self.embedding_service = create_embedding_service(self.embedding_model.encode, self.encode_executor)
+
+        if self.generation_backend == "continuous":
+            eos_token_ids = self.model.generation_config.eos_token_id
+            if not isinstance(eos_token_ids, list):
+                eos_token_ids = [eos_token_ids]
+            self.generation_scheduler = GenerationScheduler(
+                self.model,
+                eos_token_ids=[t for t in eos_token_ids + [self.tokenizer.eos_token_id] if t is not None],
+                max_batch_size=int(os.getenv("GENERATION_MAX_BATCH_SIZE", "8")),
+                max_queue=int(os.getenv("GENERATE_QUEUE_SIZE", "8")),
+                temperature=TEMPERATURE,
+                top_p=TOP_P,
+                prefix_cache=self.prefix_cache,
+            )
+            self.generation_scheduler.start()
+
+        if os.getenv("WARMUP", "1") == "1":
+            self.warmup()
+        self.ready = True
+
+    def warmup(self):
+        # 以合成的輸入先跑過一次編碼與生成，讓第一個真正的請求不必負擔
+        # CUDA kernel 選擇、記憶體配置器擴張等冷啟動成本
+        with self.startup.phase("warmup_encode"):
+            for batch_size in (1, self.embedding_service.max_batch_size):
+                self.embedding_model.encode(["台中市的日式料理"] * batch_size)
+        with self.startup.phase("warmup_generate"):
+            # 提示長度接近 /recommend 的實際提示（數百個token）
+            prompt = (PROMPT_PREFIX + "1. 餐廳, 地址: 台中市, 營業時間: 11:00-21:00\n" * 20
+                      + "以下是用戶的需求: 台中市的日式料理\n")
+            input_ids = self.tokenize(prompt)
+            if self.generation_scheduler is not None:
+                self.generation_scheduler.submit(input_ids, WARMUP_NEW_TOKENS).result()
+            else:
+                self._generate(prompt, max_new_tokens=WARMUP_NEW_TOKENS)
+
+    def status(self) -> Dict:
+        return {"ready": self.ready, "startup": self.startup.snapshot(), "device": self.device_config.describe()}
+
+    def version(self) -> Dict:
+        return model_version()
+
+    async def encode(self, text: str) -> np.ndarray:
+        return await self.embedding_service.encode(text)
+
+    def tokenize(self, prompt: str) -> List[int]:
+        # 固定前綴與其餘部分分開編碼，前綴的token與prefill時完全相同，才能重複使用KV快取
+        if self.prefix_ids is not None and prompt.startswith(PROMPT_PREFIX):
+            rest = self.tokenizer(prompt[len(PROMPT_PREFIX):], add_special_tokens=False)["input_ids"]
+            return self.prefix_ids + rest
+        return self.tokenizer(prompt)["input_ids"]
+
+    # 以Gemma 2b生成推薦文字（在generate_executor中執行）
+    # input_ids 為 prompt_builder 預先組好的token id，未提供時才編碼prompt
+    def _generate(self, prompt, streamer=None, max_new_tokens=MAX_NEW_TOKENS, input_ids=None):
+        input_ids = input_ids if input_ids is not None else self.tokenize(prompt)
+        inputs = torch.tensor([input_ids], device=self.model.device)
+        cached, past, logits_processor = 0, None, None
+        # 滑動視窗注意力的模型（如Gemma 2）以推測解碼接續預先填入的KV快取時結果不正確，此時不重用前綴
+        reuse_prefix = self.speculative is None or getattr(self.model.config, "sliding_window", None) is None
+        if self.prefix_cache is not None and reuse_prefix:
+            cached, past = self.prefix_cache.match(input_ids)
+            past = past if past is not None else DynamicCache()
+            logits_processor = LogitsProcessorList([PrefillTimer(self.prefix_cache, len(input_ids) - cached)])
+        speculative_kwargs = self.speculative.generate_kwargs() if self.speculative is not None else {}
+        counting = StepCounter(self.model) if self.speculative is not None else contextlib.nullcontext()
+
+        # 修正警告問題：添加do_sample=True參數
+        print(f"[{time.time() - self.start_time:.2f}s] 執行模型生成，提示長度: {len(input_ids)} tokens（前綴快取 {cached}）")
+        with counting as step_counter:
+            outputs = self.model.generate(
+                input_ids=inputs,
+                attention_mask=torch.ones_like(inputs),
+                past_key_values=past,
+                logits_processor=logits_processor,
+                max_new_tokens=max_new_tokens,  # 減少生成的token數量
+                do_sample=True,  # 添加此參數消除警告
+                temperature=TEMPERATURE,
+                top_p=TOP_P,
+                streamer=streamer,
+                stopping_criteria=StoppingCriteriaList([StreamerCancelled(streamer)]) if streamer else None,
+                **speculative_kwargs,
+            )
+        # 推測解碼在部分transformers版本中最後一步可能超過max_new_tokens，多出的token捨棄
+        new_tokens = outputs[0][len(input_ids):len(input_ids) + max_new_tokens]
+        if self.speculative is not None:
+            self.speculative.record(len(new_tokens), step_counter)
+
+        print(f"[{time.time() - self.start_time:.2f}s] 模型生成完成，解碼輸出...")
+        if self.prefix_cache is not None and reuse_prefix:
+            # generate 原地更新傳入的 DynamicCache，其中前 len(input_ids) 個位置就是這個提示的KV
+            self.prefix_cache.insert(input_ids, cache_tensors(past))
+        # 只解碼新生成的部分
+        return self.tokenizer.decode(new_tokens, skip_special_tokens=True)
+
+    async def generate(self, prompt: str, input_ids: Optional[List[int]] = None) -> str:
+        if self.generation_scheduler is None:
+            return await self.generate_executor.run(self._generate, prompt, input_ids=input_ids)
+        input_ids = input_ids if input_ids is not None else self.tokenize(prompt)
+        print(f"[{time.time() - self.start_time:.2f}s] 加入連續批次生成，提示長度: {len(input_ids)} tokens")
+        output_ids = await asyncio.wrap_future(self.generation_scheduler.submit(input_ids, MAX_NEW_TOKENS))
+        print(f"[{time.time() - self.start_time:.2f}s] 模型生成完成，生成 {len(output_ids)} tokens")
+        return self.tokenizer.decode(output_ids, skip_special_tokens=True)
+
+    # 逐段產生生成的文字；request_start為請求開始的time.time()，用於計算首個token延遲
+    async def stream(self, prompt: str, request_start: float,
+                     input_ids: Optional[List[int]] = None) -> AsyncIterator[str]:
+        loop = asyncio.get_event_loop()
+        if self.generation_scheduler is None:
+            streamer = AsyncTextStreamer(self.tokenizer, loop, skip_prompt=True, request_start=request_start,
+                                         skip_special_tokens=True)
+            future = self.generate_executor.submit(self._generate, prompt, streamer, input_ids=input_ids)
+
+            # model.generate 出錯時不會呼叫 streamer.end()，由此結束串流
+            def end_on_error(f):
+                if f.exception() is not None:
+                    streamer.end()
+            future.add_done_callback(end_on_error)
+        else:
+            streamer = AsyncTextStreamer(self.tokenizer, loop, request_start=request_start, skip_special_tokens=True)
+            input_ids = input_ids if input_ids is not None else self.tokenize(prompt)
+            future = self.generation_scheduler.submit(input_ids, MAX_NEW_TOKENS, streamer)
+
+        try:
+            async for text in streamer:
+                yield text
+        finally:
+            # 客戶端斷線時串流提早關閉，通知生成端停止
+            if not future.done():
+                streamer.cancelled = True
+        # 傳遞生成過程中的例外
+        await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict:
+        return {
+            "executors": {
+                executor.name: executor.stats()
+                for executor in (self.encode_executor, self.generate_executor)
+            },
+            "generation_scheduler": self.generation_scheduler.stats() if self.generation_scheduler else None,
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache else None,
+            "speculative": self.speculative.stats() if self.speculative else None,
+        }
+
+    def shutdown(self):
+        if self.generation_scheduler is not None:
+            self.generation_scheduler.stop()
+        self.encode_executor.shutdown()
+        self.generate_executor.shutdown()
@@ -0,0 +1,135 @@
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 字元二元組（bigram）的詞彙檢索，與向量檢索一起以 reciprocal rank fusion 合併（見 app.py 的 hybrid_search）
+# 中文沒有空白分詞，以連續文字（字母、數字、漢字）中每兩個相鄰字元為一個詞，單獨一個字的片段以該字為詞。
+# 餐廳另外以每個字（unigram）建立索引，「麵」「粥」「茶」這類單字查詢也能找到名稱或描述中含有該字的餐廳；
+# 多字的查詢仍只以二元組比對，排序不受單字影響。
+# 餐廳名稱、描述與地址一起建立倒排索引，名稱的詞頻乘上 FIELD_WEIGHTS 的權重，以BM25計分；
+# 名稱包含完整查詢字串的餐廳再加上 PHRASE_BONUS（名稱完全相同時加兩倍），像「老胡麵館」這類店名查詢會排在最前面；
+# 與向量檢索合併時，名稱與查詢完全相同的餐廳（exact_name_ids）固定排在合併結果的最前面。
+# 索引在記憶體中（CSR格式：每個詞的餐廳位置與預先算好的詞頻分數），不依賴資料庫的分詞或locale設定：
+#   memory 後端：與向量一起載入，位置與檢索矩陣相同，營業中與附近的過濾可以直接套用
+#   pgvector 後端：只載入文字欄位建立索引，取出的餐廳id再到資料庫套用過濾並取回資料
+# 加上詞彙檢索增加的延遲見 benchmarks/bench_hybrid.py
+
+FIELD_WEIGHTS = {"restaurant_name": 3.0, "description": 1.0, "restaurant_address": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+PHRASE_BONUS = 10.0
+# 加分只檢查BM25分數最高的這麼多倍 limit 家餐廳的名稱
+PHRASE_CHECK_FACTOR = 5
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text) -> str:
+    # 全形轉半形、英文小寫
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def exact_name_ids(query: str, rows: List[Dict]) -> List[int]:
+    # 名稱與查詢完全相同（正規化後）的餐廳id，依 rows 的順序
+    phrase = normalize(query).strip()
+    return [row["id"] for row in rows if phrase and normalize(row.get("restaurant_name")).strip() == phrase]
+
+
+def tokens(text) -> List[str]:
+    # 查詢的詞：每段連續文字的二元組，單獨一個字的片段為該字
+    result = []
+    for run in _WORD.findall(normalize(text)):
+        if len(run) == 1:
+            result.append(run)
+        else:
+            result.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return result
+
+
+def document_tokens(text) -> List[str]:
+    # 餐廳的詞：二元組加上每個字，單字查詢才能比對到多字片段中的字
+    result = []
+    for run in _WORD.findall(normalize(text)):
+        result.extend(run)
+        result.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return result
+
+
+class LexicalIndex:
+    def __init__(self):
+        self.vocabulary: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings = np.empty(0, dtype=np.int32)
+        self.weights = np.empty(0, dtype=np.float32)
+        self.idf = np.empty(0, dtype=np.float32)
+        self.names: List[str] = []
+
+    @property
+    def size(self) -> int:
+        return len(self.names)
+
+    def build(self, rows: List[Dict]) -> "LexicalIndex":
+        # rows 的順序即為位置；回傳 self 方便串接
+        vocabulary: Dict[str, int] = {}
+        doc_positions, token_ids, frequencies, lengths = [], [], [], []
+        for position, row in enumerate(rows):
+            counts: Counter = Counter()
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in document_tokens(row.get(field)):
+                    counts[token] += weight
+            lengths.append(sum(counts.values()))
+            for token, frequency in counts.items():
+                doc_positions.append(position)
+                token_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+                frequencies.append(frequency)
+
+        doc_positions = np.array(doc_positions, dtype=np.int32)
+        token_ids = np.array(token_ids, dtype=np.int64)
+        frequencies = np.array(frequencies, dtype=np.float32)
+        lengths = np.array(lengths, dtype=np.float32)
+        # BM25的詞頻部分只與餐廳有關，建索引時先算好；查詢時只需乘上idf再加總
+        average = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_positions] / average)
+        weights = frequencies * (BM25_K1 + 1) / (frequencies + norm)
+
+        order = np.argsort(token_ids, kind="stable")
+        counts = np.bincount(token_ids, minlength=len(vocabulary))
+        self.vocabulary = vocabulary
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.postings = doc_positions[order]
+        self.weights = weights[order].astype(np.float32)
+        self.idf = np.log(1 + (len(rows) - counts + 0.5) / (counts + 0.5)).astype(np.float32)
+        self.names = [normalize(row.get("restaurant_name")).strip() for row in rows]
+        return self
+
+    def search(self, query: str, limit: int, candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        # 回傳分數最高的 (位置, 分數)，只含分數大於0的餐廳；candidates 為允許的位置（由小到大），None表示不限制
+        token_ids = {self.vocabulary[token] for token in tokens(query) if token in self.vocabulary}
+        if not token_ids or limit <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = np.zeros(self.size, dtype=np.float32)
+        for token_id in token_ids:
+            start, end = self.offsets[token_id], self.offsets[token_id + 1]
+            scores[self.postings[start:end]] += self.idf[token_id] * self.weights[start:end]
+        if candidates is not None:
+            allowed = np.zeros(self.size, dtype=bool)
+            allowed[candidates] = True
+            scores[~allowed] = 0
+        matched = np.flatnonzero(scores > 0)
+        check = matched
+        if len(matched) > limit * PHRASE_CHECK_FACTOR:
+            check = matched[np.argpartition(-scores[matched], limit * PHRASE_CHECK_FACTOR - 1)[:limit * PHRASE_CHECK_FACTOR]]
+        phrase = normalize(query).strip()
+        if phrase:
+            for position in check:
+                if phrase == self.names[position]:
+                    scores[position] += 2 * PHRASE_BONUS
+                elif phrase in self.names[position]:
+                    scores[position] += PHRASE_BONUS
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        order = matched[np.argsort(-scores[matched], kind="stable")]
+        return order.astype(np.int64), scores[order]
@@ -0,0 +1,136 @@
+import bisect
+import contextlib
+import json
+import threading
+import time
+from typing import Dict, List
+
+# 簡單的行程內指標：直方圖、計數器與量表，由 /metrics 端點輸出
+
+
+class Histogram:
+    def __init__(self, name: str, buckets: List[float]):
+        self.name = name
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._count += 1
+            self._sum += value
+
+    def _quantile(self, q: float) -> float:
+        # 以桶的上界近似分位數
+        target = q * self._count
+        seen = 0
+        for bound, count in zip(self.buckets + [float("inf")], self._counts):
+            seen += count
+            if seen >= target:
+                return bound if bound != float("inf") else self.buckets[-1]
+        return 0.0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            labels = [f"le_{bound:g}" for bound in self.buckets] + ["le_inf"]
+            return {
+                "count": self._count,
+                "sum": self._sum,
+                "mean": self._sum / self._count if self._count else 0.0,
+                "p50": self._quantile(0.5) if self._count else 0.0,
+                "p99": self._quantile(0.99) if self._count else 0.0,
+                "buckets": dict(zip(labels, self._counts)),
+            }
+
+
+class Counter:
+    def __init__(self, name: str):
+        self.name = name
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    def __init__(self, name: str):
+        self.name = name
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def snapshot(self):
+        return self.value
+
+
+class PhaseTimer:
+    # 記錄各階段的耗時（例如啟動時的模型載入與暖機），每個階段結束時輸出一行JSON
+    def __init__(self, name: str):
+        self.name = name
+        self.phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, phase: str):
+        phase_start = time.perf_counter()
+        status = "error"
+        try:
+            yield
+            status = "ok"
+        finally:
+            elapsed = time.perf_counter() - phase_start
+            with self._lock:
+                self.phases[phase] = elapsed
+            print(json.dumps({"event": self.name, "phase": phase, "status": status, "seconds": round(elapsed, 3)},
+                             ensure_ascii=False))
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.phases)
+
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(name, factory):
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = factory()
+        return _registry[name]
+
+
+def histogram(name: str, buckets: List[float]) -> Histogram:
+    return _get_or_create(name, lambda: Histogram(name, buckets))
+
+
+def counter(name: str) -> Counter:
+    return _get_or_create(name, lambda: Counter(name))
+
+
+def gauge(name: str) -> Gauge:
+    return _get_or_create(name, lambda: Gauge(name))
+
+
+def phase_timer(name: str) -> PhaseTimer:
+    return _get_or_create(name, lambda: PhaseTimer(name))
+
+
+def snapshot() -> Dict:
+    with _registry_lock:
+        metrics = dict(_registry)
+    return {name: metric.snapshot() for name, metric in sorted(metrics.items())}
+
+
+# 常用的桶
+LATENCY_MS_BUCKETS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
@@ -0,0 +1,181 @@
+import asyncio
+import inspect
+import itertools
+import os
+import pickle
+import struct
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from executors import ExecutorBusy
+
+# 多行程模式下HTTP worker與 model_server.py 之間的本機socket協定
+# 位址: MODEL_SERVER_ADDRESS=127.0.0.1:8100（TCP）或 unix:/tmp/eatwhat-model.sock
+# 每個訊息為 4位元組長度 + pickle 內容，長度超過 MODEL_SERVER_MAX_FRAME_MB（預設64）時直接斷線。
+# 連線建立後客戶端先以未經pickle的原始位元組送出 MODEL_SERVER_AUTHKEY，
+# 伺服器比對通過後才開始解開pickle，未驗證的連線無法讓伺服器執行任何反序列化。
+# 只應綁定在本機位址：pickle 內容來自受信任的同機行程。
+#   請求: (request_id, target, method, args)
+#   回應: (request_id, kind, payload)，kind 為 result | error | item | end
+# 同一條連線上可同時進行多個請求；串流方法以多個 item 回應，最後送出 end。
+
+_HEADER = struct.Struct("!I")
+MAX_FRAME_BYTES = int(float(os.getenv("MODEL_SERVER_MAX_FRAME_MB", "64")) * 1024 * 1024)
+# 驗證訊息只含authkey，不需要大的上限
+MAX_AUTH_FRAME_BYTES = 1024
+
+
+async def read_bytes(reader: asyncio.StreamReader, limit: int = MAX_FRAME_BYTES) -> bytes:
+    header = await reader.readexactly(_HEADER.size)
+    size = _HEADER.unpack(header)[0]
+    if size > limit:
+        # 先檢查長度再讀取，避免對方以長度欄位要求配置過大的記憶體
+        raise ConnectionError(f"訊息長度 {size} 超過上限 {limit}")
+    return await reader.readexactly(size)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Any:
+    return pickle.loads(await read_bytes(reader))
+
+
+def encode_bytes(payload: bytes) -> bytes:
+    return _HEADER.pack(len(payload)) + payload
+
+
+def encode_frame(message: Any) -> bytes:
+    return encode_bytes(pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+async def open_connection(address: str) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    if address.startswith("unix:"):
+        return await asyncio.open_unix_connection(address[len("unix:"):])
+    host, port = address.rsplit(":", 1)
+    return await asyncio.open_connection(host, int(port))
+
+
+class RemoteError(Exception):
+    pass
+
+
+def _remote_exception(payload) -> Exception:
+    # 佇列已滿的錯誤保留原本的類型，API層才能回傳503
+    name, message = payload
+    if name == "ExecutorBusy":
+        return ExecutorBusy(message)
+    return RemoteError(f"{name}: {message}")
+
+
+class ModelClient:
+    def __init__(self, address: str, authkey: str = ""):
+        self.address = address
+        self.authkey = authkey
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._pending: Dict[int, asyncio.Queue] = {}
+        self._ids = itertools.count()
+
+    async def _connection(self):
+        # 第一次呼叫時才連線（需要在worker自己的事件迴圈中建立）；斷線後下一次呼叫重新連線
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is None:
+                reader, writer = await open_connection(self.address)
+                writer.write(encode_bytes(self.authkey.encode()))
+                self._reader, self._writer = reader, writer
+                self._write_lock = asyncio.Lock()
+                asyncio.ensure_future(self._read_loop(reader))
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                request_id, kind, payload = await read_frame(reader)
+                queue = self._pending.get(request_id)
+                if queue is not None:
+                    queue.put_nowait((kind, payload))
+        except Exception as e:
+            error = ("ConnectionError", f"與model server的連線中斷: {e}")
+        self._reader, self._writer = None, None
+        for queue in self._pending.values():
+            queue.put_nowait(("error", error))
+
+    async def _send(self, message):
+        await self._connection()
+        writer = self._writer
+        # Python 3.8 的 StreamWriter 不允許同時呼叫 drain()
+        async with self._write_lock:
+            writer.write(encode_frame(message))
+            await writer.drain()
+
+    async def call(self, target: str, method: str, *args) -> Any:
+        request_id = next(self._ids)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._pending[request_id] = queue
+        try:
+            await self._send((request_id, target, method, args))
+            kind, payload = await queue.get()
+        finally:
+            self._pending.pop(request_id, None)
+        if kind == "error":
+            raise _remote_exception(payload)
+        return payload
+
+    async def stream(self, target: str, method: str, *args) -> AsyncIterator[Any]:
+        request_id = next(self._ids)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._pending[request_id] = queue
+        finished = False
+        try:
+            await self._send((request_id, target, method, args))
+            while True:
+                kind, payload = await queue.get()
+                if kind == "item":
+                    yield payload
+                    continue
+                finished = True
+                if kind == "error":
+                    raise _remote_exception(payload)
+                return
+        finally:
+            self._pending.pop(request_id, None)
+            if not finished and self._writer is not None:
+                # 客戶端提早結束串流，通知model server停止生成
+                try:
+                    await self._send((request_id, target, "cancel", ()))
+                except (ConnectionError, OSError):
+                    pass
+
+    def proxy(self, target: str, streams=()) -> "RemoteProxy":
+        return RemoteProxy(self, target, set(streams))
+
+
+class RemoteProxy:
+    # 把 model server 上的物件包裝成本地物件：一般方法回傳協程，streams 中的方法回傳非同步迭代器
+    def __init__(self, client: ModelClient, target: str, streams):
+        self._client = client
+        self._target = target
+        self._streams = streams
+
+    def __getattr__(self, name: str):
+        if name in self._streams:
+            return lambda *args: self._client.stream(self._target, name, *args)
+
+        async def call(*args):
+            return await self._client.call(self._target, name, *args)
+        return call
+
+
+class LocalProxy:
+    # 單行程模式：以與 RemoteProxy 相同的非同步介面包裝行程內的物件
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name: str):
+        method = getattr(self._target, name)
+        if inspect.iscoroutinefunction(method) or inspect.isasyncgenfunction(method):
+            return method
+
+        async def call(*args):
+            return method(*args)
+        return call
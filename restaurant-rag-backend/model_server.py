@@ -0,0 +1,151 @@
+import asyncio
+import hmac
+import inspect
+import os
+import time
+import traceback
+from typing import Dict
+
+from dotenv import load_dotenv
+
+from cache import create_cache
+from executors import ExecutorBusy
+import metrics
+from inference import InferenceService
+from model_client import MAX_AUTH_FRAME_BYTES, encode_frame, read_bytes, read_frame
+from semantic_cache import create_semantic_cache
+
+# 多行程模式的模型伺服器：唯一持有模型權重與共用快取的行程。
+# 所有HTTP worker（python serve.py --workers N 啟動）經由本機socket呼叫這裡的
+# 查詢編碼、生成與快取，因此：
+#   - 模型只載入一份，worker數量不影響GPU/記憶體用量
+#   - 不同worker的查詢仍能合併成同一個編碼批次、同一個連續生成批次
+#   - 精確比對與語意快取在worker之間共用
+# 通常由 serve.py 啟動，也可單獨執行: python model_server.py
+
+# 載入環境變數
+load_dotenv()
+
+start_time = time.time()
+
+# 可遠端呼叫的物件與方法（其他屬性一律拒絕）
+ALLOWED_METHODS = {
+    "inference": {"encode", "generate", "stream", "stats", "status", "version"},
+    "query_cache": {"get", "set", "stats", "clear"},
+    "semantic_cache": {"lookup", "add", "stats", "clear"},
+    "metrics": {"snapshot"},
+}
+
+
+class ModelServer:
+    def __init__(self, targets: Dict[str, object], authkey: str):
+        if not authkey:
+            raise ValueError("MODEL_SERVER_AUTHKEY 不可為空")
+        self.targets = targets
+        self.authkey = authkey.encode()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # 驗證訊息是原始位元組，比對通過前不解開任何pickle
+        try:
+            authkey = await read_bytes(reader, MAX_AUTH_FRAME_BYTES)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        if not hmac.compare_digest(authkey, self.authkey):
+            print(f"[{time.time() - start_time:.2f}s] 拒絕未通過驗證的連線")
+            writer.close()
+            return
+
+        write_lock = asyncio.Lock()
+        tasks: Dict[int, asyncio.Task] = {}
+
+        async def send(message):
+            async with write_lock:
+                writer.write(encode_frame(message))
+                await writer.drain()
+
+        try:
+            while True:
+                request_id, target, method, args = await read_frame(reader)
+                if method == "cancel":
+                    task = tasks.get(request_id)
+                    if task is not None:
+                        task.cancel()
+                    continue
+                task = asyncio.ensure_future(self.dispatch(send, request_id, target, method, args))
+                tasks[request_id] = task
+                task.add_done_callback(lambda _, request_id=request_id: tasks.pop(request_id, None))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # worker離線：取消它尚未完成的請求（例如進行中的串流生成）
+            for task in list(tasks.values()):
+                task.cancel()
+        finally:
+            writer.close()
+
+    async def dispatch(self, send, request_id: int, target: str, method: str, args):
+        try:
+            if method not in ALLOWED_METHODS.get(target, ()) or target not in self.targets:
+                raise AttributeError(f"不允許的遠端呼叫: {target}.{method}")
+            function = getattr(self.targets[target], method)
+            if inspect.isasyncgenfunction(function):
+                async for item in function(*args):
+                    await send((request_id, "item", item))
+                await send((request_id, "end", None))
+                return
+            result = function(*args)
+            if inspect.isawaitable(result):
+                result = await result
+            await send((request_id, "result", result))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not isinstance(e, ExecutorBusy):
+                traceback.print_exc()
+            try:
+                await send((request_id, "error", (type(e).__name__, str(e))))
+            except ConnectionError:
+                pass
+
+
+async def serve(address: str, server: ModelServer):
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        if os.path.exists(path):
+            os.remove(path)
+        listener = await asyncio.start_unix_server(server.handle_connection, path)
+    else:
+        host, port = address.rsplit(":", 1)
+        listener = await asyncio.start_server(server.handle_connection, host, int(port))
+    print(f"[{time.time() - start_time:.2f}s] 模型伺服器已啟動: {address}")
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    address = os.getenv("MODEL_SERVER_ADDRESS", "127.0.0.1:8100")
+    authkey = os.getenv("MODEL_SERVER_AUTHKEY", "")
+    if not authkey:
+        # 空的authkey等於不驗證：任何連得到socket的行程都能送出pickle讓伺服器執行
+        raise SystemExit("請設定 MODEL_SERVER_AUTHKEY（serve.py 啟動時會自動產生）")
+
+    inference = InferenceService(start_time)
+    inference.load()
+    targets = {
+        "inference": inference,
+        "query_cache": create_cache("query"),
+        "metrics": metrics,
+    }
+    semantic_cache = create_semantic_cache("semantic")
+    if semantic_cache is not None:
+        targets["semantic_cache"] = semantic_cache
+
+    try:
+        asyncio.run(serve(address, ModelServer(targets, authkey)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        inference.shutdown()
+
+
+if __name__ == "__main__":
+    main()
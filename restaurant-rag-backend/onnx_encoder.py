@@ -0,0 +1,195 @@
+import argparse
+import inspect
+import json
+import os
+from typing import List, Union
+
+import numpy as np
+from transformers import AutoTokenizer
+
+# Sentence Transformer 的ONNX Runtime推理路徑，需要安裝onnxruntime（pip install onnxruntime onnx）
+# 單筆查詢時PyTorch的Python與運算子分派開銷佔了編碼時間的大部分，ONNX Runtime以整張最佳化過的計算圖執行。
+# 先匯出（並與PyTorch輸出比對餘弦相似度）:
+#   python onnx_encoder.py --quantize int8
+# 再以 EMBEDDING_BACKEND=onnx 啟動服務：
+# EMBEDDING_BACKEND=torch（預設）| onnx
+# EMBEDDING_ONNX_PATH=models/sentence-transformer-onnx   匯出的目錄
+# EMBEDDING_ONNX_QUANTIZE=none（預設）| int8               使用動態量化的int8模型
+# 延遲與吞吐量比較見 benchmarks/bench_onnx_encoder.py
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+ENCODER_CONFIG_FILE = "encoder_config.json"
+PARITY_SENTENCES = [
+    "台中市的日式料理",
+    "適合家庭聚餐的火鍋店",
+    "高雄的素食餐廳，最好有停車位",
+    "深夜還有營業的拉麵",
+    "cheap breakfast near Taipei Main Station",
+    "咖啡",
+]
+
+
+def read_sentence_transformer_config(model_path: str) -> dict:
+    # 由 modules.json 找出 Transformer / Pooling / Normalize 模組的設定
+    with open(os.path.join(model_path, "modules.json"), encoding="utf-8") as f:
+        modules = json.load(f)
+    config = {"transformer_path": model_path, "pooling_mode": "mean", "normalize": False, "max_seq_length": 128}
+    for module in modules:
+        module_type = module["type"]
+        module_path = os.path.join(model_path, module["path"])
+        if module_type.endswith("Transformer"):
+            config["transformer_path"] = module_path
+            bert_config = os.path.join(module_path, "sentence_bert_config.json")
+            if os.path.exists(bert_config):
+                with open(bert_config, encoding="utf-8") as f:
+                    config["max_seq_length"] = json.load(f).get("max_seq_length", config["max_seq_length"])
+        elif module_type.endswith("Pooling"):
+            with open(os.path.join(module_path, "config.json"), encoding="utf-8") as f:
+                pooling = json.load(f)
+            if "pooling_mode" in pooling:
+                config["pooling_mode"] = pooling["pooling_mode"]
+            elif pooling.get("pooling_mode_cls_token"):
+                config["pooling_mode"] = "cls"
+        elif module_type.endswith("Normalize"):
+            config["normalize"] = True
+        else:
+            raise ValueError(f"ONNX匯出不支援的模組: {module_type}")
+    if config["pooling_mode"] not in ("mean", "cls"):
+        raise ValueError(f"ONNX匯出不支援的pooling方式: {config['pooling_mode']}")
+    return config
+
+
+def export(model_path: str, output_dir: str, quantize: bool = False, opset: int = 17):
+    import torch
+    from transformers import AutoModel
+
+    config = read_sentence_transformer_config(model_path)
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(config["transformer_path"])
+    model = AutoModel.from_pretrained(config["transformer_path"])
+    model.eval()
+
+    # 匯出到 last_hidden_state 為止，pooling 在 encode() 中以numpy完成
+    class Wrapper(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    sample = tokenizer(PARITY_SENTENCES[:2], padding=True, return_tensors="pt")
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            Wrapper(model),
+            (sample["input_ids"], sample["attention_mask"]),
+            os.path.join(output_dir, ONNX_MODEL_FILE),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=opset,
+            **export_kwargs,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        # 權重轉為int8，推理時依輸入動態量化激活值
+        quantize_dynamic(os.path.join(output_dir, ONNX_MODEL_FILE), os.path.join(output_dir, ONNX_INT8_MODEL_FILE),
+                         weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, ENCODER_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({key: value for key, value in config.items() if key != "transformer_path"}, f, indent=2)
+
+
+class OnnxEncoder:
+    def __init__(self, model_dir: str, quantized: bool = False, num_threads: int = 0):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("EMBEDDING_BACKEND=onnx 需要安裝onnxruntime: pip install onnxruntime")
+
+        with open(os.path.join(model_dir, ENCODER_CONFIG_FILE), encoding="utf-8") as f:
+            config = json.load(f)
+        self.pooling_mode = config["pooling_mode"]
+        self.normalize = config["normalize"]
+        self.max_seq_length = config["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        model_file = ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    # 與 SentenceTransformer.encode 相同：單一字串回傳一維向量，字串列表回傳二維矩陣
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        embeddings = [self._encode_batch(sentences[i:i + batch_size]) for i in range(0, len(sentences), batch_size)]
+        embeddings = np.concatenate(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+    def _encode_batch(self, sentences: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(sentences, padding=True, truncation=True, max_length=self.max_seq_length,
+                                 return_tensors="np")
+        feed = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(None, feed)[0]
+
+        if self.pooling_mode == "cls":
+            embeddings = hidden[:, 0]
+        else:
+            mask = encoded["attention_mask"][:, :, None].astype(np.float32)
+            embeddings = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype(np.float32)
+
+
+def cosine_parity(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    # 每一列與PyTorch輸出的餘弦相似度
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return (reference * candidate).sum(axis=1)
+
+
+def main():
+    from sentence_transformers import SentenceTransformer
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="models/sentence-transformer")
+    parser.add_argument("--output", default=os.getenv("EMBEDDING_ONNX_PATH", "models/sentence-transformer-onnx"))
+    parser.add_argument("--quantize", choices=["none", "int8"], default="none")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="低於此相似度視為匯出失敗")
+    args = parser.parse_args()
+
+    print(f"匯出 {args.model} 至 {args.output} ...")
+    export(args.model, args.output, quantize=args.quantize == "int8")
+
+    reference = SentenceTransformer(args.model, device="cpu").encode(PARITY_SENTENCES)
+    failed = False
+    for quantized in ([False, True] if args.quantize == "int8" else [False]):
+        similarity = cosine_parity(reference, OnnxEncoder(args.output, quantized=quantized).encode(PARITY_SENTENCES))
+        ok = similarity.min() >= args.min_cosine
+        failed = failed or not ok
+        print(f"{'int8' if quantized else 'fp32'}: 餘弦相似度 最小={similarity.min():.6f} 平均={similarity.mean():.6f} "
+              f"{'通過' if ok else '未通過'}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import psycopg2.extras
+
+# 營業時間的結構化儲存與「營業中」過濾
+# process_data.py 由原始資料的 ServiceTimes 產生 service_hours（每個時段的星期、開始/結束時間與生效/失效日期），
+# 載入時轉成以一週中的分鐘數表示的區間（星期一00:00為0，[開始, 結束)），與生效期間一起存在 restaurant_hours 表：
+#   open_minutes int4range、effective daterange（失效日當天仍有效），兩欄共用一個GiST索引
+# 跨午夜的時段延伸到隔天，週日跨到週一的部分拆成兩段；開始與結束都是00:00:00的時段（公休日）不產生區間。
+# /search 與 /recommend 的 open_at（沒有時區時視為台灣時間）轉成一週中的分鐘數與日期，在向量排序前過濾：
+#   pgvector 後端：以GiST索引找出營業中的餐廳，只在其中依向量距離排序
+#   memory 後端：區間陣列與向量一起載入，以numpy找出營業中的餐廳，只對其向量計算相似度
+# 過濾與排序的耗時見 benchmarks/bench_open_at.py
+
+HOURS_TABLE = "restaurant_hours"
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+TAIWAN = timezone(timedelta(hours=8))
+# 沒有生效/失效日期時的界限（date.toordinal）
+_MIN_DAY = 0
+_MAX_DAY = date.max.toordinal()
+
+
+def parse_date(value) -> Optional[date]:
+    # 接受「2024-01-01」或「2024-01-01T00:00:00+08:00」，無法解析時視為沒有限制
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _minutes(value) -> Optional[int]:
+    try:
+        parts = [int(part) for part in str(value).split(":")[:2]]
+    except ValueError:
+        return None
+    if len(parts) != 2 or not (0 <= parts[0] <= 24 and 0 <= parts[1] < 60):
+        return None
+    return parts[0] * 60 + parts[1]
+
+
+def weekly_intervals(service_hours) -> List[Tuple[int, int, Optional[date], Optional[date]]]:
+    # service_hours 轉成 (開始分鐘, 結束分鐘, 生效日, 失效日) 的列表
+    intervals = []
+    for slot in service_hours or []:
+        start, end = _minutes(slot.get("start")), _minutes(slot.get("end"))
+        if start is None or end is None or (start == 0 and end == 0):
+            continue
+        if end <= start:
+            end += MINUTES_PER_DAY
+        effective, expire = parse_date(slot.get("effective_date")), parse_date(slot.get("expire_date"))
+        for day in slot.get("days", []):
+            if day not in WEEKDAYS:
+                continue
+            offset = WEEKDAYS.index(day) * MINUTES_PER_DAY
+            if offset + end > MINUTES_PER_WEEK:
+                intervals.append((offset + start, MINUTES_PER_WEEK, effective, expire))
+                intervals.append((0, offset + end - MINUTES_PER_WEEK, effective, expire))
+            else:
+                intervals.append((offset + start, offset + end, effective, expire))
+    return intervals
+
+
+def open_at_key(open_at: datetime) -> Tuple[int, date]:
+    # 台灣時間的 (一週中的分鐘數, 日期)
+    if open_at.tzinfo is not None:
+        open_at = open_at.astimezone(TAIWAN)
+    return open_at.weekday() * MINUTES_PER_DAY + open_at.hour * 60 + open_at.minute, open_at.date()
+
+
+def create_hours_table(cur, table: str = HOURS_TABLE):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            restaurant_id INTEGER NOT NULL,
+            open_minutes int4range NOT NULL,
+            effective daterange NOT NULL DEFAULT '(,)'
+        )
+    """)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_open_idx ON {table} USING gist (open_minutes, effective)")
+
+
+def hours_rows(restaurants: Iterable[Dict], ids: Dict[str, int]):
+    # restaurants 為 generate_embeddings.py 讀入的餐廳，ids 為 restaurant_id 到資料庫id的對應
+    for restaurant in restaurants:
+        restaurant_id = ids.get(restaurant.get("restaurant_id"))
+        if restaurant_id is None:
+            continue
+        for start, end, effective, expire in weekly_intervals(restaurant.get("service_hours")):
+            yield (restaurant_id, psycopg2.extras.NumericRange(start, end, "[)"),
+                   psycopg2.extras.DateRange(effective, expire, "[]"))
+
+
+def load_hours(cur, restaurants: List[Dict], table: str = "restaurants", hours_table: str = HOURS_TABLE,
+               page_size: int = 5000) -> int:
+    # 依來源重寫整個營業時間表（不需編碼，重寫比比對變更簡單）；以DELETE而非TRUNCATE，提交前查詢仍看得到舊資料
+    cur.execute(f"SELECT restaurant_id, id FROM {table} WHERE restaurant_id IS NOT NULL")
+    ids = dict(cur.fetchall())
+    cur.execute(f"DELETE FROM {hours_table}")
+    rows = list(hours_rows(restaurants, ids))
+    psycopg2.extras.execute_values(
+        cur, f"INSERT INTO {hours_table} (restaurant_id, open_minutes, effective) VALUES %s", rows,
+        page_size=page_size)
+    return len(rows)
+
+
+class OpeningHours:
+    # 記憶體中的營業時間：每個區間一列，rows 為餐廳在檢索矩陣中的位置
+    def __init__(self, rows: np.ndarray, start: np.ndarray, end: np.ndarray,
+                 effective: np.ndarray, expire: np.ndarray):
+        self.rows = rows
+        self.start = start
+        self.end = end
+        self.effective = effective
+        self.expire = expire
+
+    @classmethod
+    def from_records(cls, records, id_to_row: Dict[int, int]) -> "OpeningHours":
+        # records: (資料庫id, 開始分鐘, 結束分鐘, 生效日或None, 失效日或None)，不在檢索矩陣中的餐廳略過
+        records = [record for record in records if record[0] in id_to_row]
+        return cls(
+            np.array([id_to_row[record[0]] for record in records], dtype=np.int64),
+            np.array([record[1] for record in records], dtype=np.int32),
+            np.array([record[2] for record in records], dtype=np.int32),
+            np.array([record[3].toordinal() if record[3] else _MIN_DAY for record in records], dtype=np.int64),
+            np.array([record[4].toordinal() if record[4] else _MAX_DAY for record in records], dtype=np.int64),
+        )
+
+    def open_rows(self, open_at: datetime) -> np.ndarray:
+        # 營業中的餐廳在檢索矩陣中的位置（由小到大）
+        minute, day = open_at_key(open_at)
+        day = day.toordinal()
+        mask = (self.start <= minute) & (minute < self.end) & (self.effective <= day) & (day <= self.expire)
+        return np.unique(self.rows[mask])
@@ -0,0 +1,64 @@
+import struct
+
+import numpy as np
+import psycopg2.extensions
+
+# pgvector 與 psycopg2 之間的向量轉換
+# psycopg2 的查詢參數只支援文字協定，因此這裡把 float32 陣列以 %.9g 一次格式化：
+# 9位有效數字可以無損還原 float32，字串比 str(float) 的17位短約四成，Postgres解析也更快。
+# 大量載入改用 COPY ... FROM STDIN (FORMAT binary)（見 generate_embeddings.py），向量以pgvector的二進位格式傳送，
+# 不需要格式化與解析文字：int16 維度 + int16 保留欄位(0) + 維度個 big-endian float4。
+
+_formats = {}
+
+
+def _vector_format(dim: int) -> str:
+    # 每種維度只建立一次格式字串，之後以單次 % 運算完成整個向量的格式化
+    fmt = _formats.get(dim)
+    if fmt is None:
+        fmt = _formats[dim] = "[" + ",".join(["%.9g"] * dim) + "]"
+    return fmt
+
+
+def to_vector_literal(vector) -> str:
+    values = np.asarray(vector, dtype=np.float32).ravel().tolist()
+    return _vector_format(len(values)) % tuple(values)
+
+
+def vectors_to_binary(vectors) -> list:
+    # 一批向量轉成COPY二進位格式的欄位值（不含欄位長度），整批一次轉換位元組順序
+    vectors = np.asarray(vectors, dtype=">f4")
+    header = struct.pack("!hh", vectors.shape[1], 0)
+    return [header + vector.tobytes() for vector in vectors]
+
+
+def parse_vector(text):
+    # pgvector 的文字格式為 [1,2,3]
+    if text is None:
+        return None
+    return np.fromstring(text[1:-1], sep=",", dtype=np.float32)
+
+
+class VectorAdapter:
+    # 讓 numpy 陣列可以直接作為查詢參數，輸出 '[...]'::vector
+    def __init__(self, vector):
+        self.vector = vector
+
+    def getquoted(self):
+        return f"'{to_vector_literal(self.vector)}'::vector".encode("ascii")
+
+
+def register_vector(conn):
+    # numpy 陣列 -> vector 參數；vector 欄位 -> numpy float32 陣列
+    # 類型OID需要透過連接查詢，註冊後對所有連接生效
+    psycopg2.extensions.register_adapter(np.ndarray, VectorAdapter)
+
+    cur = conn.cursor()
+    cur.execute("SELECT to_regtype('vector')::oid")
+    oid = cur.fetchone()[0]
+    cur.close()
+    if oid is None:
+        raise psycopg2.ProgrammingError("資料庫中沒有vector類型，請先執行 setup_db.py 安裝pgvector擴展")
+
+    vector_type = psycopg2.extensions.new_type((oid,), "VECTOR", lambda value, cur: parse_vector(value))
+    psycopg2.extensions.register_type(vector_type)
@@ -0,0 +1,212 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from transformers import DynamicCache, LogitsProcessor
+
+import metrics
+from generation_scheduler import cache_tensors, tensors_to_cache
+
+# 跨請求的提示前綴KV快取（radix tree）：以token id序列為鍵，每個節點保存一段token及其各層的KV，
+# 新請求從最長的已快取前綴接著prefill，只需計算之後的部分。
+#   - 固定的指示文字（prompt_builder.PROMPT_PREFIX）啟動時prefill並固定（pinned），不會被淘汰
+#   - 熱門地區的查詢常得到相同順序的前幾名餐廳，提示中餐廳列表放在用戶查詢之前，這段也能共用
+#   - 總KV大小超過 PREFIX_CACHE_MAX_BYTES 時，依最近使用時間淘汰葉節點（LRU）
+# DynamicCache 以串接（torch.cat）產生新的張量來附加新token，不會修改快取中的張量。
+# PROMPT_PREFIX_CACHE=1（預設）| 0
+# PREFIX_CACHE_MAX_BYTES=268435456（256MB）
+# 以重播查詢流量比較命中率與prefill時間見 benchmarks/bench_prefix_cache.py
+
+
+class PrefillTimer(LogitsProcessor):
+    # model.generate 第一次呼叫logits processor時prefill剛完成，以此量測prefill耗時
+    def __init__(self, prefix_cache: "PrefixCache", tokens: int):
+        self.prefix_cache = prefix_cache
+        self.tokens = tokens
+        self.start = time.perf_counter()
+        self.done = False
+
+    def __call__(self, input_ids, scores):
+        if not self.done:
+            self.done = True
+            self.prefix_cache.record_prefill(self.tokens, (time.perf_counter() - self.start) * 1000)
+        return scores
+
+
+class RadixNode:
+    __slots__ = ("tokens", "layers", "children", "parent", "last_access", "nbytes", "pinned")
+
+    def __init__(self, tokens: Tuple[int, ...], layers: List, parent: Optional["RadixNode"]):
+        self.tokens = tokens
+        self.layers = layers  # 每層的 (key, value)，形狀為 [1, heads, len(tokens), head_dim]
+        self.children: Dict[int, "RadixNode"] = {}
+        self.parent = parent
+        self.last_access = time.monotonic()
+        self.nbytes = sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in layers)
+        self.pinned = False
+
+
+def _slice(layers: List, start: int, end: Optional[int] = None) -> List:
+    # 複製成獨立的張量，淘汰節點時才能真正釋放記憶體
+    return [(k[:, :, start:end].clone(), v[:, :, start:end].clone()) for k, v in layers]
+
+
+def _common_length(tokens: Tuple[int, ...], input_ids: List[int], start: int) -> int:
+    length = 0
+    for token, input_id in zip(tokens, input_ids[start:start + len(tokens)]):
+        if token != input_id:
+            break
+        length += 1
+    return length
+
+
+class PrefixCache:
+    def __init__(self, model, max_bytes: int = 256 * 1024 * 1024):
+        self.model = model
+        self.max_bytes = max_bytes
+        self.root = RadixNode((), [], None)
+        self.nbytes = 0
+        self.node_count = 0
+        self.ms_per_token = 0.0  # 近期prefill每個token的平均耗時，用來估計命中省下的時間
+        self._lock = threading.Lock()
+
+        self.hits = metrics.counter("prompt_prefix_cache_hits_total")
+        self.misses = metrics.counter("prompt_prefix_cache_misses_total")
+        self.prompt_tokens = metrics.counter("prompt_prefix_cache_prompt_tokens_total")
+        self.hit_tokens = metrics.counter("prompt_prefix_cache_hit_tokens_total")
+        self.evictions = metrics.counter("prompt_prefix_cache_evictions_total")
+        self.bytes_gauge = metrics.gauge("prompt_prefix_cache_bytes")
+        self.saved_ms = metrics.histogram("prompt_prefix_cache_saved_ms", metrics.LATENCY_MS_BUCKETS)
+        self.prefill_ms = metrics.histogram("prompt_prefix_cache_prefill_ms", metrics.LATENCY_MS_BUCKETS)
+
+    @torch.no_grad()
+    def pin(self, token_ids: List[int]):
+        # prefill固定前綴並放入快取，之後不會被淘汰
+        prefill_start = time.perf_counter()
+        input_ids = torch.tensor([token_ids], device=self.model.device)
+        outputs = self.model(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                             past_key_values=DynamicCache(), use_cache=True)
+        self.insert(token_ids, cache_tensors(outputs.past_key_values))
+        self.record_prefill(len(token_ids), (time.perf_counter() - prefill_start) * 1000)
+        with self._lock:
+            node, _ = self._walk(token_ids)
+            while node is not self.root:
+                node.pinned = True
+                node = node.parent
+
+    def match(self, input_ids: List[int]) -> Tuple[int, Optional[DynamicCache]]:
+        # 回傳可重複使用的前綴長度與包含其KV的新 DynamicCache（不符合時為 (0, None)）；
+        # 至少要留一個token給請求自己prefill以取得logits
+        with self._lock:
+            limit = len(input_ids) - 1
+            node, length, segments = self.root, 0, []
+            while length < limit:
+                child = node.children.get(input_ids[length])
+                if child is None:
+                    break
+                common = min(_common_length(child.tokens, input_ids, length), limit - length)
+                child.last_access = time.monotonic()
+                if common < len(child.tokens):
+                    segments.append([(k[:, :, :common], v[:, :, :common]) for k, v in child.layers])
+                    length += common
+                    break
+                segments.append(child.layers)
+                length += common
+                node = child
+
+            self.prompt_tokens.inc(len(input_ids))
+            if length == 0:
+                self.misses.inc()
+                return 0, None
+            self.hits.inc()
+            self.hit_tokens.inc(length)
+            self.saved_ms.observe(length * self.ms_per_token)
+
+        layers = [
+            (torch.cat([segment[i][0] for segment in segments], dim=2),
+             torch.cat([segment[i][1] for segment in segments], dim=2))
+            for i in range(len(segments[0]))
+        ]
+        return length, tensors_to_cache(layers)
+
+    def record_prefill(self, tokens: int, elapsed_ms: float):
+        self.prefill_ms.observe(elapsed_ms)
+        if tokens > 0:
+            per_token = elapsed_ms / tokens
+            self.ms_per_token = per_token if self.ms_per_token == 0 else 0.9 * self.ms_per_token + 0.1 * per_token
+
+    def insert(self, input_ids: List[int], layers: List):
+        # layers 為整個 input_ids 的KV（可以更長，例如包含已生成的token），只保存尚未快取的部分
+        with self._lock:
+            node, length = self._walk(input_ids, split=True)
+            if length < len(input_ids):
+                child = RadixNode(tuple(input_ids[length:]), _slice(layers, length, len(input_ids)), node)
+                node.children[input_ids[length]] = child
+                self.nbytes += child.nbytes
+                self.node_count += 1
+            self._evict()
+            self.bytes_gauge.set(self.nbytes)
+
+    def _walk(self, input_ids: List[int], split: bool = False) -> Tuple[RadixNode, int]:
+        # 沿著樹走到與 input_ids 共同前綴的最深節點；split=True 時在節點中間分岔處切開節點
+        node, length = self.root, 0
+        while length < len(input_ids):
+            child = node.children.get(input_ids[length])
+            if child is None:
+                break
+            common = _common_length(child.tokens, input_ids, length)
+            child.last_access = time.monotonic()
+            if common < len(child.tokens):
+                if not split:
+                    break
+                child = self._split(child, common)
+            length += common
+            node = child
+        return node, length
+
+    def _split(self, node: RadixNode, at: int) -> RadixNode:
+        parent = node.parent
+        head = RadixNode(node.tokens[:at], _slice(node.layers, 0, at), parent)
+        head.pinned = node.pinned
+        head.last_access = node.last_access
+        tail_layers = _slice(node.layers, at)
+        self.nbytes -= node.nbytes
+        node.tokens, node.layers = node.tokens[at:], tail_layers
+        node.nbytes = sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in tail_layers)
+        node.parent = head
+        head.children[node.tokens[0]] = node
+        parent.children[head.tokens[0]] = head
+        self.nbytes += head.nbytes + node.nbytes
+        self.node_count += 1
+        return head
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes:
+            leaves = [node for node in self._nodes() if not node.children and not node.pinned]
+            if not leaves:
+                return
+            victim = min(leaves, key=lambda node: node.last_access)
+            del victim.parent.children[victim.tokens[0]]
+            self.nbytes -= victim.nbytes
+            self.node_count -= 1
+            self.evictions.inc()
+
+    def _nodes(self):
+        stack = list(self.root.children.values())
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(node.children.values())
+
+    def stats(self):
+        prompt_tokens = self.prompt_tokens.value
+        return {
+            "nodes": self.node_count,
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits.value,
+            "misses": self.misses.value,
+            "token_hit_ratio": self.hit_tokens.value / prompt_tokens if prompt_tokens else 0.0,
+            "evictions": self.evictions.value,
+        }
@@ -1,32 +1,148 @@
+import argparse
 import json
 import os
+import re
+import time
 
-# 創建數據目錄（如果不存在）
-os.makedirs('processed_data', exist_ok=True)
+# 整合餐廳列表與營業時間兩份資料，輸出 generate_embeddings.py 使用的 JSON Lines（每行一家餐廳）
+# 串流處理：兩份資料都以增量的JSON解析逐筆讀取，不會一次讀進整個檔案；
+# 營業時間先建成以 RestaurantID 為鍵的雜湊表（餐廳沒有ID或ID查不到時以餐廳名稱比對），
+# 再逐筆讀取餐廳、查表整合並直接寫出。記憶體只隨營業時間的筆數成長（每筆一個鍵），相同的營業時間字串只保留一份。
+# 每家餐廳另外輸出結構化的 service_hours（星期、開始/結束時間與生效/失效日期），
+# generate_embeddings.py 以此建立 restaurant_hours 表供「營業中」過濾（見 opening_hours.py）
+# 不同資料量下的耗時與記憶體用量見 benchmarks/bench_process_data.py
 
-# 讀取餐廳列表文件 - 使用 utf-8-sig 來處理 BOM
-with open('raw_data\\RestaurantList.json', 'r', encoding='utf-8-sig') as f:
-    restaurant_data = json.load(f)
+JSON_READ_SIZE = 1024 * 1024
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
 
-# 讀取營業時間文件 - 使用 utf-8-sig 來處理 BOM
-with open('raw_data\\RestaurantServiceTimeList.json', 'r', encoding='utf-8-sig') as f:
-    service_time_data = json.load(f)
 
-# 從字典中獲取正確的列表
-restaurant_list = restaurant_data['Restaurants']
-service_time_list = service_time_data['RestaurantServiceTimes']
+class JsonStreamReader:
+    # 在讀取緩衝上以 JSONDecoder.raw_decode 逐一解析值，緩衝不足時再從檔案讀入
+    def __init__(self, f, read_size=JSON_READ_SIZE):
+        self.f = f
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
 
-print(f"找到 {len(restaurant_list)} 家餐廳")
-print(f"找到 {len(service_time_list)} 筆營業時間資料")
+    def fill(self) -> bool:
+        # 丟掉已解析的部分再讀入下一段，檔案已讀完時回傳False
+        chunk = self.f.read(self.read_size)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return bool(chunk)
 
-# 建立餐廳ID字典以便快速查詢
-restaurant_ids = {restaurant['RestaurantName']: restaurant for restaurant in restaurant_list}
+    def peek(self) -> str:
+        # 略過空白，回傳下一個字元（檔案結尾時為空字串）
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
 
-# 整合資料 - 重新結構化以適合向量資料庫
-integrated_data = []
-for restaurant in restaurant_list:
-    # 基本資料
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"JSON格式錯誤：預期 {chars}，讀到 {char or '檔案結尾'!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # 值剛好結束在緩衝尾端時（例如數字）可能還沒讀完
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_json_array(path, key, read_size=JSON_READ_SIZE):
+    # 逐筆產生頂層物件中 key 對應的陣列元素，一次只保留一筆資料與讀取緩衝；使用 utf-8-sig 來處理 BOM
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        reader = JsonStreamReader(f, read_size)
+        reader.expect("{")
+        if reader.peek() == "}":
+            raise ValueError(f"{path} 中找不到 {key}")
+        while True:
+            name = reader.value()
+            reader.expect(":")
+            if name == key:
+                reader.expect("[")
+                if reader.peek() == "]":
+                    return
+                while True:
+                    yield reader.value()
+                    if reader.expect(",]") == "]":
+                        return
+            reader.value()  # 略過其他欄位（如更新時間）
+            if reader.expect(",}") == "}":
+                raise ValueError(f"{path} 中找不到 {key}")
+
+
+def format_service_time(service_time):
+    # 格式化營業時間信息
+    if not service_time or 'ServiceTimes' not in service_time:
+        return None
+    formatted_times = []
+    for time_slot in service_time['ServiceTimes']:
+        days = ', '.join(time_slot.get('ServiceDays', []))
+        start_time = time_slot.get('StartTime', '')
+        end_time = time_slot.get('EndTime', '')
+        name = time_slot.get('Name', '')
+
+        if start_time == '00:00:00' and end_time == '00:00:00':
+            # 可能是公休日
+            formatted_times.append(f"{name}: {days}")
+        else:
+            formatted_times.append(f"{name}: {days} {start_time}-{end_time}")
+    return '; '.join(formatted_times)
+
+
+def service_hours(service_time):
+    # 結構化的營業時間；生效/失效日期可能在整筆資料或個別時段上，時段上的優先
+    if not service_time or 'ServiceTimes' not in service_time:
+        return None
+    return [
+        {
+            "days": time_slot.get('ServiceDays', []),
+            "start": time_slot.get('StartTime', ''),
+            "end": time_slot.get('EndTime', ''),
+            "effective_date": time_slot.get('EffectiveDate') or service_time.get('EffectiveDate'),
+            "expire_date": time_slot.get('ExpireDate') or service_time.get('ExpireDate'),
+        }
+        for time_slot in service_time['ServiceTimes']
+    ]
+
+
+def index_service_times(items):
+    # 建立 RestaurantID 與餐廳名稱到 (格式化營業時間, 結構化營業時間) 的雜湊表，同一家餐廳出現多次時以第一筆為準
+    by_id, by_name, distinct = {}, {}, {}
+    count = 0
+    for item in items:
+        count += 1
+        service_time = (format_service_time(item), service_hours(item))
+        # 相同的營業時間只保留一份
+        service_time = distinct.setdefault(json.dumps(service_time, ensure_ascii=False), service_time)
+        if item.get('RestaurantID'):
+            by_id.setdefault(item['RestaurantID'], service_time)
+        if item.get('RestaurantName'):
+            by_name.setdefault(item['RestaurantName'], service_time)
+    return by_id, by_name, count
+
+
+def integrate(restaurant, by_id, by_name):
+    # 基本資料 - 重新結構化以適合向量資料庫；回傳 (整合後的資料, 比對方式)
     restaurant_info = {
+        "restaurant_id": restaurant.get('RestaurantID'),  # 來源的餐廳ID，增量載入以此比對（見 generate_embeddings.py）
         "restaurant_name": restaurant['RestaurantName'],
         "restaurant_address": restaurant.get('RestaurantAddress', ''),
         "restaurant_tel": restaurant.get('RestaurantTel', ''),
@@ -34,40 +150,49 @@ for restaurant in restaurant_list:
         "restaurant_py": restaurant.get('RestaurantPosY', 0),
         "description": restaurant.get('Description', '')
     }
-    
-    # 查詢該餐廳是否有營業時間資料
-    restaurant_name = restaurant['RestaurantName']
-    
-    # 尋找匹配的服務時間
-    service_time = next((item for item in service_time_list 
-                       if item['RestaurantName'] == restaurant_name), None)
-    
-    # 格式化服務時間
-    if service_time and 'ServiceTimes' in service_time:
-        # 格式化營業時間信息
-        service_times = service_time['ServiceTimes']
-        formatted_times = []
-        
-        for time_slot in service_times:
-            days = ', '.join(time_slot.get('ServiceDays', []))
-            start_time = time_slot.get('StartTime', '')
-            end_time = time_slot.get('EndTime', '')
-            name = time_slot.get('Name', '')
-            
-            if start_time == '00:00:00' and end_time == '00:00:00':
-                # 可能是公休日
-                formatted_times.append(f"{name}: {days}")
-            else:
-                formatted_times.append(f"{name}: {days} {start_time}-{end_time}")
-        
-        restaurant_info['service_time'] = '; '.join(formatted_times)
+    if restaurant_info['restaurant_id'] in by_id:
+        service_time, match = by_id[restaurant_info['restaurant_id']], "id"
+    elif restaurant_info['restaurant_name'] in by_name:
+        service_time, match = by_name[restaurant_info['restaurant_name']], "name"
     else:
-        restaurant_info['service_time'] = None
-    
-    integrated_data.append(restaurant_info)
+        service_time, match = (None, None), None
+    restaurant_info['service_time'], restaurant_info['service_hours'] = service_time
+    return restaurant_info, match
+
+
+def process(restaurants_path, service_times_path, output_path, read_size=JSON_READ_SIZE):
+    # 回傳 {"restaurants", "service_times", "id", "name", "unmatched"} 各項筆數
+    by_id, by_name, service_time_count = index_service_times(
+        iter_json_array(service_times_path, 'RestaurantServiceTimes', read_size))
+    print(f"找到 {service_time_count} 筆營業時間資料")
+
+    counts = {"restaurants": 0, "service_times": service_time_count, "id": 0, "name": 0, "unmatched": 0}
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for restaurant in iter_json_array(restaurants_path, 'Restaurants', read_size):
+            restaurant_info, match = integrate(restaurant, by_id, by_name)
+            f.write(json.dumps(restaurant_info, ensure_ascii=False))
+            f.write("\n")
+            counts["restaurants"] += 1
+            counts[match or "unmatched"] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="整合餐廳列表與營業時間資料")
+    parser.add_argument("--restaurants", default='raw_data\\RestaurantList.json')
+    parser.add_argument("--service-times", default='raw_data\\RestaurantServiceTimeList.json')
+    parser.add_argument("--output", default='processed_data\\integrated_restaurants.jsonl')
+    args = parser.parse_args()
+
+    # 創建數據目錄（如果不存在）
+    os.makedirs('processed_data', exist_ok=True)
+
+    start = time.time()
+    counts = process(args.restaurants, args.service_times, args.output)
+    print(f"找到 {counts['restaurants']} 家餐廳")
+    print(f"營業時間以ID比對 {counts['id']} 家，以名稱比對 {counts['name']} 家，無營業時間 {counts['unmatched']} 家")
+    print(f"整合完成，共有 {counts['restaurants']} 家餐廳資料，耗時: {time.time() - start:.2f}s")
 
-# 儲存整合後的資料
-with open('processed_data\\integrated_restaurants.json', 'w', encoding='utf-8') as f:
-    json.dump(integrated_data, f, ensure_ascii=False, indent=2)
 
-print(f"整合完成，共有 {len(integrated_data)} 家餐廳資料")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
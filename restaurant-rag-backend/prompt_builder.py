@@ -0,0 +1,357 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extras
+
+import metrics
+
+# 推薦提示的組成，以LLM的tokenizer計算長度並限制在token預算內：
+#   - 營業時間壓縮成「二至日 11:00-14:00、17:00-19:00；一公休」的形式
+#   - 過長的描述截斷到 PROMPT_MAX_DESCRIPTION_TOKENS
+#   - 仍超過 PROMPT_MAX_TOKENS 時，從相似度最低的餐廳開始捨棄
+# PROMPT_MAX_TOKENS=1024                整個提示（含固定前綴）的token上限，0為不限制
+# PROMPT_MAX_DESCRIPTION_TOKENS=80      每間餐廳描述的token上限，0為不限制
+# PROMPT_MIN_SIMILARITY=-1              相似度低於此值的餐廳不放入提示，-1為不過濾
+# 不同預算下的提示長度與prefill延遲見 benchmarks/bench_prompt_budget.py
+#
+# 每間餐廳的提示片段只在資料變更時改變：離線預先產生片段文字與token id，存在 restaurant_prompt_snippets 表
+# （generate_embeddings.py 匯入資料後只為新增與變更的餐廳產生，或執行 python prompt_builder.py），服務啟動時載入；
+# 請求時以各片段的token id串接出模型輸入，不再對整個提示重新編碼。
+# 片段的切點都放在tokenizer本來就會斷開的位置，串接結果與整段編碼相同：
+#   「1.」「 餐廳A…」「\n2.」「 餐廳B…」「\n\n以下是用戶的需求…」
+# 編號後的空白與片段開頭的字一起編碼（SentencePiece會合併成「▁餐」），換行接在下一個編號前面。
+# 表中未收錄、格式版本不同或來源欄位已變更（md5不符）的餐廳於第一次用到時編碼並保留在記憶體中。
+# 組裝耗時的比較見 benchmarks/bench_prompt_assembly.py
+
+# LLM的權重與tokenizer路徑，放在這裡讓離線工具（generate_embeddings.py）不必載入推理模組
+LLM_MODEL_PATH = "models/gemma-2b"
+
+# 每個推薦提示共同的開頭（指示文字），啟動時prefill並固定在前綴快取中（見 prefix_cache.py）
+PROMPT_PREFIX = "你是台灣餐廳推薦助手。請根據用戶需求簡要分析下列哪些餐廳最適合，並提供1-2句推薦理由。僅使用繁體中文回答。\n\n"
+RESTAURANTS_HEADER = "以下是幾個可能符合用戶需求的台灣餐廳:\n\n"
+QUERY_TEMPLATE = "\n以下是用戶的需求: \"{query}\"\n推薦:"
+# 片段切分方式的版本，改變時預先產生的片段失效
+SNIPPET_LAYOUT = 2
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+WEEKDAY_NAMES = "一二三四五六日"
+TOKEN_BUCKETS = [64, 128, 256, 512, 768, 1024, 1536, 2048, 4096]
+_SERVICE_SLOT = re.compile(r"^(?P<name>[^:]*):\s*(?P<days>[A-Za-z,\s]*?)\s*(?:(?P<start>\d{2}:\d{2})(?::\d{2})?-(?P<end>\d{2}:\d{2})(?::\d{2})?)?$")
+
+
+def _format_days(days: List[int]) -> str:
+    # 連續的日子合併成範圍：[1,2,3,4,5,6] -> 二至日
+    days = sorted(set(days))
+    if len(days) == 7:
+        return "每日"
+    parts, start = [], 0
+    for i in range(1, len(days) + 1):
+        if i == len(days) or days[i] != days[i - 1] + 1:
+            run = days[start:i]
+            if len(run) >= 3:
+                parts.append(f"{WEEKDAY_NAMES[run[0]]}至{WEEKDAY_NAMES[run[-1]]}")
+            else:
+                parts.extend(WEEKDAY_NAMES[d] for d in run)
+            start = i
+    return "、".join(parts)
+
+
+def compress_service_time(service_time: Optional[str]) -> Optional[str]:
+    # process_data.py 產生的格式：「上午營運時間: Tuesday, Wednesday, ... 11:00:00-14:00:00; 公休日: Monday」
+    # 無法解析時原樣回傳
+    if not service_time:
+        return service_time
+    hours: Dict[tuple, List[str]] = {}
+    closed: List[int] = []
+    for slot in service_time.split(";"):
+        match = _SERVICE_SLOT.match(slot.strip())
+        if match is None:
+            return service_time
+        days = [d.strip() for d in match.group("days").split(",") if d.strip()]
+        if any(d not in WEEKDAYS for d in days):
+            return service_time
+        day_indexes = tuple(WEEKDAYS.index(d) for d in days)
+        if match.group("start") is None or match.group("start") == match.group("end") == "00:00":
+            closed.extend(day_indexes)
+        else:
+            hours.setdefault(day_indexes, []).append(f"{match.group('start')}-{match.group('end')}")
+    parts = [f"{_format_days(list(days))} {'、'.join(sorted(times))}" for days, times in hours.items() if days]
+    if closed:
+        parts.append(f"{_format_days(closed)}公休")
+    return "；".join(parts) if parts else service_time
+
+
+SNIPPET_COLUMNS = ["restaurant_name", "restaurant_address", "restaurant_tel", "service_time", "description"]
+
+
+def source_md5_sql(alias: str = "") -> str:
+    # 片段來源欄位的md5，在SQL中計算，與預先產生時的值比對以找出已變更的餐廳
+    columns = ", ".join(f"coalesce({alias}{column}, '')" for column in SNIPPET_COLUMNS)
+    return f"md5(concat_ws(chr(31), {columns}))"
+
+
+class BuiltPrompt:
+    def __init__(self, prompt: str, input_ids: List[int], rows: List[Dict], dropped: int):
+        self.prompt = prompt
+        self.input_ids = input_ids  # 模型輸入，以 tokenizer(PROMPT_PREFIX) 開頭（與前綴快取相同）
+        self.tokens = len(input_ids)
+        self.rows = rows  # 放入提示的餐廳
+        self.dropped = dropped
+
+
+class PromptBuilder:
+    def __init__(self, tokenizer, max_tokens: int = 1024, max_description_tokens: int = 80,
+                 min_similarity: float = -1.0, compress_hours: bool = True):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.max_description_tokens = max_description_tokens
+        self.min_similarity = min_similarity
+        self.compress_hours = compress_hours
+        # 餐廳id -> (片段文字, token id)，文字不含編號與結尾換行，token id 為「空白 + 文字」的編碼
+        self.snippets: Dict[int, Tuple[str, List[int]]] = {}
+        # 固定部分只編碼一次；前綴與 InferenceService.tokenize 相同，包含BOS
+        self.head_ids = tokenizer(PROMPT_PREFIX)["input_ids"] + self.encode(RESTAURANTS_HEADER)
+        self.number_ids: List[List[int]] = []
+        # build 在執行緒池中執行（見 app.py 的 build_prompt），編號的快取需要加鎖
+        self._number_lock = threading.Lock()
+
+        self.prompt_tokens = metrics.histogram("prompt_tokens", TOKEN_BUCKETS)
+        self.rows_dropped = metrics.counter("prompt_rows_dropped_total")
+        self.descriptions_truncated = metrics.counter("prompt_descriptions_truncated_total")
+        self.snippet_misses = metrics.counter("prompt_snippet_misses_total")
+
+    def config(self) -> Dict:
+        # 影響提示內容的設定，用於快取鍵
+        return {
+            "max_tokens": self.max_tokens,
+            "max_description_tokens": self.max_description_tokens,
+            "min_similarity": self.min_similarity,
+            "compress_hours": self.compress_hours,
+        }
+
+    def snippet_version(self) -> str:
+        # 片段格式與tokenizer的版本，不同版本預先產生的片段不會被使用
+        version = {
+            "tokenizer": os.path.basename(str(self.tokenizer.name_or_path).rstrip("/")),
+            "vocab_size": len(self.tokenizer),
+            "max_description_tokens": self.max_description_tokens,
+            "compress_hours": self.compress_hours,
+            "layout": SNIPPET_LAYOUT,
+        }
+        return hashlib.md5(json.dumps(version, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def encode(self, text: str) -> List[int]:
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def count(self, text: str) -> int:
+        return len(self.encode(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        ids = self.encode(text)
+        if len(ids) <= max_tokens:
+            return text
+        return self.tokenizer.decode(ids[:max_tokens], skip_special_tokens=True).rstrip() + "…"
+
+    def encode_snippet(self, text: str) -> List[int]:
+        # 編號後的空白與片段一起編碼，與整段編碼時的切分相同
+        return self.encode(" " + text)
+
+    def format_row(self, row: Dict, description: bool = True) -> str:
+        # 不含編號與結尾換行，兩者在決定放入哪些餐廳後才加上
+        text = f"{row['restaurant_name']}"
+        if row['restaurant_address']:
+            text += f", 地址: {row['restaurant_address']}"
+        if row['restaurant_tel']:
+            text += f", 電話: {row['restaurant_tel']}"
+        service_time = compress_service_time(row['service_time']) if self.compress_hours else row['service_time']
+        if service_time:
+            text += f", 營業時間: {service_time}"
+        if description and row.get('description'):
+            text_description = row['description']
+            if self.max_description_tokens > 0:
+                text_description = self.truncate(text_description, self.max_description_tokens)
+                if text_description != row['description']:
+                    self.descriptions_truncated.inc()
+            text += f"\n   描述: {text_description}"
+        return text
+
+    def snippet(self, row: Dict) -> Tuple[str, List[int]]:
+        snippet = self.snippets.get(row.get('id'))
+        if snippet is None:
+            self.snippet_misses.inc()
+            text = self.format_row(row)
+            snippet = (text, self.encode_snippet(text))
+            if row.get('id') is not None:
+                self.snippets[row['id']] = snippet
+        return snippet
+
+    def numbering(self, index: int) -> List[int]:
+        # 「1.」，之後為「\n2.」：前一間餐廳的結尾換行接在編號前面
+        if len(self.number_ids) < index:
+            with self._number_lock:
+                while len(self.number_ids) < index:
+                    number = len(self.number_ids) + 1
+                    separator = "" if number == 1 else "\n"
+                    self.number_ids.append(self.encode(f"{separator}{number}."))
+        return self.number_ids[index - 1]
+
+    def fit_row(self, row: Dict, budget: int) -> Optional[Tuple[str, List[int]]]:
+        # 只剩一間餐廳仍超過預算時：先去掉描述，仍超過則截斷；連完整店名都放不下時回傳None（捨棄）
+        full = self.format_row(row, description=False)
+        text, ids = full, self.encode_snippet(full)
+        limit = budget
+        while len(ids) > budget and limit > 0:
+            # 截斷會加上「…」並與前導空白一起重新編碼，長度可能多出幾個token，逐步縮短直到放得下
+            text = self.truncate(full, limit)
+            ids = self.encode_snippet(text)
+            limit -= max(len(ids) - budget, 1)
+        if len(ids) > budget or limit < len(self.encode(str(row['restaurant_name']))):
+            return None
+        return text, ids
+
+    def build(self, query: str, results: List[Dict]) -> BuiltPrompt:
+        rows = [row for row in results if row.get('similarity') is None or row['similarity'] >= self.min_similarity]
+        snippets = [self.snippet(row) for row in rows]
+        query_text = QUERY_TEMPLATE.format(query=query)
+        # 前一間餐廳的結尾換行與查詢一起編碼（換行相連時會合併成一個token）
+        query_ids = self.encode("\n" + query_text)
+
+        if self.max_tokens > 0:
+            fixed = len(self.head_ids) + len(query_ids)
+            if fixed > self.max_tokens:
+                # 查詢本身過長時截斷查詢
+                empty_query = len(self.encode("\n" + QUERY_TEMPLATE.format(query="")))
+                query = self.truncate(query, max(self.max_tokens - len(self.head_ids) - empty_query, 1))
+                query_text = QUERY_TEMPLATE.format(query=query)
+                query_ids = self.encode("\n" + query_text)
+                fixed = len(self.head_ids) + len(query_ids)
+            sizes = [len(self.numbering(i)) + len(ids) for i, (_, ids) in enumerate(snippets, 1)]
+            # 檢索結果依相似度由高到低排列，從最後面開始捨棄
+            while len(snippets) > 1 and fixed + sum(sizes) > self.max_tokens:
+                snippets.pop()
+                sizes.pop()
+            if snippets and fixed + sum(sizes) > self.max_tokens:
+                fitted = self.fit_row(rows[0], self.max_tokens - fixed - len(self.numbering(1)))
+                snippets = [fitted] if fitted is not None else []
+
+        dropped = len(results) - len(snippets)
+        rows = rows[:len(snippets)]
+        restaurant_info = "".join(f"{i}. {text}\n" for i, (text, _) in enumerate(snippets, 1))
+        prompt = PROMPT_PREFIX + RESTAURANTS_HEADER + restaurant_info + query_text
+        if snippets:
+            input_ids = list(self.head_ids)
+            for i, (_, ids) in enumerate(snippets, 1):
+                input_ids += self.numbering(i)
+                input_ids += ids
+            input_ids += query_ids
+        else:
+            # 沒有餐廳時標題與查詢的換行相連，整段編碼
+            input_ids = self.tokenizer(PROMPT_PREFIX)["input_ids"] + self.encode(RESTAURANTS_HEADER + query_text)
+        self.prompt_tokens.observe(len(input_ids))
+        if dropped:
+            self.rows_dropped.inc(dropped)
+        return BuiltPrompt(prompt, input_ids, rows, dropped)
+
+    def load_snippets(self, conn) -> int:
+        # 載入預先產生且來源欄位未變更的片段
+        cur = conn.cursor()
+        try:
+            cur.execute(f"""
+                SELECT s.restaurant_id, s.snippet, s.token_ids
+                FROM restaurant_prompt_snippets s JOIN restaurants r ON r.id = s.restaurant_id
+                WHERE s.version = %s AND s.source_md5 = {source_md5_sql("r.")}
+            """, (self.snippet_version(),))
+            self.snippets = {restaurant_id: (snippet, list(token_ids)) for restaurant_id, snippet, token_ids in cur}
+        finally:
+            cur.close()
+        return len(self.snippets)
+
+
+def build_snippets(conn, builder: PromptBuilder, batch_size: int = 1000, table: str = "restaurants") -> int:
+    # 為尚未有片段、格式版本不同或來源欄位已變更的餐廳產生提示片段與token id，回傳產生的數量；
+    # table 為換表前的影子表時，為新目錄產生片段（id與線上表相同，線上只有變更的餐廳暫時改為請求時編碼）
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS restaurant_prompt_snippets (
+            restaurant_id INTEGER PRIMARY KEY,
+            version TEXT NOT NULL,
+            source_md5 TEXT NOT NULL,
+            snippet TEXT NOT NULL,
+            token_ids INTEGER[] NOT NULL
+        )
+    """)
+    version = builder.snippet_version()
+    cur.execute(f"""
+        DELETE FROM restaurant_prompt_snippets s
+        WHERE s.version <> %s OR NOT EXISTS (
+            SELECT 1 FROM {table} r WHERE r.id = s.restaurant_id AND {source_md5_sql("r.")} = s.source_md5
+        )
+    """, (version,))
+    cur.execute(f"""
+        SELECT id, {', '.join(SNIPPET_COLUMNS)}, {source_md5_sql()}
+        FROM {table} r
+        WHERE NOT EXISTS (SELECT 1 FROM restaurant_prompt_snippets s WHERE s.restaurant_id = r.id)
+        ORDER BY id
+    """)
+    columns = ["id"] + SNIPPET_COLUMNS
+    written = 0
+    insert = conn.cursor()
+    while True:
+        records = cur.fetchmany(batch_size)
+        if not records:
+            break
+        rows = [dict(zip(columns, record[:-1])) for record in records]
+        texts = [builder.format_row(row) for row in rows]
+        token_ids = builder.tokenizer([" " + text for text in texts], add_special_tokens=False)["input_ids"]
+        psycopg2.extras.execute_values(
+            insert,
+            "INSERT INTO restaurant_prompt_snippets (restaurant_id, version, source_md5, snippet, token_ids) VALUES %s",
+            [(row["id"], version, record[-1], text, ids)
+             for row, record, text, ids in zip(rows, records, texts, token_ids)],
+        )
+        written += len(rows)
+    insert.close()
+    cur.close()
+    conn.commit()
+    return written
+
+
+def create_prompt_builder(tokenizer) -> PromptBuilder:
+    return PromptBuilder(
+        tokenizer,
+        max_tokens=int(os.getenv("PROMPT_MAX_TOKENS", "1024")),
+        max_description_tokens=int(os.getenv("PROMPT_MAX_DESCRIPTION_TOKENS", "80")),
+        min_similarity=float(os.getenv("PROMPT_MIN_SIMILARITY", "-1")),
+    )
+
+
+def main():
+    from dotenv import load_dotenv
+    from transformers import AutoTokenizer
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="預先產生每間餐廳的提示片段與token id")
+    parser.add_argument("--tokenizer", default=LLM_MODEL_PATH)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD")
+    )
+    try:
+        builder = create_prompt_builder(AutoTokenizer.from_pretrained(args.tokenizer))
+        print(f"已產生 {build_snippets(conn, builder)} 間餐廳的提示片段（版本 {builder.snippet_version()}）")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
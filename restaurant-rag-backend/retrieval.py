@@ -0,0 +1,535 @@
+import copy
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import psycopg2
+import psycopg2.errors
+import psycopg2.extras
+
+from geo import GeoGrid, near_filter_sql
+from lexical import LexicalIndex
+from opening_hours import HOURS_TABLE, OpeningHours, open_at_key
+
+# 向量檢索引擎
+# RETRIEVAL_BACKEND=pgvector（預設，每次查詢交給PostgreSQL排序）
+#                  | memory（啟動時一次載入所有向量，在記憶體中計算相似度）
+# RETRIEVAL_INDEX=exact（預設，暴力精確搜尋）| hnsw | ivf，僅 memory 後端使用
+# refresh() 檢查restaurants是否已被換成新表（generate_embeddings.py --blue-green）或有資料變更：
+# pgvector 後端只遞增版本（查詢自然落到新表），memory 後端在背景建好新的索引後才一次替換，查詢不會看到載入到一半的資料
+# search(..., open_at, near) 只在 open_at 時營業中（見 opening_hours.py）、near=(緯度, 經度, 半徑公尺) 範圍內（見 geo.py）
+# 的餐廳中排序，有過濾條件時為精確排序，不經近似索引
+# lexical_search(query, ...) 以字元二元組的詞彙索引檢索（見 lexical.py），套用相同的過濾條件；
+# LEXICAL_SEARCH=1（預設）時載入詞彙索引，0 時不載入，app.py 只使用向量檢索；兩路的結果以 fuse_rankings 合併
+
+# reciprocal rank fusion 的常數：越大，前幾名與後面名次的分數差距越小
+RRF_K = 60
+
+# 回傳給API的餐廳欄位（不含embedding）
+RESTAURANT_COLUMNS = [
+    "id", "restaurant_name", "restaurant_address", "restaurant_tel",
+    "restaurant_px", "restaurant_py", "service_time", "description",
+]
+HOURS_UNAVAILABLE = "尚未建立營業時間資料（restaurant_hours），請執行 generate_embeddings.py"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    # 正規化後內積即為餘弦相似度，與pgvector的 1 - (embedding <=> q) 一致
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    # argpartition 只做部分排序，再對前k個結果排序
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def fuse_rankings(rankings: Dict[str, List[Dict]], weights: Dict[str, float], top_k: int, k: int = RRF_K,
+                  pinned: Sequence[int] = ()) -> List[Dict]:
+    # reciprocal rank fusion：每家餐廳的分數為各路 weight / (k + 名次) 的總和（名次從1開始），
+    # 只看名次，向量相似度與BM25分數不需要換算到相同尺度；同分時依各路的順序（先傳入的一路優先）
+    # pinned 為固定排在最前面的餐廳id（店名完全相同的詞彙檢索結果，見 lexical.exact_name_ids）：
+    # 只出現在一路的第1名，分數仍可能低於兩路都在前段的餐廳，單靠權重無法讓店名查詢排第一
+    scores: Dict[int, float] = {}
+    rows: Dict[int, Dict] = {}
+    for name, ranked in rankings.items():
+        for rank, row in enumerate(ranked, 1):
+            scores[row["id"]] = scores.get(row["id"], 0.0) + weights[name] / (k + rank)
+            rows.setdefault(row["id"], row)
+    pinned = [restaurant_id for restaurant_id in dict.fromkeys(pinned) if restaurant_id in scores]
+    order = pinned + sorted((restaurant_id for restaurant_id in scores if restaurant_id not in pinned),
+                            key=lambda restaurant_id: -scores[restaurant_id])
+    return [rows[restaurant_id] for restaurant_id in order[:top_k]]
+
+
+def catalog_signature(cur) -> Tuple:
+    # restaurants與營業時間表的oid（換表後改變）與累計的增刪改列數（原地更新後改變）
+    cur.execute(f"""
+        SELECT array_agg(c.oid ORDER BY c.relname), coalesce(sum(s.n_tup_ins + s.n_tup_upd + s.n_tup_del), 0)
+        FROM pg_class c LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+        WHERE c.oid IN (to_regclass('restaurants'), to_regclass('{HOURS_TABLE}'))
+    """)
+    oids, modified = cur.fetchone()
+    return tuple(oids or ()), int(modified)
+
+
+def _read_signature(get_connection: Callable, release_connection: Callable) -> Tuple:
+    conn = get_connection()
+    if conn is None:
+        raise RuntimeError("無法連接到資料庫，請檢查日誌獲取更多信息")
+    try:
+        cur = conn.cursor()
+        signature = catalog_signature(cur)
+        cur.close()
+        conn.commit()  # 統計資料在同一個交易內不會更新
+        return signature
+    finally:
+        release_connection(conn)
+
+
+class ExactIndex:
+    # 暴力精確搜尋：一次矩陣向量乘積 + argpartition
+    name = "exact"
+
+    def build(self, matrix: np.ndarray):
+        self.matrix = matrix
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self.matrix @ query
+        rows = _top_k(scores, top_k)
+        return rows, scores[rows]
+
+
+class IVFIndex:
+    # 倒排檔索引：以k-means將向量分群，查詢時只掃描最接近的幾個群
+    name = "ivf"
+
+    def __init__(self, lists: Optional[int] = None, probes: int = 8, iterations: int = 10, seed: int = 0):
+        self.lists = lists
+        self.probes = probes
+        self.iterations = iterations
+        self.seed = seed
+
+    def build(self, matrix: np.ndarray):
+        self.matrix = matrix
+        n = matrix.shape[0]
+        lists = self.lists or max(1, int(np.sqrt(n)))
+        lists = min(lists, n) if n else 1
+        rng = np.random.default_rng(self.seed)
+
+        if n == 0:
+            self.centroids = np.zeros((1, matrix.shape[1]), dtype=np.float32)
+            self.inverted_lists = [np.empty(0, dtype=np.int64)]
+            return
+
+        # 球面k-means：以內積分配、再正規化群中心
+        centroids = matrix[rng.choice(n, size=lists, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignments = np.argmax(matrix @ centroids.T, axis=1)
+            for c in range(lists):
+                members = matrix[assignments == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = _normalize(centroids).astype(np.float32)
+
+        assignments = np.argmax(matrix @ centroids.T, axis=1)
+        # 捨棄空的群，探查的群都有候選向量（資料集中時k-means會留下許多空群）
+        inverted_lists = [np.flatnonzero(assignments == c) for c in range(lists)]
+        keep = [c for c in range(lists) if len(inverted_lists[c])]
+        self.centroids = np.ascontiguousarray(centroids[keep])
+        self.inverted_lists = [inverted_lists[c] for c in keep]
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        probes = min(self.probes, len(self.inverted_lists))
+        nearest = _top_k(self.centroids @ query, probes)
+        candidates = np.concatenate([self.inverted_lists[c] for c in nearest])
+        scores = self.matrix[candidates] @ query
+        order = _top_k(scores, top_k)
+        return candidates[order], scores[order]
+
+
+class HNSWIndex:
+    # HNSW圖索引，需要安裝hnswlib（pip install hnswlib）
+    name = "hnsw"
+
+    def __init__(self, m: int = 16, ef_construction: int = 200, ef_search: int = 64):
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+
+    def build(self, matrix: np.ndarray):
+        try:
+            import hnswlib
+        except ImportError:
+            raise RuntimeError("RETRIEVAL_INDEX=hnsw 需要安裝hnswlib: pip install hnswlib")
+
+        self.index = hnswlib.Index(space="ip", dim=matrix.shape[1])
+        self.index.init_index(max_elements=max(1, matrix.shape[0]), ef_construction=self.ef_construction, M=self.m)
+        if matrix.shape[0]:
+            self.index.add_items(matrix, np.arange(matrix.shape[0]))
+        self.index.set_ef(self.ef_search)
+        self.size = matrix.shape[0]
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(top_k, self.size)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        self.index.set_ef(max(self.ef_search, k))
+        labels, distances = self.index.knn_query(query, k=k)
+        # 內積空間的距離為 1 - 內積
+        return labels[0].astype(np.int64), 1.0 - distances[0]
+
+
+def create_index(kind: str):
+    if kind == "exact":
+        return ExactIndex()
+    if kind == "ivf":
+        return IVFIndex(
+            lists=int(os.getenv("IVF_LISTS", "0")) or None,
+            probes=int(os.getenv("IVF_PROBES", "8")),
+        )
+    if kind == "hnsw":
+        return HNSWIndex(
+            m=int(os.getenv("HNSW_M", "16")),
+            ef_construction=int(os.getenv("HNSW_EF_CONSTRUCTION", "200")),
+            ef_search=int(os.getenv("HNSW_EF_SEARCH", "64")),
+        )
+    raise ValueError(f"未知的RETRIEVAL_INDEX: {kind}")
+
+
+class PgVectorRetriever:
+    # 每次查詢都交給PostgreSQL以 <=> 排序
+    name = "pgvector"
+
+    def __init__(self, get_connection: Callable, release_connection: Callable, lexical: bool = False):
+        self.get_connection = get_connection
+        self.release_connection = release_connection
+        self.version = 0  # 資料或索引更新時遞增，用於快取鍵
+        self.signature = None
+        self.lexical_enabled = lexical
+        # 詞彙索引與位置對應的餐廳id，重新載入時整組替換
+        self.lexical_snapshot: Tuple[Optional[LexicalIndex], np.ndarray] = (None, np.empty(0, dtype=np.int64))
+
+    def _connection(self):
+        conn = self.get_connection()
+        if conn is None:
+            raise RuntimeError("無法連接到資料庫，請檢查日誌獲取更多信息")
+        return conn
+
+    def refresh(self, force: bool = False) -> bool:
+        # 查詢每次都讀取目前的restaurants表，換表後只需讓快取失效並重建詞彙索引；第一次呼叫只記錄簽章並載入詞彙索引
+        signature = _read_signature(self.get_connection, self.release_connection)
+        first = self.signature is None
+        if not first and not force and signature == self.signature:
+            return False
+        self.signature = signature
+        if self.lexical_enabled:
+            self.load_lexical()
+        if first:
+            return False
+        self.version += 1
+        return True
+
+    def load_lexical(self):
+        # 只讀取建立詞彙索引需要的文字欄位；索引到下次refresh前不會看到新增的餐廳
+        load_start = time.time()
+        conn = self._connection()
+        try:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cur.execute("SELECT id, restaurant_name, description, restaurant_address FROM restaurants ORDER BY id")
+            rows = cur.fetchall()
+            cur.close()
+            conn.commit()
+        finally:
+            self.release_connection(conn)
+        self.lexical_snapshot = (LexicalIndex().build(rows), np.array([row["id"] for row in rows], dtype=np.int64))
+        print(f"詞彙索引載入 {len(rows)} 家餐廳，耗時: {time.time() - load_start:.2f}s")
+
+    def count(self) -> int:
+        conn = self._connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM restaurants")
+            count = cur.fetchone()[0]
+            cur.close()
+            return count
+        finally:
+            self.release_connection(conn)
+
+    def _filters(self, open_at: Optional[datetime], near: Optional[Tuple[float, float, float]], params: Dict) -> List[str]:
+        # restaurants 的WHERE條件，參數加入 params
+        filters = []
+        if open_at is not None:
+            # 以GiST索引找出營業中的餐廳
+            params["minute"], params["day"] = open_at_key(open_at)
+            filters.append(f"""id IN (
+                            SELECT restaurant_id FROM {HOURS_TABLE}
+                            WHERE open_minutes @> %(minute)s AND effective @> %(day)s::date
+                        )""")
+        if near is not None:
+            # 以網格索引找出半徑外接矩形內的餐廳，再以球面距離精確過濾
+            condition, near_params = near_filter_sql(*near)
+            filters.append(condition)
+            params.update(near_params)
+        return filters
+
+    def search(self, query_embedding: np.ndarray, top_k: int, open_at: Optional[datetime] = None,
+               near: Optional[Tuple[float, float, float]] = None) -> List[Dict]:
+        params = {"embedding": np.asarray(query_embedding, dtype=np.float32), "top_k": top_k}
+        filters = self._filters(open_at, near, params)
+        conn = self._connection()
+        try:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            if not filters:
+                # 查詢向量只綁定一次，ORDER BY 使用輸出欄位的別名，仍可走向量索引
+                cur.execute("""
+                    SELECT id, restaurant_name, restaurant_address, restaurant_tel,
+                           restaurant_px, restaurant_py, service_time, description,
+                           embedding <=> %(embedding)s as distance
+                    FROM restaurants
+                    ORDER BY distance
+                    LIMIT %(top_k)s
+                """, params)
+            else:
+                # 先找出符合條件的餐廳，再只對這些餐廳計算距離並排序。候選放在CTE中，
+                # 向量索引不會先取出前幾名再過濾（HNSW只回傳ef_search個候選，過濾後可能不足top_k）
+                cur.execute(f"""
+                    WITH candidates AS MATERIALIZED (
+                        SELECT id, restaurant_name, restaurant_address, restaurant_tel,
+                               restaurant_px, restaurant_py, service_time, description,
+                               embedding <=> %(embedding)s as distance
+                        FROM restaurants
+                        WHERE {" AND ".join(filters)}
+                    )
+                    SELECT * FROM candidates
+                    ORDER BY distance
+                    LIMIT %(top_k)s
+                """, params)
+            results = cur.fetchall()
+            cur.close()
+        except psycopg2.errors.UndefinedTable:
+            conn.rollback()
+            raise RuntimeError(HOURS_UNAVAILABLE)
+        finally:
+            self.release_connection(conn)
+
+        for row in results:
+            row["similarity"] = 1 - row.pop("distance")
+        return results
+
+    def lexical_search(self, query: str, query_embedding: np.ndarray, top_k: int, open_at: Optional[datetime] = None,
+                       near: Optional[Tuple[float, float, float]] = None) -> List[Dict]:
+        # 有過濾條件時先在資料庫中取出符合條件的餐廳id，詞彙索引只在這些餐廳中排序（與 memory 後端的 _candidates 相同），
+        # 排序後的前top_k家再到資料庫取回資料；similarity 仍為向量相似度
+        index, ids = self.lexical_snapshot
+        if index is None:
+            raise RuntimeError("詞彙索引尚未載入（LEXICAL_SEARCH=0 或尚未呼叫refresh）")
+        params = {"embedding": np.asarray(query_embedding, dtype=np.float32)}
+        filters = self._filters(open_at, near, params)
+        conn = self._connection()
+        try:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            candidates = None
+            if filters:
+                cur.execute(f"SELECT id FROM restaurants WHERE {' AND '.join(filters)}", params)
+                # 詞彙索引載入後才新增的餐廳不在索引中，到下次refresh前不會出現在詞彙檢索的結果
+                candidates = np.flatnonzero(np.isin(ids, [row["id"] for row in cur.fetchall()]))
+            positions, _ = index.search(query, top_k, candidates)
+            results = []
+            if len(positions):
+                params["lexical_ids"] = [int(restaurant_id) for restaurant_id in ids[positions]]
+                cur.execute("""
+                    SELECT id, restaurant_name, restaurant_address, restaurant_tel,
+                           restaurant_px, restaurant_py, service_time, description,
+                           embedding <=> %(embedding)s as distance
+                    FROM restaurants
+                    WHERE id = ANY(%(lexical_ids)s::integer[])
+                    ORDER BY array_position(%(lexical_ids)s::integer[], id)
+                """, params)
+                results = cur.fetchall()
+            cur.close()
+        except psycopg2.errors.UndefinedTable:
+            conn.rollback()
+            raise RuntimeError(HOURS_UNAVAILABLE)
+        finally:
+            self.release_connection(conn)
+
+        for row in results:
+            row["similarity"] = 1 - row.pop("distance")
+        return results
+
+
+class CatalogSnapshot(NamedTuple):
+    rows: List[Dict]
+    index: object
+    matrix: np.ndarray
+    hours: Optional[OpeningHours]
+    geo: GeoGrid
+    lexical: Optional[LexicalIndex]
+
+
+class InMemoryRetriever:
+    # 啟動時一次載入所有向量到連續的float32矩陣，查詢不再經過資料庫
+    name = "memory"
+
+    def __init__(self, get_connection: Callable, release_connection: Callable, index=None, lexical: bool = False):
+        self.get_connection = get_connection
+        self.release_connection = release_connection
+        self.index = index or ExactIndex()
+        self.lexical_enabled = lexical
+        self.version = 0  # 每次重新載入時遞增，用於快取鍵
+        self.signature = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.id_to_row: Dict[int, int] = {}
+        self.rows: List[Dict] = []
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.hours: Optional[OpeningHours] = None
+        self.geo = GeoGrid.from_rows(self.rows)
+        self.lexical: Optional[LexicalIndex] = None
+        # 查詢使用的資料，重新載入時整組替換
+        self.snapshot = CatalogSnapshot(self.rows, self.index, self.matrix, self.hours, self.geo, self.lexical)
+
+    def load(self):
+        load_start = time.time()
+        conn = self.get_connection()
+        if conn is None:
+            raise RuntimeError("無法連接到資料庫，請檢查日誌獲取更多信息")
+        try:
+            cur = conn.cursor()
+            # 先讀簽章再讀資料：兩者之間換表時，下次refresh只會多重新載入一次
+            signature = catalog_signature(cur)
+            cur.execute(f"""
+                SELECT {', '.join(RESTAURANT_COLUMNS)}, embedding
+                FROM restaurants
+                WHERE embedding IS NOT NULL
+                ORDER BY id
+            """)
+            records = cur.fetchall()
+            try:
+                # 失效日當天仍營業：daterange的上界不含，減一天
+                cur.execute(f"""
+                    SELECT restaurant_id, lower(open_minutes), upper(open_minutes),
+                           lower(effective), upper(effective) - 1
+                    FROM {HOURS_TABLE}
+                """)
+                hour_records = cur.fetchall()
+            except psycopg2.errors.UndefinedTable:
+                conn.rollback()
+                hour_records = None
+            cur.close()
+            conn.commit()
+        finally:
+            self.release_connection(conn)
+
+        self.load_rows(
+            [dict(zip(RESTAURANT_COLUMNS, record[:-1])) for record in records],
+            [record[-1] for record in records],
+            hour_records,
+        )
+        self.signature = signature
+        print(f"記憶體索引({self.index.name})載入 {len(self.rows)} 家餐廳，耗時: {time.time() - load_start:.2f}s")
+
+    def load_rows(self, rows: List[Dict], embeddings, hour_records=None):
+        # hour_records: 營業時間表的 (資料庫id, 開始分鐘, 結束分鐘, 生效日, 失效日)，None表示沒有營業時間資料
+        dim = len(embeddings[0]) if len(embeddings) else 0
+        matrix = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32).reshape(len(rows), dim))
+        matrix = np.ascontiguousarray(_normalize(matrix), dtype=np.float32)
+        # 在索引的複本上建構，進行中的查詢繼續使用舊的索引
+        index = copy.copy(self.index)
+        index.build(matrix)
+        ids = np.array([row["id"] for row in rows], dtype=np.int64)
+        id_to_row = {int(restaurant_id): row for row, restaurant_id in enumerate(ids)}
+        hours = OpeningHours.from_records(hour_records, id_to_row) if hour_records is not None else None
+        geo = GeoGrid.from_rows(rows)
+        lexical = LexicalIndex().build(rows) if self.lexical_enabled else None
+        self.matrix = matrix
+        self.rows = rows
+        self.ids = ids
+        self.id_to_row = id_to_row
+        self.index = index
+        self.hours = hours
+        self.geo = geo
+        self.lexical = lexical
+        self.snapshot = CatalogSnapshot(rows, index, matrix, hours, geo, lexical)
+        self.version += 1
+
+    def refresh(self, force: bool = False) -> bool:
+        # 資料有變更時重新載入，建構期間查詢仍使用舊的快照
+        if not force and _read_signature(self.get_connection, self.release_connection) == self.signature:
+            return False
+        self.load()
+        return True
+
+    def count(self) -> int:
+        return len(self.snapshot.rows)
+
+    def _candidates(self, snapshot: CatalogSnapshot, open_at: Optional[datetime],
+                    near: Optional[Tuple[float, float, float]]) -> Optional[np.ndarray]:
+        # 營業中且在範圍內的餐廳位置（由小到大），沒有過濾條件時為None
+        candidates = None
+        if open_at is not None:
+            if snapshot.hours is None:
+                raise RuntimeError(HOURS_UNAVAILABLE)
+            candidates = snapshot.hours.open_rows(open_at)
+        if near is not None:
+            nearby = snapshot.geo.near_rows(*near)
+            candidates = nearby if candidates is None else np.intersect1d(candidates, nearby, assume_unique=True)
+        return candidates
+
+    def search(self, query_embedding: np.ndarray, top_k: int, open_at: Optional[datetime] = None,
+               near: Optional[Tuple[float, float, float]] = None) -> List[Dict]:
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        snapshot = self.snapshot
+        candidates = self._candidates(snapshot, open_at, near)
+        if candidates is None:
+            positions, scores = snapshot.index.search(query, top_k)
+        else:
+            # 只對營業中且在範圍內的餐廳計算相似度
+            scores = snapshot.matrix[candidates] @ query
+            order = _top_k(scores, top_k)
+            positions, scores = candidates[order], scores[order]
+        return [
+            dict(snapshot.rows[row], similarity=float(score))
+            for row, score in zip(positions, scores)
+        ]
+
+    def lexical_search(self, query: str, query_embedding: np.ndarray, top_k: int, open_at: Optional[datetime] = None,
+                       near: Optional[Tuple[float, float, float]] = None) -> List[Dict]:
+        # 依詞彙分數排序的前top_k家；similarity 仍為向量相似度
+        snapshot = self.snapshot
+        if snapshot.lexical is None:
+            raise RuntimeError("詞彙索引尚未載入（LEXICAL_SEARCH=0）")
+        positions, _ = snapshot.lexical.search(query, top_k, self._candidates(snapshot, open_at, near))
+        if not len(positions):
+            return []
+        scores = snapshot.matrix[positions] @ _normalize(np.asarray(query_embedding, dtype=np.float32))
+        return [
+            dict(snapshot.rows[row], similarity=float(score))
+            for row, score in zip(positions, scores)
+        ]
+
+
+def create_retriever(get_connection: Callable, release_connection: Callable):
+    backend = os.getenv("RETRIEVAL_BACKEND", "pgvector")
+    lexical = os.getenv("LEXICAL_SEARCH", "1") == "1"
+    if backend == "pgvector":
+        return PgVectorRetriever(get_connection, release_connection, lexical=lexical)
+    if backend == "memory":
+        retriever = InMemoryRetriever(
+            get_connection, release_connection,
+            index=create_index(os.getenv("RETRIEVAL_INDEX", "exact")),
+            lexical=lexical,
+        )
+        retriever.load()
+        return retriever
+    raise ValueError(f"未知的RETRIEVAL_BACKEND: {backend}")
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import metrics
+
+# 語意快取：以查詢向量的餘弦相似度比對已快取的查詢，換句話說的查詢（如「台中日式料理」與
+# 「台中的日本料理」）也能重用先前生成的推薦，省下LLM生成的時間。
+# 只有在相似度達到門檻、且檢索到的餐廳id（含順序）與快取時完全相同時才算命中，
+# scope（其他請求參數與模型/索引版本）也必須相同。
+# SEMANTIC_CACHE=1（預設）| 0
+# SEMANTIC_CACHE_THRESHOLD=0.92
+# SEMANTIC_CACHE_MAX_ENTRIES=512
+# QUERY_CACHE_TTL_SECONDS=3600   與精確比對的快取共用
+
+
+class SemanticEntry:
+    def __init__(self, scope: str, restaurant_ids: List[int], value: Any, cost_ms: float, expires_at: Optional[float]):
+        self.scope = scope
+        self.restaurant_ids = restaurant_ids
+        self.value = value
+        self.cost_ms = cost_ms  # 產生這個結果所花的生成時間，命中時即為省下的時間
+        self.expires_at = expires_at
+
+
+class SemanticCache:
+    def __init__(self, name: str, threshold: float = 0.92, max_entries: int = 512, ttl_seconds: float = 3600):
+        self.name = name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # 預先配置的向量矩陣，每個快取項目佔一列（slot）
+        self._matrix: Optional[np.ndarray] = None
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._entries: "OrderedDict[int, SemanticEntry]" = OrderedDict()  # slot -> 項目，依最近使用排序
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.hits = metrics.counter(f"{name}_cache_hits_total")
+        self.misses = metrics.counter(f"{name}_cache_misses_total")
+        self.evictions = metrics.counter(f"{name}_cache_evictions_total")
+        self.saved_ms = metrics.histogram(f"{name}_cache_saved_ms", metrics.LATENCY_MS_BUCKETS)
+        self.lookup_ms = metrics.histogram(f"{name}_cache_lookup_ms", metrics.LATENCY_MS_BUCKETS)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, embedding, scope: str, restaurant_ids: List[int]) -> Optional[Any]:
+        lookup_start = time.perf_counter()
+        try:
+            with self._lock:
+                entry = self._find(self._normalize(embedding), scope, list(restaurant_ids))
+        finally:
+            self.lookup_ms.observe((time.perf_counter() - lookup_start) * 1000)
+        if entry is None:
+            self.misses.inc()
+            return None
+        self.hits.inc()
+        self.saved_ms.observe(entry.cost_ms)
+        return entry.value
+
+    def _find(self, query: np.ndarray, scope: str, restaurant_ids: List[int]) -> Optional[SemanticEntry]:
+        if not self._entries or self._matrix.shape[1] != query.shape[0]:
+            return None
+        scores = self._matrix @ query
+        scores[~self._valid] = -np.inf
+        candidates = np.nonzero(scores >= self.threshold)[0]
+        now = time.time()
+        for slot in candidates[np.argsort(-scores[candidates], kind="stable")]:
+            slot = int(slot)
+            entry = self._entries[slot]
+            if entry.expires_at is not None and entry.expires_at <= now:
+                self._remove(slot)
+                continue
+            if entry.scope == scope and entry.restaurant_ids == restaurant_ids:
+                self._entries.move_to_end(slot)
+                return entry
+        return None
+
+    def add(self, embedding, scope: str, restaurant_ids: List[int], value: Any, cost_ms: float):
+        query = self._normalize(embedding)
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                self._reset(query.shape[0])
+            if not self._free:
+                # 淘汰最久未使用的項目
+                self._remove(next(iter(self._entries)))
+                self.evictions.inc()
+            slot = self._free.pop()
+            self._matrix[slot] = query
+            self._valid[slot] = True
+            self._entries[slot] = SemanticEntry(scope, list(restaurant_ids), value, cost_ms, expires_at)
+
+    def _remove(self, slot: int):
+        del self._entries[slot]
+        self._valid[slot] = False
+        self._free.append(slot)
+
+    def _reset(self, dim: int):
+        self._matrix = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._valid[:] = False
+        self._entries.clear()
+        self._free = list(range(self.max_entries - 1, -1, -1))
+
+    def clear(self):
+        with self._lock:
+            if self._matrix is not None:
+                self._reset(self._matrix.shape[1])
+
+    def stats(self) -> Dict:
+        hits, misses = self.hits.value, self.misses.value
+        saved = self.saved_ms.snapshot()
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "evictions": self.evictions.value,
+            "saved_ms_total": saved["sum"],
+            "saved_ms_mean": saved["mean"],
+            "lookup_ms_p50": self.lookup_ms.snapshot()["p50"],
+        }
+
+
+def create_semantic_cache(name: str) -> Optional[SemanticCache]:
+    if os.getenv("SEMANTIC_CACHE", "1") != "1":
+        return None
+    return SemanticCache(
+        name,
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+        max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "512")),
+        ttl_seconds=float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600")),
+    )
@@ -0,0 +1,67 @@
+# 多行程部署：先啟動持有模型與共用快取的 model_server.py，再以 uvicorn 啟動 N 個HTTP worker
+#   python serve.py --workers 4
+# 每個worker各自處理HTTP、資料庫查詢（各自的連接池，共 N × DB_POOL_SIZE 個連接）與記憶體檢索索引，
+# 查詢編碼、生成與快取則經由本機socket交給唯一的模型伺服器，模型權重只載入一份。
+# 單行程模式仍可直接執行 python app.py。
+import argparse
+import os
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import uvicorn
+from dotenv import load_dotenv
+
+
+def wait_for_model_server(address, process, timeout):
+    # 模型載入完成、開始接受連線後才啟動HTTP worker
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"模型伺服器啟動失敗，結束代碼: {process.returncode}")
+        try:
+            if address.startswith("unix:"):
+                with socket.socket(socket.AF_UNIX) as sock:
+                    sock.connect(address[len("unix:"):])
+            else:
+                host, port = address.rsplit(":", 1)
+                socket.create_connection((host, int(port)), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"等待模型伺服器逾時（{timeout}s）")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model-server", default=os.getenv("MODEL_SERVER_ADDRESS", "127.0.0.1:8100"),
+                        help="模型伺服器位址，host:port 或 unix:/path/to/socket")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    # worker 由 uvicorn 以新行程啟動，設定經由環境變數傳遞
+    os.environ["MODEL_SERVER_ADDRESS"] = args.model_server
+    if not os.environ.get("MODEL_SERVER_AUTHKEY"):
+        os.environ["MODEL_SERVER_AUTHKEY"] = secrets.token_hex(16)
+
+    model_server = subprocess.Popen([sys.executable, "model_server.py"], env=os.environ.copy())
+    # uvicorn 結束後會重新送出收到的SIGTERM；轉成SystemExit，確保下面的finally會關閉模型伺服器
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        wait_for_model_server(args.model_server, model_server, args.startup_timeout)
+        print(f"模型伺服器就緒，啟動 {args.workers} 個HTTP worker...")
+        uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        model_server.terminate()
+        model_server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,10 @@ import psycopg2
 import os
 from dotenv import load_dotenv
 import sys
+import time
+import argparse
+from geo import create_geo_index
+from opening_hours import create_hours_table
 
 # 載入環境變數
 load_dotenv()
@@ -11,7 +15,52 @@ host = os.getenv("DB_HOST")
 user = os.getenv("DB_USER")
 password = os.getenv("DB_PASSWORD")
 
-try:
+# 向量索引名稱，使用cosine距離以配合查詢中的 <=> 運算子
+VECTOR_INDEX_NAME = "restaurants_embedding_idx"
+
+def vector_index_sql(table, index_name, method, m=16, ef_construction=64, lists=100, concurrently=False):
+    # 產生建立HNSW或IVFFlat索引的SQL
+    if method == "hnsw":
+        options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+    elif method == "ivfflat":
+        options = f"lists = {int(lists)}"
+    else:
+        raise ValueError(f"不支援的索引類型: {method}")
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}{index_name} ON {table} "
+        f"USING {method} (embedding vector_cosine_ops) WITH ({options})"
+    )
+
+def get_vector_index(cursor, index_name=VECTOR_INDEX_NAME):
+    cursor.execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s", (index_name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def create_vector_index(cursor, method, m=16, ef_construction=64, lists=100, table="restaurants", index_name=VECTOR_INDEX_NAME):
+    if get_vector_index(cursor, index_name):
+        print(f"索引 {index_name} 已存在，如需更換參數請使用 rebuild")
+        return
+    print(f"在{table}上創建{method}索引 {index_name}...")
+    index_start = time.time()
+    cursor.execute(vector_index_sql(table, index_name, method, m, ef_construction, lists))
+    print(f"索引創建成功！耗時: {time.time() - index_start:.2f}s")
+
+def rebuild_vector_index(cursor, method, m=16, ef_construction=64, lists=100, table="restaurants", index_name=VECTOR_INDEX_NAME):
+    # 先以CONCURRENTLY建立新索引再替換舊索引，重建期間查詢仍可使用舊索引
+    new_index_name = f"{index_name}_new"
+    cursor.execute(f"DROP INDEX IF EXISTS {new_index_name}")
+    print(f"在{table}上重建{method}索引 {index_name}...")
+    index_start = time.time()
+    cursor.execute(vector_index_sql(table, new_index_name, method, m, ef_construction, lists, concurrently=True))
+    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+    cursor.execute(f"ALTER INDEX {new_index_name} RENAME TO {index_name}")
+    print(f"索引重建成功！耗時: {time.time() - index_start:.2f}s")
+
+def drop_vector_index(cursor, index_name=VECTOR_INDEX_NAME):
+    cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+    print(f"索引 {index_name} 已刪除")
+
+def setup_database():
     # 連接到默認資料庫
     print(f"連接到PostgreSQL，用戶: {user}, 主機: {host}...")
     conn = psycopg2.connect(
@@ -80,7 +129,9 @@ try:
             restaurant_py NUMERIC,
             service_time TEXT,
             description TEXT,
-            embedding vector(384)
+            embedding vector(384),
+            restaurant_id TEXT UNIQUE,
+            content_hash TEXT
         )
         """)
         print("restaurants表創建成功！")
@@ -95,21 +146,72 @@ try:
             print("description列添加成功！")
         else:
             print("description列已存在")
+        
+        # 增量載入使用的來源餐廳ID與內容雜湊（見 generate_embeddings.py）
+        cursor.execute("ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS restaurant_id TEXT")
+        cursor.execute("ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS content_hash TEXT")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS restaurants_restaurant_id_key ON restaurants (restaurant_id)")
     
+    # 座標的網格索引，供附近搜尋（見 geo.py）
+    create_geo_index(cursor)
+
+    # 結構化的營業時間，供「營業中」過濾（見 opening_hours.py）
+    create_hours_table(cursor)
+
     # 報告結果
     cursor.execute("SELECT COUNT(*) FROM restaurants")
     row_count = cursor.fetchone()[0]
     print(f"restaurants表中有 {row_count} 行數據")
     
     print("資料庫設置完成！")
+    cursor.close()
+    conn.close()
 
-except Exception as e:
-    print(f"設置資料庫時出錯: {e}")
-    print(f"確保PostgreSQL服務正在運行，且連接信息正確: 主機={host}, 用戶={user}")
-    print("如果您無法連接，請檢查PostgreSQL是否正在運行，密碼是否正確。")
-    sys.exit(1)
-finally:
-    if 'cursor' in locals() and cursor:
+def manage_index(args):
+    print("連接到restaurant_rag資料庫...")
+    conn = psycopg2.connect(
+        host=host,
+        database="restaurant_rag",
+        user=user,
+        password=password
+    )
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY 不能在交易中執行
+    cursor = conn.cursor()
+    try:
+        if args.action == "create":
+            create_vector_index(cursor, args.method, args.m, args.ef_construction, args.lists)
+        elif args.action == "rebuild":
+            rebuild_vector_index(cursor, args.method, args.m, args.ef_construction, args.lists)
+        elif args.action == "drop":
+            drop_vector_index(cursor)
+
+        indexdef = get_vector_index(cursor)
+        print(f"目前的向量索引: {indexdef or '無（查詢將使用精確掃描）'}")
+    finally:
         cursor.close()
-    if 'conn' in locals() and conn:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="設置restaurant_rag資料庫")
+    subparsers = parser.add_subparsers(dest="command")
+
+    index_parser = subparsers.add_parser("index", help="管理restaurants.embedding的向量索引")
+    index_parser.add_argument("action", choices=["create", "rebuild", "drop", "status"])
+    index_parser.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw")
+    index_parser.add_argument("--m", type=int, default=16, help="HNSW每個節點的連接數")
+    index_parser.add_argument("--ef-construction", type=int, default=64, help="HNSW建圖時的候選列表大小")
+    index_parser.add_argument("--lists", type=int, default=100, help="IVFFlat的分群數量")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        if args.command == "index":
+            manage_index(args)
+        else:
+            setup_database()
+    except Exception as e:
+        print(f"設置資料庫時出錯: {e}")
+        print(f"確保PostgreSQL服務正在運行，且連接信息正確: 主機={host}, 用戶={user}")
+        print("如果您無法連接，請檢查PostgreSQL是否正在運行，密碼是否正確。")
+        sys.exit(1)
@@ -0,0 +1,91 @@
+import os
+import threading
+from typing import Dict, Optional
+
+import metrics
+from device import load_causal_lm
+
+# 推測解碼（speculative / assisted decoding）：先以便宜的方式提出數個候選token，
+# 再由Gemma一次前向計算驗證，接受的token不必逐一解碼。
+# SPECULATIVE_DECODING=none（預設）
+#   | prompt_lookup   以n-gram比對提示，直接複製提示中接下來的token作為候選。
+#                     推薦文字大量引用提示中的餐廳名稱與地址，不需額外的模型
+#   | draft           以較小的草稿模型（SPECULATIVE_DRAFT_MODEL，需與Gemma使用相同的詞表）產生候選
+# SPECULATIVE_NUM_TOKENS=10   每次提出的候選token數
+# 只用於 GENERATION_BACKEND=generate（逐請求的model.generate，批次大小為1）。
+# 接受率與CPU上的端到端加速比較見 benchmarks/bench_speculative.py
+
+
+class StepCounter:
+    # 計算目標模型在目前執行緒中的前向計算次數：一般解碼每次前向產生一個token，
+    # 推測解碼每次前向驗證一批候選，產生 1 + 接受的候選數 個token
+    def __init__(self, model):
+        self.model = model
+        self.steps = 0
+        self._handle = None
+
+    def __enter__(self):
+        thread = threading.get_ident()
+
+        def hook(module, args, output):
+            # 其他執行緒同時進行的生成不計入
+            if threading.get_ident() == thread:
+                self.steps += 1
+
+        self._handle = self.model.register_forward_hook(hook)
+        return self
+
+    def __exit__(self, *exc):
+        self._handle.remove()
+
+
+class SpeculativeDecoding:
+    def __init__(self, mode: str, num_tokens: int = 10, draft_model=None):
+        if mode not in ("prompt_lookup", "draft"):
+            raise ValueError(f"未知的SPECULATIVE_DECODING: {mode}")
+        if mode == "draft" and draft_model is None:
+            raise ValueError("SPECULATIVE_DECODING=draft 需要設定 SPECULATIVE_DRAFT_MODEL")
+        self.mode = mode
+        self.num_tokens = num_tokens
+        self.draft_model = draft_model
+
+        self.generated_tokens = metrics.counter("speculative_generated_tokens_total")
+        self.steps = metrics.counter("speculative_decode_steps_total")
+        # 每次目標模型前向計算產生的token數（1表示沒有接受任何候選；包含prefill那一次）
+        self.tokens_per_step = metrics.histogram("speculative_tokens_per_step", metrics.SIZE_BUCKETS)
+
+    def generate_kwargs(self) -> Dict:
+        # 在每次 generate 前呼叫。草稿模型的候選數只能由草稿模型的 generation_config 設定（generate 的參數不會傳到草稿模型），
+        # 因此每次呼叫時才寫入，共用同一個草稿模型的多個設定（例如 bench_speculative.py 依序比較不同候選數）不會互相覆蓋；
+        # 固定為 constant，否則 transformers 會在生成後依接受率改寫這個值，影響下一次生成
+        if self.mode == "prompt_lookup":
+            return {"prompt_lookup_num_tokens": self.num_tokens}
+        self.draft_model.generation_config.num_assistant_tokens = self.num_tokens
+        self.draft_model.generation_config.num_assistant_tokens_schedule = "constant"
+        return {"assistant_model": self.draft_model}
+
+    def record(self, new_tokens: int, step_counter: StepCounter):
+        if step_counter.steps <= 0:
+            return
+        self.generated_tokens.inc(new_tokens)
+        self.steps.inc(step_counter.steps)
+        self.tokens_per_step.observe(new_tokens / step_counter.steps)
+
+    def stats(self) -> Dict:
+        steps = self.steps.value
+        return {
+            "mode": self.mode,
+            "num_tokens": self.num_tokens,
+            "tokens_per_step": self.generated_tokens.value / steps if steps else 0.0,
+        }
+
+
+def create_speculative_decoding(device_config) -> Optional[SpeculativeDecoding]:
+    mode = os.getenv("SPECULATIVE_DECODING", "none")
+    if mode == "none":
+        return None
+    num_tokens = int(os.getenv("SPECULATIVE_NUM_TOKENS", "10"))
+    draft_model = None
+    if mode == "draft" and os.getenv("SPECULATIVE_DRAFT_MODEL"):
+        draft_model = load_causal_lm(os.getenv("SPECULATIVE_DRAFT_MODEL"), device_config)
+    return SpeculativeDecoding(mode, num_tokens, draft_model)
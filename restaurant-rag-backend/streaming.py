@@ -0,0 +1,68 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Optional
+
+import torch
+from fastapi.encoders import jsonable_encoder
+from transformers import StoppingCriteria, TextStreamer
+
+import metrics
+
+# 串流輸出：生成執行緒（model.generate 或連續批次排程器）每產生一個token就呼叫 put()，
+# 解碼後的文字經由 call_soon_threadsafe 放入事件迴圈中的 asyncio.Queue，
+# 端點再以 Server-Sent Events 逐段送給前端。
+# 與 TextIteratorStreamer 相同的用法，但讀取端不會阻塞事件迴圈。
+# 客戶端中途斷線時設定 cancelled，生成端據此提早結束，不再浪費解碼資源。
+
+
+class AsyncTextStreamer(TextStreamer):
+    def __init__(self, tokenizer, loop: asyncio.AbstractEventLoop, skip_prompt: bool = False,
+                 request_start: Optional[float] = None, **decode_kwargs):
+        super().__init__(tokenizer, skip_prompt=skip_prompt, **decode_kwargs)
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.request_start = request_start if request_start is not None else time.time()
+        self.cancelled = False
+        self.first_token_time: Optional[float] = None
+        self.last_token_time: Optional[float] = None
+        self.token_count = 0
+        self.ttft_ms = metrics.histogram("generation_ttft_ms", metrics.LATENCY_MS_BUCKETS)
+        self.token_latency_ms = metrics.histogram("generation_token_latency_ms", metrics.LATENCY_MS_BUCKETS)
+
+    def put(self, value):
+        if not (self.skip_prompt and self.next_tokens_are_prompt):
+            # 記錄首個token時間（TTFT）與相鄰token的間隔
+            now = time.time()
+            if self.first_token_time is None:
+                self.first_token_time = now
+                self.ttft_ms.observe((now - self.request_start) * 1000)
+            else:
+                self.token_latency_ms.observe((now - self.last_token_time) * 1000)
+            self.last_token_time = now
+            self.token_count += 1
+        super().put(value)
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (text, stream_end))
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        while True:
+            text, stream_end = await self.queue.get()
+            if text:
+                yield text
+            if stream_end:
+                return
+
+
+class StreamerCancelled(StoppingCriteria):
+    # 給 model.generate 使用：串流被取消時停止生成
+    def __init__(self, streamer: AsyncTextStreamer):
+        self.streamer = streamer
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.streamer.cancelled, dtype=torch.bool, device=input_ids.device)
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"